@@ -0,0 +1,333 @@
+"""
+实现率异常检测
+Vectorized Year-over-year Anomaly Detection over the Fulfillment History
+
+保险公司网页改版时解析器可能产生明显错误的数据（实现率从100跳到5、整个产品的状态变成 no_data），
+单条记录的范围检查发现不了。这里对整个宽表历史做三类检查，结果写入 rate_anomalies：
+- yoy_jump: 同一 (产品, 货币, 购买年份, 类别) 相邻两个报告年度之间的跳变
+- purchase_year_spike: 同一报告年度内某个购买年份与前后两个购买年份同向大幅偏离（孤立尖峰）
+- status_flip: 上一报告年度大部分为 normal 的产品，本年度一个 normal 都没有
+
+前两类用 NumPy 一次性排序后错位比较（不逐组循环），跳变幅度同时要求超过 min_jump 个百分点和
+稳健 z 分数阈值（中位数 / MAD）；status_flip 用窗口函数 LAG 计算。
+
+重构时本次重建的报告年度若有未确认的异常，宽表中该年度恢复为重构前的数据（新数据留在历史表，
+记入 held_report_years），应用和快照都看不到可疑数据；调度器同样暂不发布快照。
+人工核对后用 --accept 确认，下一次重构（cli.py pivot 或调度器下一轮）重新展开该年度并发布。
+
+    python anomaly_detector.py --db insurance_data.db            # 列出未确认的异常
+    python anomaly_detector.py --db insurance_data.db --accept   # 确认全部未确认的异常
+"""
+
+import argparse
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from data_parser import STATUS_CODES
+from db_connections import connect_reader, connect_writer
+from ratio_changes import METRIC_LABELS
+
+
+CHECKS = ('yoy_jump', 'purchase_year_spike', 'status_flip')
+
+_METRICS = list(METRIC_LABELS)
+
+
+class AnomalyDetector:
+    """实现率异常检测（派生表 rate_anomalies）"""
+
+    def __init__(self, db_path: str = 'insurance_data.db', min_jump: float = 30.0,
+                 z_threshold: float = 6.0, min_scale: float = 2.0, min_normal_share: float = 0.2):
+        self.db_path = db_path
+        self.min_jump = min_jump
+        self.z_threshold = z_threshold
+        self.min_scale = min_scale
+        self.min_normal_share = min_normal_share
+
+    def create_table(self, conn: sqlite3.Connection):
+        """创建异常表和带名称的视图"""
+        conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS rate_anomalies (
+                id INTEGER PRIMARY KEY,
+                check_name TEXT NOT NULL CHECK (check_name IN ({', '.join(f"'{c}'" for c in CHECKS)})),
+                data_year INTEGER NOT NULL,
+                company_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                currency_id INTEGER,        -- status_flip 为产品级，以下三列为 NULL
+                purchase_year INTEGER,
+                metric TEXT,
+                value REAL,                 -- 本年度实现率（status_flip: normal 占比）
+                reference REAL,             -- 上一报告年度 / 相邻购买年份均值（status_flip: 上年 normal 占比）
+                score REAL,                 -- 稳健 z 分数
+                accepted INTEGER NOT NULL DEFAULT 0 CHECK (accepted IN (0, 1)),
+                detected_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_anomalies_year ON rate_anomalies(data_year, accepted);
+
+            -- 因未确认的异常暂缓上线的报告年度（宽表中仍为上一次的数据）
+            CREATE TABLE IF NOT EXISTS held_report_years (
+                data_year INTEGER PRIMARY KEY,
+                held_at TEXT NOT NULL
+            );
+
+            DROP VIEW IF EXISTS rate_anomalies_named;
+            CREATE VIEW rate_anomalies_named AS
+            SELECT a.id, a.check_name, a.data_year, c.name AS company, p.name AS product_name,
+                   cu.code AS currency, a.purchase_year, a.metric, a.value, a.reference, a.score, a.accepted
+            FROM rate_anomalies a
+            JOIN dim_product p ON p.id = a.product_id
+            JOIN dim_company c ON c.id = a.company_id
+            LEFT JOIN dim_currency cu ON cu.id = a.currency_id;
+        ''')
+
+    @staticmethod
+    def _load(conn: sqlite3.Connection) -> Dict[str, np.ndarray]:
+        """整个宽表读入 NumPy 数组（NULL 实现率为 NaN）"""
+        rate_columns = ', '.join(f'{m}_rate' for m in _METRICS)
+        rows = conn.execute(f'''
+            SELECT company_id, product_id, currency_id, data_year, purchase_year, {rate_columns}
+            FROM fulfillment_rates
+        ''').fetchall()
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), 5 + len(_METRICS))
+        keys = table[:, :5].astype(np.int64)
+        return {
+            'company': keys[:, 0], 'product': keys[:, 1], 'currency': keys[:, 2],
+            'data_year': keys[:, 3], 'purchase_year': keys[:, 4],
+            'rates': table[:, 5:],
+        }
+
+    def _robust_z(self, values: np.ndarray) -> np.ndarray:
+        """稳健 z 分数：(x - 中位数) / (1.4826 × MAD)，尺度不小于 min_scale"""
+        if values.size == 0:
+            return values
+        median = np.median(values)
+        scale = max(1.4826 * np.median(np.abs(values - median)), self.min_scale)
+        return (values - median) / scale
+
+    def _yoy_jumps(self, data: Dict[str, np.ndarray]) -> List[tuple]:
+        """同一序列相邻两个报告年度之间的跳变"""
+        order = np.lexsort((data['data_year'], data['purchase_year'], data['currency'], data['product']))
+        prev, cur = order[:-1], order[1:]
+        same_series = ((data['product'][prev] == data['product'][cur])
+                       & (data['currency'][prev] == data['currency'][cur])
+                       & (data['purchase_year'][prev] == data['purchase_year'][cur]))
+        found = []
+        for m, metric in enumerate(_METRICS):
+            old, new = data['rates'][prev, m], data['rates'][cur, m]
+            mask = same_series & ~np.isnan(old) & ~np.isnan(new)
+            delta = new[mask] - old[mask]
+            score = self._robust_z(delta)
+            flagged = (np.abs(delta) >= self.min_jump) & (np.abs(score) > self.z_threshold)
+            rows = cur[mask][flagged]
+            found.extend(zip(rows.tolist(), [metric] * len(rows), new[mask][flagged].tolist(),
+                             old[mask][flagged].tolist(), score[flagged].tolist()))
+        return [('yoy_jump', *item) for item in found]
+
+    def _purchase_year_spikes(self, data: Dict[str, np.ndarray]) -> List[tuple]:
+        """同一报告年度曲线上的孤立尖峰：与前后两个购买年份同向偏离"""
+        order = np.lexsort((data['purchase_year'], data['data_year'], data['currency'], data['product']))
+        left, mid, right = order[:-2], order[1:-1], order[2:]
+
+        def same_curve(a, b):
+            return ((data['product'][a] == data['product'][b]) & (data['currency'][a] == data['currency'][b])
+                    & (data['data_year'][a] == data['data_year'][b]))
+
+        same = same_curve(left, mid) & same_curve(mid, right)
+        found = []
+        for m, metric in enumerate(_METRICS):
+            lv, mv, rv = data['rates'][left, m], data['rates'][mid, m], data['rates'][right, m]
+            mask = same & ~np.isnan(lv) & ~np.isnan(mv) & ~np.isnan(rv)
+            expected = (lv[mask] + rv[mask]) / 2
+            residual = mv[mask] - expected
+            score = self._robust_z(residual)
+            to_left, to_right = mv[mask] - lv[mask], mv[mask] - rv[mask]
+            flagged = ((np.abs(to_left) >= self.min_jump) & (np.abs(to_right) >= self.min_jump)
+                       & (np.sign(to_left) == np.sign(to_right)) & (np.abs(score) > self.z_threshold))
+            rows = mid[mask][flagged]
+            found.extend(zip(rows.tolist(), [metric] * len(rows), mv[mask][flagged].tolist(),
+                             expected[flagged].tolist(), score[flagged].tolist()))
+        return [('purchase_year_spike', *item) for item in found]
+
+    def _status_flips(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        """上一报告年度 normal 占比不低于 min_normal_share、本年度没有 normal 的产品"""
+        normal_cells = ' + '.join(f'({m}_status_id IS :normal)' for m in _METRICS)
+        status_cells = ' + '.join(f'({m}_status_id IS NOT NULL)' for m in _METRICS)
+        cursor = conn.execute(f'''
+            WITH per_year AS (
+                SELECT company_id, product_id, data_year,
+                       SUM({normal_cells}) AS normal_cells, SUM({status_cells}) AS cells
+                FROM fulfillment_rates
+                GROUP BY company_id, product_id, data_year
+            ),
+            shares AS (
+                SELECT company_id, product_id, data_year,
+                       1.0 * normal_cells / cells AS share,
+                       LAG(1.0 * normal_cells / cells) OVER (
+                           PARTITION BY product_id ORDER BY data_year) AS previous_share
+                FROM per_year
+                WHERE cells > 0
+            )
+            SELECT company_id, product_id, data_year, share, previous_share
+            FROM shares
+            WHERE previous_share >= :min_share AND share = 0
+        ''', {'normal': STATUS_CODES['normal'], 'min_share': self.min_normal_share})
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, r)) for r in cursor.fetchall()]
+
+    def detect(self, conn: sqlite3.Connection, data_years: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """扫描整个历史，返回 data_years（None 表示全部）报告年度的异常"""
+        years = None if data_years is None else set(data_years)
+        data = self._load(conn)
+        anomalies = []
+        if len(data['rates']):
+            for check_name, row, metric, value, reference, score in (
+                    self._yoy_jumps(data) + self._purchase_year_spikes(data)):
+                if years is not None and int(data['data_year'][row]) not in years:
+                    continue
+                anomalies.append({
+                    'check_name': check_name, 'data_year': int(data['data_year'][row]),
+                    'company_id': int(data['company'][row]), 'product_id': int(data['product'][row]),
+                    'currency_id': int(data['currency'][row]), 'purchase_year': int(data['purchase_year'][row]),
+                    'metric': metric, 'value': value, 'reference': reference, 'score': round(score, 2),
+                })
+        for flip in self._status_flips(conn):
+            if years is not None and flip['data_year'] not in years:
+                continue
+            anomalies.append({
+                'check_name': 'status_flip', 'data_year': flip['data_year'],
+                'company_id': flip['company_id'], 'product_id': flip['product_id'],
+                'currency_id': None, 'purchase_year': None, 'metric': None,
+                'value': flip['share'], 'reference': flip['previous_share'], 'score': None,
+            })
+        return anomalies
+
+    def refresh(self, data_years: Optional[Iterable[int]] = None) -> int:
+        """重新检测 data_years（None 表示全部）报告年度，返回检测到的异常数
+
+        重新检测时，已确认且数值未变的异常保持确认状态。异常表为空时扫描全部报告年度。
+        """
+        conn = connect_writer(self.db_path)
+        self.create_table(conn)
+        if data_years is not None and conn.execute('SELECT 1 FROM rate_anomalies LIMIT 1').fetchone() is None:
+            data_years = None  # 首次生成（或上次没有异常）时扫描全部历史
+        anomalies = self.detect(conn, data_years)
+        scope, params = '', []
+        if data_years is not None:
+            years = sorted(set(data_years))
+            scope, params = f"WHERE data_year IN ({', '.join('?' * len(years))})", years
+
+        def key(item):
+            return (item['check_name'], item['data_year'], item['product_id'], item['currency_id'],
+                    item['purchase_year'], item['metric'], item['value'])
+
+        conn.row_factory = sqlite3.Row
+        accepted = {key(dict(r)) for r in conn.execute(
+            f'SELECT * FROM rate_anomalies {scope} {"AND" if scope else "WHERE"} accepted = 1', params)}
+        detected_at = datetime.now().isoformat(timespec='seconds')
+        with conn:
+            conn.execute(f'DELETE FROM rate_anomalies {scope}', params)
+            conn.executemany('''
+                INSERT INTO rate_anomalies (check_name, data_year, company_id, product_id, currency_id,
+                                            purchase_year, metric, value, reference, score, accepted, detected_at)
+                VALUES (:check_name, :data_year, :company_id, :product_id, :currency_id,
+                        :purchase_year, :metric, :value, :reference, :score, :accepted, :detected_at)
+            ''', [{**a, 'accepted': int(key(a) in accepted), 'detected_at': detected_at} for a in anomalies])
+        conn.close()
+        return len(anomalies)
+
+
+def pending_anomalies(conn: sqlite3.Connection) -> Dict[str, int]:
+    """未确认的异常按检查类型计数（异常表不存在时为空）"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rate_anomalies'").fetchone() is None:
+        return {}
+    return dict(conn.execute(
+        'SELECT check_name, COUNT(*) FROM rate_anomalies WHERE accepted = 0 GROUP BY check_name'
+    ).fetchall())
+
+
+def pending_years(conn: sqlite3.Connection, data_years: Optional[Iterable[int]] = None) -> List[int]:
+    """有未确认异常的报告年度（data_years 限定范围）"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rate_anomalies'").fetchone() is None:
+        return []
+    years = [row[0] for row in conn.execute(
+        'SELECT DISTINCT data_year FROM rate_anomalies WHERE accepted = 0 ORDER BY data_year')]
+    if data_years is not None:
+        wanted = set(data_years)
+        years = [year for year in years if year in wanted]
+    return years
+
+
+def held_years(conn: sqlite3.Connection) -> List[int]:
+    """暂缓上线的报告年度"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'held_report_years'").fetchone() is None:
+        return []
+    return [row[0] for row in conn.execute('SELECT data_year FROM held_report_years ORDER BY data_year')]
+
+
+def releasable_years(conn: sqlite3.Connection) -> List[int]:
+    """异常已全部确认、下一次重构可以上线的暂缓年度"""
+    pending = set(pending_years(conn))
+    return [year for year in held_years(conn) if year not in pending]
+
+
+def accept_anomalies(conn: sqlite3.Connection, data_year: Optional[int] = None) -> int:
+    """确认未确认的异常（人工核对后），返回确认条数"""
+    sql = 'UPDATE rate_anomalies SET accepted = 1 WHERE accepted = 0'
+    params = []
+    if data_year is not None:
+        sql += ' AND data_year = ?'
+        params.append(data_year)
+    with conn:
+        return conn.execute(sql, params).rowcount
+
+
+def main(argv=None) -> int:
+    """主函数"""
+    arg_parser = argparse.ArgumentParser(description='实现率异常检测')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--rescan', action='store_true', help='重新扫描全部历史')
+    arg_parser.add_argument('--accept', action='store_true', help='确认全部未确认的异常（下一次重构时上线并发布）')
+    arg_parser.add_argument('--year', type=int, help='--accept 时只确认该报告年度')
+    arg_parser.add_argument('--limit', type=int, default=30, help='列出的异常条数')
+    args = arg_parser.parse_args(argv)
+
+    if args.rescan:
+        count = AnomalyDetector(args.db).refresh()
+        print(f"✓ 扫描完成: {count} 条异常")
+    if args.accept:
+        conn = connect_writer(args.db)
+        print(f"✓ 已确认 {accept_anomalies(conn, args.year)} 条异常")
+        releasable = releasable_years(conn)
+        conn.close()
+        if releasable:
+            print(f"  暂缓的报告年度 {', '.join(map(str, releasable))} 将在下一次重构时上线"
+                  f"（cli.py pivot，或调度器下一轮）")
+        return 0
+
+    conn = connect_reader(args.db)
+    try:
+        pending = pending_anomalies(conn)
+        if not pending:
+            print("✅ 没有未确认的异常")
+            return 0
+        print(f"⚠️  未确认的异常: {', '.join(f'{name} {count}' for name, count in pending.items())}")
+        for row in conn.execute('''
+            SELECT check_name, data_year, company, product_name, currency, purchase_year, metric,
+                   value, reference, score
+            FROM rate_anomalies_named WHERE accepted = 0
+            ORDER BY data_year DESC, ABS(score) DESC LIMIT ?
+        ''', (args.limit,)):
+            check_name, year, company, product, currency, purchase_year, metric, value, reference, score = row
+            where = f"{currency} {purchase_year} {METRIC_LABELS.get(metric, '')}" if metric else '全部类别'
+            print(f"  [{check_name}] {year} {company} {product} {where}: "
+                  f"{reference:g} -> {value:g}" + (f" (z={score:g})" if score is not None else ''))
+    finally:
+        conn.close()
+    return 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
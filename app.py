@@ -5,10 +5,21 @@ Insurance Dividend Fulfillment Ratio Visualization Platform
 
 import streamlit as st
 import pandas as pd
-import sqlite3
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 import os
+import time
+from app_telemetry import AppTelemetry, start_metrics_server
+from figure_cache import FigureCache, database_version, figure_key
+from pagination import PAGE_COLUMNS, fetch_page
+from product_search import ProductSearchIndex
+from query_engine import create_engine
+from rankings import RANKING_METRICS, leaderboard, ranking_currencies
+from rate_curves import MISSING_RATE, fetch_curves
+from ratio_changes import CHANGE_TYPES, METRIC_LABELS, latest_changes
+from rollups import headline_metrics
+from snapshots import current_snapshot
 
 # 页面配置
 st.set_page_config(
@@ -18,6 +29,20 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+DB_PATH = os.path.join(os.path.dirname(__file__), 'insurance_data.db')
+
+# 调度器发布快照的目录（scheduler.py --snapshot-dir），设置后应用读取最新快照
+SNAPSHOT_DIR = os.environ.get('INSURANCE_SNAPSHOT_DIR')
+
+# 未输入搜索关键字时，产品下拉框最多显示的产品数
+PRODUCT_OPTION_LIMIT = 50
+
+# 明细表分页模式的每页行数选项
+PAGE_SIZES = [50, 100, 200, 500]
+
+# 趋势图和对比图使用的红利类别
+CHART_METRICS = ['reversionary_bonus', 'special_bonus', 'annual_bonus', 'terminal_bonus']
+
 # 样式
 st.markdown("""
 <style>
@@ -45,18 +70,410 @@ st.markdown("""
 
 
 @st.cache_resource
+def get_telemetry():
+    """进程内共享的性能监控实例（设置 APP_METRICS_PORT 时同时启动本地指标端点）"""
+    telemetry = AppTelemetry()
+    port = os.environ.get('APP_METRICS_PORT')
+    if port:
+        start_metrics_server(telemetry, int(port))
+    return telemetry
+
+
+def _elapsed_ms(start):
+    """距 start 的毫秒数"""
+    return (time.perf_counter() - start) * 1000
+
+
+def is_admin():
+    """URL 参数 admin 与环境变量 APP_ADMIN_TOKEN 一致时显示管理员面板"""
+    token = os.environ.get('APP_ADMIN_TOKEN')
+    return bool(token) and st.query_params.get('admin') == token
+
+
+def current_db_path():
+    """当前数据库路径：设置 INSURANCE_SNAPSHOT_DIR 时为最新发布的快照，新快照发布后下一次请求即切换"""
+    if SNAPSHOT_DIR:
+        return current_snapshot(SNAPSHOT_DIR) or DB_PATH
+    return DB_PATH
+
+
+def _is_snapshot(db_path):
+    """发布的快照不再修改，可用 immutable=1 打开"""
+    return db_path != DB_PATH
+
+
+# 按数据库路径缓存，只保留当前和上一个快照的资源
+@st.cache_resource(max_entries=2)
+def _engine_for(db_path):
+    return create_engine(db_path=db_path, immutable=_is_snapshot(db_path))
+
+
+def get_engine():
+    """跨会话共享的查询引擎（由环境变量 INSURANCE_QUERY_ENGINE 选择后端）"""
+    return _engine_for(current_db_path())
+
+
+@st.cache_resource(max_entries=2)
+def _load_data(db_path):
+    get_telemetry().mark_miss('load_data')
+    query = "SELECT * FROM product_fulfillment_rates"
+    return _engine_for(db_path).query_df(query)
+
+
 def load_data():
     """加载数据"""
-    db_path = os.path.join(os.path.dirname(__file__), 'insurance_data.db')
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    query = "SELECT * FROM product_fulfillment_rates"
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+    return _load_data(current_db_path())
+
+
+def table_exists(name):
+    """数据库中是否存在某表（旧数据库可能尚未生成派生表）"""
+    return get_engine().table_exists(name)
+
+
+@st.cache_resource(max_entries=2)
+def _search_index_for(db_path):
+    index = ProductSearchIndex(db_path, read_only=True, immutable=_is_snapshot(db_path))
+    if index.exists():
+        return index
+    index.close()
+    df = _load_data(db_path)
+    pairs = df[['company', 'product_name']].drop_duplicates().itertuples(index=False, name=None)
+    return ProductSearchIndex.from_names(pairs)
+
+
+def get_search_index():
+    """产品搜索索引；数据库中尚未建立索引时用已加载的数据构建内存索引"""
+    return _search_index_for(current_db_path())
+
+
+def compute_headline(df_filtered, filters):
+    """首页指标：优先由预聚合表计算，旧数据库回退到对筛选后数据的全量计算"""
+    if table_exists('metric_rollups'):
+        get_telemetry().record_cache('metric_rollups', hit=True)
+        return headline_metrics(get_engine(), **filters)
+    get_telemetry().record_cache('metric_rollups', hit=False)
+    return {
+        'product_count': df_filtered['product_name'].nunique(),
+        'avg_reversionary': df_filtered['reversionary_bonus_rate'].dropna().mean(),
+        'avg_special': df_filtered['special_bonus_rate'].dropna().mean(),
+        'record_count': len(df_filtered),
+    }
+
+
+def product_options(df_filtered, selected_company, query):
+    """产品下拉选项：有搜索关键字时返回排序后的匹配结果，否则只返回前若干个产品"""
+    if query:
+        company = None if selected_company == '全部' else selected_company
+        matches = get_search_index().search(query, company=company, limit=PRODUCT_OPTION_LIMIT)
+        available = set(df_filtered['product_name'].unique())
+        names = [m['product_name'] for m in matches if m['product_name'] in available]
+        return list(dict.fromkeys(names))
+    return sorted(df_filtered['product_name'].unique().tolist())[:PRODUCT_OPTION_LIMIT]
+
+
+def _move_page(step, cursor=None):
+    """翻页按钮回调：前进时压入下一页游标，后退时弹出"""
+    cursors = st.session_state['tab2_cursors']
+    if step > 0:
+        cursors.append(cursor)
+    elif len(cursors) > 1:
+        cursors.pop()
+
+
+def render_paged_table(filters, total_rows, telemetry):
+    """分页明细表：keyset 分页只读取当前页，总行数来自预聚合表"""
+    start = time.perf_counter()
+    page_size = st.selectbox('每页行数', PAGE_SIZES, key='tab2_page_size')
+    
+    # 筛选条件或每页行数变化时回到第一页
+    state_key = repr((sorted(filters.items(), key=lambda item: item[0]), page_size))
+    if st.session_state.get('tab2_state_key') != state_key:
+        st.session_state['tab2_state_key'] = state_key
+        st.session_state['tab2_cursors'] = [None]
+    cursors = st.session_state['tab2_cursors']
+    
+    records, next_cursor = fetch_page(get_engine(), filters, cursors[-1], page_size)
+    page_df = pd.DataFrame(records, columns=[name for name, _ in PAGE_COLUMNS])
+    page_df.columns = [
+        '保险公司', '产品名称', '货币', '购买年份', '报告年度',
+        '归原红利(%)', '特别红利(%)', '周年红利(%)', '终期红利(%)', '总现金价值(%)'
+    ]
+    telemetry.observe('tab2.fetch_page', _elapsed_ms(start), rows=len(page_df))
+    
+    start = time.perf_counter()
+    st.dataframe(page_df, use_container_width=True, hide_index=True)
+    
+    total_pages = max(1, -(-total_rows // page_size))
+    col_prev, col_info, col_next = st.columns([1, 3, 1])
+    with col_prev:
+        st.button('⬅️ 上一页', disabled=len(cursors) == 1, on_click=_move_page, args=(-1,))
+    with col_info:
+        st.caption(f"第 {len(cursors)} / {total_pages} 页，共 {total_rows} 条记录")
+    with col_next:
+        st.button('下一页 ➡️', disabled=next_cursor is None, on_click=_move_page, args=(1, next_cursor))
+    telemetry.observe('tab2.render_page', _elapsed_ms(start), rows=len(page_df))
+
+
+@st.cache_resource
+def get_figure_cache():
+    """跨会话共享的图表缓存（APP_FIGURE_CACHE_MB 设置大小上限，默认64MB）"""
+    return FigureCache(max_bytes=int(os.environ.get('APP_FIGURE_CACHE_MB', 64)) * 1024 * 1024)
+
+
+def cached_figure(kind, filters, build):
+    """按 (数据库版本, 筛选条件, 图表类型) 取缓存的图表，未命中时调用 build() 构建并缓存"""
+    cache = get_figure_cache()
+    key = figure_key(database_version(current_db_path()), filters, kind)
+    figure_json = cache.get(key)
+    get_telemetry().record_cache('figures', hit=figure_json is not None)
+    if figure_json is None:
+        fig = build()
+        if fig is None:
+            return None
+        cache.put(key, fig.to_json())
+        return fig
+    return pio.from_json(figure_json)
+
+
+def load_chart_data(df_filtered, filters):
+    """图表数据：从打包曲线表按主键点查各公司最新报告年度的曲线，解码为 产品 × 购买年份 的行；
+    旧数据库尚未生成 rate_curves 时回退到已加载的筛选后数据"""
+    if not table_exists('rate_curves'):
+        get_telemetry().record_cache('rate_curves', hit=False)
+        return df_filtered
+    get_telemetry().record_cache('rate_curves', hit=True)
+    product_names = df_filtered['product_name'].unique().tolist()
+    rows = {}
+    for currency in df_filtered['currency'].unique():
+        curves = fetch_curves(get_engine(), product_names, currency,
+                              company=filters['company'], metrics=CHART_METRICS)
+        for (company, product_name, metric), curve in curves.items():
+            present = curve['rates'] != MISSING_RATE
+            for year, rate in zip(curve['years'][present].tolist(), curve['rates'][present].tolist()):
+                row = rows.setdefault((company, product_name, currency, year), {})
+                row[f'{metric}_rate'] = float(rate)
+    chart_data = pd.DataFrame(
+        [{'company': company, 'product_name': product_name, 'currency': currency, 'purchase_year': year, **rates}
+         for (company, product_name, currency, year), rates in rows.items()],
+        columns=['company', 'product_name', 'currency', 'purchase_year', *(f'{m}_rate' for m in CHART_METRICS)],
+    )
+    if filters['purchase_years']:
+        chart_data = chart_data[chart_data['purchase_year'].isin(filters['purchase_years'])]
+    return chart_data.sort_values(['product_name', 'currency', 'purchase_year'])
+
+
+def build_trend_figure(chart_data, selected_product):
+    """单产品趋势图：按购买年份展示各类红利实现率"""
+    # 单产品展示：按购买年份展示归原红利和特别红利
+    fig = go.Figure()
+    
+    # 归原红利
+    if chart_data['reversionary_bonus_rate'].notna().any():
+        fig.add_trace(go.Scatter(
+            x=chart_data['purchase_year'],
+            y=chart_data['reversionary_bonus_rate'],
+            mode='lines+markers',
+            name='归原红利',
+            line=dict(color='#1f77b4', width=3),
+            marker=dict(size=10)
+        ))
+    
+    # 特别红利
+    if chart_data['special_bonus_rate'].notna().any():
+        fig.add_trace(go.Scatter(
+            x=chart_data['purchase_year'],
+            y=chart_data['special_bonus_rate'],
+            mode='lines+markers',
+            name='特别红利',
+            line=dict(color='#ff7f0e', width=3),
+            marker=dict(size=10)
+        ))
+    
+    # 周年红利
+    if chart_data['annual_bonus_rate'].notna().any():
+        fig.add_trace(go.Scatter(
+            x=chart_data['purchase_year'],
+            y=chart_data['annual_bonus_rate'],
+            mode='lines+markers',
+            name='周年红利',
+            line=dict(color='#2ca02c', width=3),
+            marker=dict(size=10)
+        ))
+    
+    # 终期红利
+    if chart_data['terminal_bonus_rate'].notna().any():
+        fig.add_trace(go.Scatter(
+            x=chart_data['purchase_year'],
+            y=chart_data['terminal_bonus_rate'],
+            mode='lines+markers',
+            name='终期红利',
+            line=dict(color='#d62728', width=3),
+            marker=dict(size=10)
+        ))
+    
+    # 100%基准线
+    fig.add_hline(y=100, line_dash="dash", line_color="gray", 
+                 annotation_text="100%基准", annotation_position="right")
+    
+    fig.update_layout(
+        title=f"{selected_product} - 分红实现率趋势",
+        xaxis_title="购买年份",
+        yaxis_title="实现率 (%)",
+        hovermode='x unified',
+        height=500
+    )
+    
+    return fig
+
+
+def build_product_bar_figure(chart_data):
+    """多产品柱状图：按产品对比平均实现率"""
+    # 多产品展示：按产品对比平均实现率
+    product_stats = []
+    
+    for product in chart_data['product_name'].unique():
+        product_data = chart_data[chart_data['product_name'] == product]
+    
+        avg_rev = product_data['reversionary_bonus_rate'].dropna().mean()
+        avg_spe = product_data['special_bonus_rate'].dropna().mean()
+        avg_ann = product_data['annual_bonus_rate'].dropna().mean()
+    
+        product_stats.append({
+            '产品名称': product,
+            '归原红利': avg_rev if pd.notna(avg_rev) else None,
+            '特别红利': avg_spe if pd.notna(avg_spe) else None,
+            '周年红利': avg_ann if pd.notna(avg_ann) else None
+        })
+    
+    stats_df = pd.DataFrame(product_stats)
+    
+    # 柱状图
+    fig = go.Figure()
+    
+    if '归原红利' in stats_df.columns and stats_df['归原红利'].notna().any():
+        fig.add_trace(go.Bar(
+            name='归原红利',
+            x=stats_df['产品名称'],
+            y=stats_df['归原红利'],
+            marker_color='#1f77b4'
+        ))
+    
+    if '特别红利' in stats_df.columns and stats_df['特别红利'].notna().any():
+        fig.add_trace(go.Bar(
+            name='特别红利',
+            x=stats_df['产品名称'],
+            y=stats_df['特别红利'],
+            marker_color='#ff7f0e'
+        ))
+    
+    if '周年红利' in stats_df.columns and stats_df['周年红利'].notna().any():
+        fig.add_trace(go.Bar(
+            name='周年红利',
+            x=stats_df['产品名称'],
+            y=stats_df['周年红利'],
+            marker_color='#2ca02c'
+        ))
+    
+    fig.update_layout(
+        title="各产品平均分红实现率对比",
+        xaxis_title="产品名称",
+        yaxis_title="平均实现率 (%)",
+        barmode='group',
+        height=500
+    )
+    
+    return fig
+
+
+def build_radar_figure(product_data, selected_product):
+    """雷达图：对比不同购买年份的表现；没有可对比的类别时返回 None"""
+    # 准备雷达图数据
+    categories = []
+    
+    for _, row in product_data.iterrows():
+        year = row['purchase_year']
+        if pd.notna(year):
+            if pd.notna(row['reversionary_bonus_rate']):
+                if '归原红利' not in categories:
+                    categories.append('归原红利')
+    
+            if pd.notna(row['special_bonus_rate']):
+                if '特别红利' not in categories:
+                    categories.append('特别红利')
+    
+            if pd.notna(row['annual_bonus_rate']):
+                if '周年红利' not in categories:
+                    categories.append('周年红利')
+    
+            if pd.notna(row['terminal_bonus_rate']):
+                if '终期红利' not in categories:
+                    categories.append('终期红利')
+    
+    # 创建雷达图
+    if not categories:
+        return None
+    
+    fig = go.Figure()
+    
+    for _, row in product_data.head(5).iterrows():  # 最多显示5个年份
+        year = row['purchase_year']
+        if pd.notna(year):
+            values = []
+            for cat in categories:
+                if cat == '归原红利':
+                    values.append(row['reversionary_bonus_rate'] if pd.notna(row['reversionary_bonus_rate']) else 0)
+                elif cat == '特别红利':
+                    values.append(row['special_bonus_rate'] if pd.notna(row['special_bonus_rate']) else 0)
+                elif cat == '周年红利':
+                    values.append(row['annual_bonus_rate'] if pd.notna(row['annual_bonus_rate']) else 0)
+                elif cat == '终期红利':
+                    values.append(row['terminal_bonus_rate'] if pd.notna(row['terminal_bonus_rate']) else 0)
+    
+            fig.add_trace(go.Scatterpolar(
+                r=values,
+                theta=categories,
+                fill='toself',
+                name=f"{int(year)}年购买"
+            ))
+    
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 120]
+            )
+        ),
+        showlegend=True,
+        title=f"{selected_product} - 不同购买年份对比",
+        height=500
+    )
+    
+    return fig
 
 
 def main():
     """主应用"""
+    telemetry = get_telemetry()
+    
+    with telemetry.timer('rerun'):
+        render_page(telemetry)
+    
+    if is_admin():
+        render_admin_panel(telemetry)
+
+
+def render_admin_panel(telemetry):
+    """管理员性能面板：各区块延迟分布与缓存命中率"""
+    with st.sidebar.expander("⚙️ 性能监控", expanded=False):
+        st.caption(f"统计自 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(telemetry.started_at))}"
+                   f"，查询引擎: {get_engine().name}")
+        st.dataframe(pd.DataFrame(telemetry.snapshot()), use_container_width=True, hide_index=True)
+        st.dataframe(pd.DataFrame(telemetry.cache_snapshot()), use_container_width=True, hide_index=True)
+        st.json(get_figure_cache().stats())
+
+
+def render_page(telemetry):
+    """渲染页面，并记录各区块耗时"""
     
     # 标题
     st.markdown('<div class="main-header">📊 香港保险分红实现率查询平台</div>', unsafe_allow_html=True)
@@ -64,9 +481,13 @@ def main():
     
     # 加载数据
     with st.spinner('加载数据中...'):
-        df = load_data()
+        start = time.perf_counter()
+        with telemetry.cache_probe('load_data'):
+            df = load_data()
+        telemetry.observe('load_data', _elapsed_ms(start), rows=len(df))
     
     # 侧边栏筛选
+    start = time.perf_counter()
     st.sidebar.header("🔍 筛选条件")
     
     # 公司筛选
@@ -79,8 +500,15 @@ def main():
     else:
         df_filtered = df.copy()
     
-    # 产品筛选
-    products = ['全部'] + sorted(df_filtered['product_name'].unique().tolist())
+    # 产品筛选：边输入边搜索，只下发匹配的产品
+    query = st.sidebar.text_input('搜索产品', placeholder='输入产品名称关键字（支持繁简体）')
+    start_search = time.perf_counter()
+    products = ['全部'] + product_options(df_filtered, selected_company, query)
+    telemetry.observe('product_search', _elapsed_ms(start_search), rows=len(products) - 1)
+    if query and len(products) == 1:
+        st.sidebar.caption("未找到匹配的产品")
+    elif not query and df_filtered['product_name'].nunique() > PRODUCT_OPTION_LIMIT:
+        st.sidebar.caption(f"仅显示前 {PRODUCT_OPTION_LIMIT} 个产品，请输入关键字搜索")
     selected_product = st.sidebar.selectbox('产品名称', products)
     
     # 根据产品筛选
@@ -96,6 +524,7 @@ def main():
         df_filtered = df_filtered[df_filtered['currency'] == selected_currency]
     
     # 购买年份筛选
+    selected_years = []
     if 'purchase_year' in df_filtered.columns:
         purchase_years = sorted([y for y in df_filtered['purchase_year'].unique() if pd.notna(y)], reverse=True)
         if purchase_years:
@@ -108,31 +537,44 @@ def main():
             if selected_years:
                 df_filtered = df_filtered[df_filtered['purchase_year'].isin(selected_years)]
     
+    telemetry.observe('filters', _elapsed_ms(start), rows=len(df_filtered))
+    
     # 关键指标
+    start = time.perf_counter()
     st.markdown("---")
     col1, col2, col3, col4 = st.columns(4)
     
+    filters = {
+        'company': None if selected_company == '全部' else selected_company,
+        'product_name': None if selected_product == '全部' else selected_product,
+        'currency': None if selected_currency == '全部' else selected_currency,
+        'purchase_years': selected_years,
+    }
+    headline = compute_headline(df_filtered, filters)
+    
     with col1:
-        st.metric("📦 产品数量", f"{df_filtered['product_name'].nunique()}")
+        st.metric("📦 产品数量", f"{headline['product_count']}")
     
     with col2:
-        # 计算平均归原红利实现率
-        avg_rev = df_filtered['reversionary_bonus_rate'].dropna().mean()
+        # 平均归原红利实现率
+        avg_rev = headline['avg_reversionary']
         if pd.notna(avg_rev):
             st.metric("📈 平均归原红利实现率", f"{avg_rev:.1f}%")
         else:
             st.metric("📈 平均归原红利实现率", "N/A")
     
     with col3:
-        # 计算平均特别红利实现率
-        avg_spe = df_filtered['special_bonus_rate'].dropna().mean()
+        # 平均特别红利实现率
+        avg_spe = headline['avg_special']
         if pd.notna(avg_spe):
             st.metric("🎯 平均特别红利实现率", f"{avg_spe:.1f}%")
         else:
             st.metric("🎯 平均特别红利实现率", "N/A")
     
     with col4:
-        st.metric("📊 数据记录", f"{len(df_filtered)}")
+        st.metric("📊 数据记录", f"{headline['record_count']}")
+    
+    telemetry.observe('metrics', _elapsed_ms(start), rows=len(df_filtered))
     
     st.markdown("---")
     
@@ -142,169 +584,92 @@ def main():
         return
     
     # 标签页
-    tab1, tab2, tab3 = st.tabs(["📈 趋势图表", "📋 详细数据", "📊 对比分析"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📈 趋势图表", "📋 详细数据", "📊 对比分析", "🏆 排行榜", "🔔 最新变动"])
     
     with tab1:
+        start = time.perf_counter()
         st.subheader("分红实现率趋势")
         
-        # 准备图表数据
-        chart_data = df_filtered.copy()
-        
-        if selected_product != '全部' and len(chart_data) > 0:
-            # 单产品展示：按购买年份展示归原红利和特别红利
-            fig = go.Figure()
-            
-            # 归原红利
-            if chart_data['reversionary_bonus_rate'].notna().any():
-                fig.add_trace(go.Scatter(
-                    x=chart_data['purchase_year'],
-                    y=chart_data['reversionary_bonus_rate'],
-                    mode='lines+markers',
-                    name='归原红利',
-                    line=dict(color='#1f77b4', width=3),
-                    marker=dict(size=10)
-                ))
-            
-            # 特别红利
-            if chart_data['special_bonus_rate'].notna().any():
-                fig.add_trace(go.Scatter(
-                    x=chart_data['purchase_year'],
-                    y=chart_data['special_bonus_rate'],
-                    mode='lines+markers',
-                    name='特别红利',
-                    line=dict(color='#ff7f0e', width=3),
-                    marker=dict(size=10)
-                ))
-            
-            # 周年红利
-            if chart_data['annual_bonus_rate'].notna().any():
-                fig.add_trace(go.Scatter(
-                    x=chart_data['purchase_year'],
-                    y=chart_data['annual_bonus_rate'],
-                    mode='lines+markers',
-                    name='周年红利',
-                    line=dict(color='#2ca02c', width=3),
-                    marker=dict(size=10)
-                ))
-            
-            # 终期红利
-            if chart_data['terminal_bonus_rate'].notna().any():
-                fig.add_trace(go.Scatter(
-                    x=chart_data['purchase_year'],
-                    y=chart_data['terminal_bonus_rate'],
-                    mode='lines+markers',
-                    name='终期红利',
-                    line=dict(color='#d62728', width=3),
-                    marker=dict(size=10)
-                ))
-            
-            # 100%基准线
-            fig.add_hline(y=100, line_dash="dash", line_color="gray", 
-                         annotation_text="100%基准", annotation_position="right")
-            
-            fig.update_layout(
-                title=f"{selected_product} - 分红实现率趋势",
-                xaxis_title="购买年份",
-                yaxis_title="实现率 (%)",
-                hovermode='x unified',
-                height=500
-            )
+        # 准备图表数据：只在图表缓存未命中时读取曲线
+        if selected_product != '全部':
+            # 单产品展示：按购买年份展示各类红利
+            fig = cached_figure('trend', filters, lambda: build_trend_figure(
+                load_chart_data(df_filtered, filters), selected_product))
             
+            telemetry.observe('tab1.build_figure', _elapsed_ms(start), rows=len(df_filtered))
+            start = time.perf_counter()
             st.plotly_chart(fig, use_container_width=True)
+            telemetry.observe('tab1.render', _elapsed_ms(start))
         
         else:
             # 多产品展示：按产品对比平均实现率
-            product_stats = []
-            
-            for product in chart_data['product_name'].unique():
-                product_data = chart_data[chart_data['product_name'] == product]
-                
-                avg_rev = product_data['reversionary_bonus_rate'].dropna().mean()
-                avg_spe = product_data['special_bonus_rate'].dropna().mean()
-                avg_ann = product_data['annual_bonus_rate'].dropna().mean()
-                
-                product_stats.append({
-                    '产品名称': product,
-                    '归原红利': avg_rev if pd.notna(avg_rev) else None,
-                    '特别红利': avg_spe if pd.notna(avg_spe) else None,
-                    '周年红利': avg_ann if pd.notna(avg_ann) else None
-                })
-            
-            stats_df = pd.DataFrame(product_stats)
-            
-            # 柱状图
-            fig = go.Figure()
-            
-            if '归原红利' in stats_df.columns and stats_df['归原红利'].notna().any():
-                fig.add_trace(go.Bar(
-                    name='归原红利',
-                    x=stats_df['产品名称'],
-                    y=stats_df['归原红利'],
-                    marker_color='#1f77b4'
-                ))
-            
-            if '特别红利' in stats_df.columns and stats_df['特别红利'].notna().any():
-                fig.add_trace(go.Bar(
-                    name='特别红利',
-                    x=stats_df['产品名称'],
-                    y=stats_df['特别红利'],
-                    marker_color='#ff7f0e'
-                ))
-            
-            if '周年红利' in stats_df.columns and stats_df['周年红利'].notna().any():
-                fig.add_trace(go.Bar(
-                    name='周年红利',
-                    x=stats_df['产品名称'],
-                    y=stats_df['周年红利'],
-                    marker_color='#2ca02c'
-                ))
-            
-            fig.update_layout(
-                title="各产品平均分红实现率对比",
-                xaxis_title="产品名称",
-                yaxis_title="平均实现率 (%)",
-                barmode='group',
-                height=500
-            )
+            fig = cached_figure('product_bar', filters, lambda: build_product_bar_figure(
+                load_chart_data(df_filtered, filters)))
             
+            telemetry.observe('tab1.build_figure', _elapsed_ms(start), rows=len(df_filtered))
+            start = time.perf_counter()
             st.plotly_chart(fig, use_container_width=True)
+            telemetry.observe('tab1.render', _elapsed_ms(start))
     
     with tab2:
+        start = time.perf_counter()
         st.subheader("详细数据表")
         
-        # 准备展示数据
-        display_df = df_filtered[[
-            'company', 'product_name', 'currency', 'purchase_year',
-            'reversionary_bonus_rate', 'special_bonus_rate', 
-            'annual_bonus_rate', 'terminal_bonus_rate', 'total_cash_value_rate'
-        ]].copy()
-        
-        # 重命名列
-        display_df.columns = [
-            '保险公司', '产品名称', '货币', '购买年份',
-            '归原红利(%)', '特别红利(%)', '周年红利(%)', '终期红利(%)', '总现金价值(%)'
-        ]
+        # 分页模式：只读取当前页（需要规范化表和预聚合表）
+        paged = table_exists('fulfillment_rates') and table_exists('metric_rollups') \
+            and st.toggle('分页显示', value=True, help='只读取当前页，数据量大时首屏更快')
+        if paged:
+            render_paged_table(filters, headline['record_count'], telemetry)
+            start = time.perf_counter()
         
-        # 排序
-        display_df = display_df.sort_values(['保险公司', '产品名称', '购买年份'], ascending=[True, True, False])
+        # 准备展示数据（完整表格和CSV下载）；分页模式下点击后才生成
+        export_key = repr(sorted(filters.items(), key=lambda item: item[0]))
+        export_ready = not paged or st.session_state.get('tab2_export_key') == export_key
+        if not export_ready and st.button("📥 准备下载数据(CSV)", help='生成当前筛选结果的完整CSV'):
+            st.session_state['tab2_export_key'] = export_key
+            export_ready = True
         
-        # 显示数据
-        st.dataframe(
-            display_df,
-            use_container_width=True,
-            height=500
-        )
-        
-        # 下载按钮
-        csv = display_df.to_csv(index=False, encoding='utf-8-sig')
-        st.download_button(
-            label="📥 下载数据(CSV)",
-            data=csv,
-            file_name=f"dividend_fulfillment_rates_{selected_company}_{selected_product}.csv",
-            mime="text/csv"
-        )
+        if export_ready:
+            display_df = df_filtered[[
+                'company', 'product_name', 'currency', 'purchase_year',
+                'reversionary_bonus_rate', 'special_bonus_rate', 
+                'annual_bonus_rate', 'terminal_bonus_rate', 'total_cash_value_rate'
+            ]].copy()
+            
+            # 重命名列
+            display_df.columns = [
+                '保险公司', '产品名称', '货币', '购买年份',
+                '归原红利(%)', '特别红利(%)', '周年红利(%)', '终期红利(%)', '总现金价值(%)'
+            ]
+            
+            # 排序
+            display_df = display_df.sort_values(['保险公司', '产品名称', '购买年份'], ascending=[True, True, False])
+            
+            telemetry.observe('tab2.prepare', _elapsed_ms(start), rows=len(display_df))
+            
+            # 显示数据
+            if not paged:
+                start = time.perf_counter()
+                st.dataframe(
+                    display_df,
+                    use_container_width=True,
+                    height=500
+                )
+                telemetry.observe('tab2.render_table', _elapsed_ms(start), rows=len(display_df))
+            
+            # 下载按钮
+            start = time.perf_counter()
+            csv = display_df.to_csv(index=False, encoding='utf-8-sig')
+            st.download_button(
+                label="📥 下载数据(CSV)",
+                data=csv,
+                file_name=f"dividend_fulfillment_rates_{selected_company}_{selected_product}.csv",
+                mime="text/csv"
+            )
+            telemetry.observe('tab2.download', _elapsed_ms(start), rows=len(display_df))
     
     with tab3:
+        start = time.perf_counter()
         st.subheader("产品对比分析")
         
         if selected_product == '全部':
@@ -314,75 +679,84 @@ def main():
             product_data = df_filtered[df_filtered['product_name'] == selected_product]
             
             if len(product_data) > 0:
-                # 准备雷达图数据
-                categories = []
-                values_dict = {}
-                
-                for _, row in product_data.iterrows():
-                    year = row['purchase_year']
-                    if pd.notna(year):
-                        year_label = f"{int(year)}年"
-                        values = []
-                        
-                        if pd.notna(row['reversionary_bonus_rate']):
-                            if '归原红利' not in categories:
-                                categories.append('归原红利')
-                        
-                        if pd.notna(row['special_bonus_rate']):
-                            if '特别红利' not in categories:
-                                categories.append('特别红利')
-                        
-                        if pd.notna(row['annual_bonus_rate']):
-                            if '周年红利' not in categories:
-                                categories.append('周年红利')
-                        
-                        if pd.notna(row['terminal_bonus_rate']):
-                            if '终期红利' not in categories:
-                                categories.append('终期红利')
+                fig = cached_figure('radar', filters, lambda: build_radar_figure(product_data, selected_product))
                 
-                # 创建雷达图
-                if categories:
-                    fig = go.Figure()
-                    
-                    for _, row in product_data.head(5).iterrows():  # 最多显示5个年份
-                        year = row['purchase_year']
-                        if pd.notna(year):
-                            values = []
-                            for cat in categories:
-                                if cat == '归原红利':
-                                    values.append(row['reversionary_bonus_rate'] if pd.notna(row['reversionary_bonus_rate']) else 0)
-                                elif cat == '特别红利':
-                                    values.append(row['special_bonus_rate'] if pd.notna(row['special_bonus_rate']) else 0)
-                                elif cat == '周年红利':
-                                    values.append(row['annual_bonus_rate'] if pd.notna(row['annual_bonus_rate']) else 0)
-                                elif cat == '终期红利':
-                                    values.append(row['terminal_bonus_rate'] if pd.notna(row['terminal_bonus_rate']) else 0)
-                            
-                            fig.add_trace(go.Scatterpolar(
-                                r=values,
-                                theta=categories,
-                                fill='toself',
-                                name=f"{int(year)}年购买"
-                            ))
-                    
-                    fig.update_layout(
-                        polar=dict(
-                            radialaxis=dict(
-                                visible=True,
-                                range=[0, 120]
-                            )
-                        ),
-                        showlegend=True,
-                        title=f"{selected_product} - 不同购买年份对比",
-                        height=500
-                    )
-                    
+                if fig is not None:
+                    telemetry.observe('tab3.build_figure', _elapsed_ms(start), rows=len(product_data))
+                    start = time.perf_counter()
                     st.plotly_chart(fig, use_container_width=True)
+                    telemetry.observe('tab3.render', _elapsed_ms(start))
                 else:
                     st.warning("该产品暂无可对比的数据")
             else:
                 st.warning("暂无数据")
     
+    with tab4:
+        start = time.perf_counter()
+        st.subheader("产品排行榜")
+        
+        if not table_exists('product_rankings'):
+            st.info("💡 排行榜尚未生成，请先运行 restructure_database.py")
+        else:
+            metric_labels = {'reversionary': '归原红利', 'special': '特别红利'}
+            col_metric, col_currency = st.columns(2)
+            with col_metric:
+                metric = st.radio('指标', list(RANKING_METRICS), format_func=metric_labels.get, horizontal=True)
+            with col_currency:
+                currencies = ranking_currencies(get_engine())
+                currency = st.selectbox('排行货币', currencies,
+                                        index=currencies.index('USD') if 'USD' in currencies else 0)
+            
+            company = None if selected_company == '全部' else selected_company
+            board = pd.DataFrame(leaderboard(get_engine(), metric=metric, currency=currency,
+                                             company=company, limit=50))
+            if board.empty:
+                st.warning("暂无排行数据")
+            else:
+                board = board[[
+                    'company_rank' if company else 'market_rank', 'company', 'product_name',
+                    'mean_rate', 'min_rate', 'share_at_least_100', 'years_count',
+                    'company_percentile', 'market_percentile'
+                ]]
+                board.columns = ['排名', '保险公司', '产品名称', '平均实现率(%)', '最低实现率(%)',
+                                 '达100%年份占比', '年份数', '公司内百分位', '全市场百分位']
+                st.dataframe(board, use_container_width=True, hide_index=True)
+        telemetry.observe('tab4.leaderboard', _elapsed_ms(start))
+    
+    with tab5:
+        start = time.perf_counter()
+        st.subheader("最新变动")
+        
+        if not table_exists('ratio_changes'):
+            st.info("💡 变动表尚未生成，请先运行 restructure_database.py")
+        else:
+            type_labels = {'added': '新增', 'removed': '移除', 'changed': '数值变动'}
+            change_type = st.radio('变动类型', ('全部',) + CHANGE_TYPES,
+                                   format_func=lambda t: type_labels.get(t, t), horizontal=True)
+            changes = pd.DataFrame(latest_changes(
+                get_engine(),
+                company=None if selected_company == '全部' else selected_company,
+                currency=None if selected_currency == '全部' else selected_currency,
+                change_type=None if change_type == '全部' else change_type,
+            ))
+            if changes.empty:
+                st.warning("暂无变动数据（需要至少两个报告年度）")
+            else:
+                if changes['data_year'].nunique() == 1:
+                    st.caption(f"{changes['previous_year'].min()} → {changes['data_year'].iloc[0]} 报告年度，按变动幅度排序")
+                else:
+                    st.caption("各公司最新报告年度与其上一报告年度对比，按变动幅度排序")
+                changes['metric'] = changes['metric'].map(METRIC_LABELS)
+                changes['change_type'] = changes['change_type'].map(type_labels)
+                changes = changes[[
+                    'company', 'product_name', 'currency', 'purchase_year', 'metric',
+                    'change_type', 'old_rate', 'new_rate', 'delta'
+                ]]
+                changes.columns = ['保险公司', '产品名称', '货币', '购买年份', '类别',
+                                   '变动类型', '上年(%)', '本年(%)', '变动(百分点)']
+                st.dataframe(changes, use_container_width=True, hide_index=True)
+        telemetry.observe('tab5.changes', _elapsed_ms(start))
+    
     # 页脚
     st.markdown("---")
     st.markdown("""
@@ -0,0 +1,191 @@
+"""
+应用性能监控模块
+Query Latency, Cache Hit and Render-time Telemetry for the Streamlit App
+
+- 每次rerun中各区块（数据加载、筛选、各标签页、图表构建/渲染）的耗时
+- 数据缓存、图表缓存的命中/未命中计数
+- 涉及的数据行数
+
+所有会话共享同一个进程内的 AppTelemetry 实例，按区块聚合为延迟直方图，
+可在管理员面板展示，或通过本地 /metrics 端点以 Prometheus 格式暴露。
+"""
+
+import bisect
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+# 直方图桶上界（毫秒）
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class LatencyHistogram:
+    """固定桶直方图 + 最近样本窗口（用于精确的p50/p95）"""
+
+    def __init__(self, window: int = 2000):
+        self.bucket_counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value_ms: float):
+        self.bucket_counts[bisect.bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+        self.recent.append(value_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class AppTelemetry:
+    """进程内共享的性能数据（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.last_rows: Dict[str, int] = {}
+        self.cache_stats: Dict[str, Dict[str, int]] = {}
+        self.started_at = time.time()
+
+    @contextmanager
+    def timer(self, section: str, rows: Optional[int] = None):
+        """记录一个区块的耗时；rows 可在结束前通过 yield 的字典更新"""
+        info = {'rows': rows}
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.observe(section, (time.perf_counter() - start) * 1000, info['rows'])
+
+    def observe(self, section: str, value_ms: float, rows: Optional[int] = None):
+        with self._lock:
+            self.histograms.setdefault(section, LatencyHistogram()).observe(value_ms)
+            if rows is not None:
+                self.last_rows[section] = rows
+
+    def record_cache(self, cache: str, hit: bool):
+        with self._lock:
+            stats = self.cache_stats.setdefault(cache, {'hit': 0, 'miss': 0})
+            stats['hit' if hit else 'miss'] += 1
+
+    def mark_miss(self, cache: str):
+        """在被缓存函数体内调用：函数体执行即表示缓存未命中"""
+        misses = getattr(self._local, 'misses', None)
+        if misses is not None:
+            misses.add(cache)
+
+    @contextmanager
+    def cache_probe(self, cache: str):
+        """包裹对 st.cache_* 函数的调用，根据函数体是否执行判断命中
+
+        Streamlit 在调用方线程中执行被缓存函数，因此用线程局部变量区分会话。
+        """
+        self._local.misses = set()
+        try:
+            yield
+        finally:
+            missed = cache in self._local.misses
+            self._local.misses = None
+            self.record_cache(cache, hit=not missed)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """各区块汇总：次数、p50/p95/最大耗时、最近行数"""
+        with self._lock:
+            rows = []
+            for section, hist in sorted(self.histograms.items()):
+                rows.append({
+                    'section': section,
+                    'count': hist.count,
+                    'p50_ms': _round(hist.quantile(0.5)),
+                    'p95_ms': _round(hist.quantile(0.95)),
+                    'max_ms': _round(hist.max_ms),
+                    'mean_ms': _round(hist.total_ms / hist.count) if hist.count else None,
+                    'rows': self.last_rows.get(section),
+                })
+            return rows
+
+    def cache_snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = []
+            for cache, stats in sorted(self.cache_stats.items()):
+                total = stats['hit'] + stats['miss']
+                rows.append({
+                    'cache': cache,
+                    'hit': stats['hit'],
+                    'miss': stats['miss'],
+                    'hit_rate': round(stats['hit'] / total, 3) if total else None,
+                })
+            return rows
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式"""
+        lines = [
+            '# HELP app_section_duration_ms 区块耗时直方图（毫秒）',
+            '# TYPE app_section_duration_ms histogram',
+        ]
+        with self._lock:
+            for section, hist in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS + ['+Inf'], hist.bucket_counts):
+                    cumulative += count
+                    lines.append(f'app_section_duration_ms_bucket{{section="{section}",le="{bound}"}} {cumulative}')
+                lines.append(f'app_section_duration_ms_sum{{section="{section}"}} {hist.total_ms:.3f}')
+                lines.append(f'app_section_duration_ms_count{{section="{section}"}} {hist.count}')
+            lines.append('# HELP app_section_rows 区块最近一次处理的行数')
+            lines.append('# TYPE app_section_rows gauge')
+            for section, rows in sorted(self.last_rows.items()):
+                lines.append(f'app_section_rows{{section="{section}"}} {rows}')
+            lines.append('# HELP app_cache_requests_total 缓存请求次数')
+            lines.append('# TYPE app_cache_requests_total counter')
+            for cache, stats in sorted(self.cache_stats.items()):
+                for result, count in stats.items():
+                    lines.append(f'app_cache_requests_total{{cache="{cache}",result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 2) if value is not None else None
+
+
+def start_metrics_server(telemetry: AppTelemetry, port: int,
+                         host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """在后台线程启动本地指标端点：/metrics (Prometheus) 和 /metrics.json"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = telemetry.prometheus_text().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif self.path == '/metrics.json':
+                body = json.dumps({
+                    'sections': telemetry.snapshot(),
+                    'caches': telemetry.cache_snapshot(),
+                }, ensure_ascii=False).encode('utf-8')
+                content_type = 'application/json; charset=utf-8'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
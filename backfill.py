@@ -0,0 +1,197 @@
+"""
+历史数据并行回填
+Parallel Backfill of Archived Insurer Disclosures
+
+扫描 `<root>/<报告年度>/...(<insurer>).json` 下的全部原始抓取文件，
+每个 (保险公司, 报告年度) 文件由一个工作进程解析、标准化、校验，
+校验通过的记录按批次经队列发送给唯一的写入端（主进程），
+写入端用 executemany + ON CONFLICT 批量 upsert 到 SQLite。
+指定 --reject-log / --quarantine 时无效记录也按批次发给写入端，由写入端写入 ValidationErrorSink。
+解析在多核上并行，SQLite 只有一个写入者，不会出现锁竞争。
+
+    python backfill.py --input-dir data/archive --workers 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from data_loader import DatabaseLoader
+from data_parser import DataParser, DataValidator, discover_extracts
+from db_connections import write_lock
+from validation_sink import ValidationErrorSink, add_sink_arguments, print_summary, sink_from_args
+
+
+# 工作进程 -> 写入端的消息队列，以及写入端出错时的停止信号（由进程池 initializer 注入）
+_queue = None
+_stop = None
+
+
+def _init_worker(message_queue, stop_event):
+    global _queue, _stop
+    _queue = message_queue
+    _stop = stop_event
+
+
+def _parse_extract(insurer: str, data_year: int, path: str, batch_size: int, send_rejects: bool = False):
+    """工作进程：解析一个文件，校验后按批次发送给写入端，最后发送汇总"""
+    summary = {'insurer': insurer, 'data_year': data_year, 'path': path,
+               'rows': 0, 'valid': 0, 'parse_seconds': 0.0, 'error': None}
+    start = time.perf_counter()
+    try:
+        parser = DataParser(data_year=data_year)
+        records = parser.parse_file(insurer, path)
+        valid, rejected = [], []
+        for i, record in enumerate(records):
+            failures = DataValidator.check_record(record)
+            if not failures:
+                valid.append(record)
+            elif send_rejects:
+                rejected.append((i, record, failures))
+        summary['rows'] = len(records)
+        summary['valid'] = len(valid)
+        summary['parse_seconds'] = time.perf_counter() - start
+        messages = [('batch', valid[i:i + batch_size]) for i in range(0, len(valid), batch_size)]
+        messages += [('rejected', (path, rejected[i:i + batch_size])) for i in range(0, len(rejected), batch_size)]
+        for message in messages:
+            if _stop.is_set():  # 写入端已出错，不再发送数据
+                break
+            _queue.put(message)
+    except Exception as e:
+        summary['error'] = f'{type(e).__name__}: {e}'
+    finally:
+        _queue.put(('done', summary))
+
+
+def _drain(message_queue, futures, outstanding: int):
+    """丢弃队列中的消息，直到收到 outstanding 个工作进程的汇总（或全部工作进程已结束）"""
+    while outstanding > 0:
+        try:
+            kind, _ = message_queue.get(timeout=1.0)
+        except queue.Empty:
+            if all(f.done() for f in futures):
+                return
+            continue
+        if kind == 'done':
+            outstanding -= 1
+
+
+def run_backfill(input_dir: str, db_path: str = 'insurance_data.db', workers: Optional[int] = None,
+                 batch_size: int = 5000, queue_size: int = 64, clear: bool = False,
+                 default_year: Optional[int] = None, sink: Optional[ValidationErrorSink] = None) -> Dict[str, Any]:
+    """并行解析 + 单写入端批量 upsert，返回吞吐量报告；传入 sink 时无效记录写入 sink（由调用方关闭）"""
+    extracts = discover_extracts(input_dir, default_year)
+    if not extracts:
+        raise FileNotFoundError(f"{input_dir} 下没有找到原始抓取文件")
+    workers = workers or os.cpu_count() or 1
+
+    # 与其他导入、重构和调度器互斥（等待其完成）
+    with write_lock(db_path):
+        loader = DatabaseLoader(db_path)
+        loader.init_database()
+        if clear:
+            loader.clear_data()
+
+        start = time.perf_counter()
+        ctx = multiprocessing.get_context('spawn')
+        message_queue = ctx.Queue(maxsize=queue_size)
+        stop = ctx.Event()
+        files: List[Dict[str, Any]] = []
+        written = 0
+        write_seconds = 0.0
+
+        # 导入期间只保留 upsert 需要的唯一索引，辅助索引导入后（出错时也一样）一次性重建
+        with loader.bulk_load():
+            with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                     initializer=_init_worker, initargs=(message_queue, stop)) as pool:
+                futures = [pool.submit(_parse_extract, insurer, year, path, batch_size, sink is not None)
+                           for insurer, year, path in extracts]
+                try:
+                    while len(files) < len(extracts):
+                        try:
+                            kind, payload = message_queue.get(timeout=1.0)
+                        except queue.Empty:
+                            # 工作进程崩溃时不会发送汇总，避免无限等待
+                            crashed = [f.exception() for f in futures if f.done() and f.exception()]
+                            if crashed:
+                                raise RuntimeError(f"工作进程异常退出: {crashed[0]}")
+                            continue
+                        if kind == 'batch':
+                            write_start = time.perf_counter()
+                            written += loader.bulk_upsert(payload)
+                            write_seconds += time.perf_counter() - write_start
+                        elif kind == 'rejected':
+                            path, rejected = payload
+                            for index, record, failures in rejected:
+                                sink.add(record, failures, source=path, record_index=index)
+                        else:
+                            files.append(payload)
+                            status = f"❌ {payload['error']}" if payload['error'] else f"✅ {payload['valid']} 条"
+                            print(f"  [{len(files)}/{len(extracts)}] {payload['insurer']} {payload['data_year']}: {status}")
+                except BaseException:
+                    # 写入端出错：通知工作进程停止发送，取消未开始的文件，
+                    # 并继续取出队列中的消息，否则阻塞在 put 上的工作进程会让进程池无法关闭
+                    stop.set()
+                    cancelled = sum(1 for f in futures if f.cancel())
+                    _drain(message_queue, futures, len(extracts) - len(files) - cancelled)
+                    raise
+            # 重建辅助索引和提交计入写入端耗时
+            write_start = time.perf_counter()
+        write_seconds += time.perf_counter() - write_start
+        elapsed = time.perf_counter() - start
+        return {
+            'files': files,
+            'workers': workers,
+            'rows_parsed': sum(f['rows'] for f in files),
+            'rows_written': written,
+            'failed_files': sum(1 for f in files if f['error']),
+            'elapsed_seconds': elapsed,
+            'write_seconds': write_seconds,
+            'rows_per_sec': written / elapsed if elapsed else 0.0,
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    """打印吞吐量报告"""
+    parse_seconds = sum(f['parse_seconds'] for f in report['files'])
+    print("\n" + "=" * 60)
+    print(f"文件数: {len(report['files'])}（失败 {report['failed_files']}），工作进程: {report['workers']}")
+    print(f"解析: {report['rows_parsed']:,} 行，累计解析耗时 {parse_seconds:.2f}s")
+    print(f"写入: {report['rows_written']:,} 行，写入端耗时 {report['write_seconds']:.2f}s")
+    print(f"总耗时: {report['elapsed_seconds']:.2f}s，吞吐量 {report['rows_per_sec']:,.0f} 行/秒")
+    if report['elapsed_seconds']:
+        print(f"并行度: {parse_seconds / report['elapsed_seconds']:.1f}x")
+    print("=" * 60)
+
+
+def main(argv=None):
+    """主函数"""
+    arg_parser = argparse.ArgumentParser(description='并行回填历年原始抓取文件')
+    arg_parser.add_argument('--input-dir', required=True, help='原始文件根目录（<报告年度>/...json）')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--workers', type=int, help='解析进程数（默认CPU核数）')
+    arg_parser.add_argument('--batch-size', type=int, default=5000, help='每批 upsert 行数')
+    arg_parser.add_argument('--year', type=int, help='直接放在根目录下的文件的报告年度')
+    arg_parser.add_argument('--clear', action='store_true', help='导入前清空待导入表')
+    add_sink_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+
+    sink = sink_from_args(args, args.db)
+    try:
+        report = run_backfill(args.input_dir, args.db, workers=args.workers, batch_size=args.batch_size,
+                              clear=args.clear, default_year=args.year, sink=sink)
+    finally:
+        if sink is not None:
+            sink.close()
+    print_report(report)
+    if sink is not None:
+        print_summary(sink.summary())
+    return 1 if report['failed_files'] else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
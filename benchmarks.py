@@ -0,0 +1,340 @@
+"""
+端到端性能基准测试
+End-to-end ETL and App Query Benchmarks with Regression Thresholds
+
+在固定规模的合成数据（默认 10k / 100k / 1M 行）上分别测量：
+- parse:     DataParser 解析原始JSON（不使用紧凑格式缓存）
+- parse_cached: DataParser 从紧凑格式缓存读取（缓存已预热）
+- insert:    DatabaseLoader.insert_records 入库
+- transform: DatabaseRestructurer.transform_data 长表转宽表
+- app_load:  app.load_data 使用的全表查询（经 query_engine，后端由 INSURANCE_QUERY_ENGINE 选择）
+
+每个 (阶段, 规模) 在独立子进程中运行，记录吞吐量、p50/p95 延迟和进程峰值RSS，
+结果写入JSON；若提供基线文件，超过阈值的退化会使命令以非零状态退出。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List
+
+from create_sample_data import SyntheticExtractGenerator
+
+
+STAGES = ['parse', 'parse_cached', 'insert', 'transform', 'app_load']
+
+SIZE_ALIASES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# 默认阈值：p50 延迟超过基线的比例
+DEFAULT_THRESHOLDS = {'latency': 0.25, 'rss': 0.5}
+
+# 合成数据配置：每个产品在单一报告年度内约产生的记录数
+BENCH_CURRENCIES = ('USD', 'HKD')
+BENCH_REPORT_YEAR = 2024
+
+
+def parse_size(text: str) -> int:
+    """解析规模参数，如 10k / 100k / 1m / 25000"""
+    text = text.strip().lower()
+    return SIZE_ALIASES.get(text) or int(text)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """最近秩法百分位数"""
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def peak_rss_mb() -> float:
+    """当前进程峰值RSS（MB）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+class BenchmarkWorkspace:
+    """基准测试输入数据准备（按规模缓存，多次运行复用）"""
+
+    def __init__(self, work_dir: str, rows: int, seed: int = 7):
+        self.rows = rows
+        self.dir = os.path.join(work_dir, str(rows))
+        probe = SyntheticExtractGenerator(products=1, currencies=BENCH_CURRENCIES,
+                                          report_years=[BENCH_REPORT_YEAR])
+        products = max(math.ceil(rows / probe.estimate_rows()), 1)
+        self.generator = SyntheticExtractGenerator(
+            seed=seed, products=products, currencies=BENCH_CURRENCIES,
+            report_years=[BENCH_REPORT_YEAR],
+        )
+
+    @property
+    def extract_paths(self) -> Dict[str, str]:
+        """各公司原始文件路径"""
+        year_dir = os.path.join(self.dir, 'extracts', str(BENCH_REPORT_YEAR))
+        return {insurer: os.path.join(year_dir, f'synthetic_extract({insurer}).json')
+                for insurer in self.generator.insurers}
+
+    @property
+    def compact_dir(self) -> str:
+        """紧凑格式缓存目录（只供 parse_cached 阶段使用）"""
+        return os.path.join(self.dir, 'compact')
+
+    @property
+    def loaded_db(self) -> str:
+        return os.path.join(self.dir, 'loaded.db')
+
+    @property
+    def transformed_db(self) -> str:
+        return os.path.join(self.dir, 'transformed.db')
+
+    def ensure_extracts(self):
+        if not all(os.path.exists(p) for p in self.extract_paths.values()):
+            self.generator.write(os.path.join(self.dir, 'extracts'))
+
+    def parse_all(self, cached: bool = False):
+        """解析全部原始文件；默认不读写紧凑格式缓存，保证测量的是完整解析"""
+        from data_parser import DataParser
+        parser = DataParser(data_year=BENCH_REPORT_YEAR, compact_dir=self.compact_dir if cached else None)
+        records = []
+        for insurer, path in self.extract_paths.items():
+            records.extend(getattr(parser, f'parse_{insurer}')(path))
+        return records
+
+    def ensure_loaded_db(self):
+        if os.path.exists(self.loaded_db):
+            return
+        from data_loader import DatabaseLoader
+        self.ensure_extracts()
+        tmp_path = f'{self.loaded_db}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        loader = DatabaseLoader(tmp_path)
+        loader.init_database()
+        loader.insert_records(self.parse_all(), batch_size=5000)
+        os.replace(tmp_path, self.loaded_db)
+
+    def ensure_transformed_db(self):
+        if os.path.exists(self.transformed_db):
+            return
+        from restructure_database import DatabaseRestructurer
+        self.ensure_loaded_db()
+        tmp_path = f'{self.transformed_db}.tmp'
+        shutil.copyfile(self.loaded_db, tmp_path)
+        restructurer = DatabaseRestructurer(tmp_path)
+        restructurer.connect()
+        restructurer.create_new_table()
+        restructurer.transform_data()
+        restructurer.close()
+        os.replace(tmp_path, self.transformed_db)
+
+
+def _run_stage(stage: str, rows: int, work_dir: str, repeat: int) -> Dict[str, Any]:
+    """子进程入口：准备输入后重复运行某阶段并计时"""
+    workspace = BenchmarkWorkspace(work_dir, rows)
+    samples = []
+    row_count = 0
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if stage == 'parse':
+            workspace.ensure_extracts()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                row_count = len(workspace.parse_all())
+                samples.append(time.perf_counter() - start)
+
+        elif stage == 'parse_cached':
+            workspace.ensure_extracts()
+            workspace.parse_all(cached=True)  # 预热缓存
+            for _ in range(repeat):
+                start = time.perf_counter()
+                row_count = len(workspace.parse_all(cached=True))
+                samples.append(time.perf_counter() - start)
+
+        elif stage == 'insert':
+            from data_loader import DatabaseLoader
+            workspace.ensure_extracts()
+            records = workspace.parse_all()
+            row_count = len(records)
+            db_path = os.path.join(workspace.dir, 'insert_bench.db')
+            for _ in range(repeat):
+                if os.path.exists(db_path):
+                    os.remove(db_path)
+                loader = DatabaseLoader(db_path)
+                loader.init_database()
+                loader.close()
+                start = time.perf_counter()
+                loader.insert_records(records)
+                samples.append(time.perf_counter() - start)
+
+        elif stage == 'transform':
+            from restructure_database import DatabaseRestructurer
+            workspace.ensure_loaded_db()
+            db_path = os.path.join(workspace.dir, 'transform_bench.db')
+            for _ in range(repeat):
+                shutil.copyfile(workspace.loaded_db, db_path)
+                restructurer = DatabaseRestructurer(db_path)
+                restructurer.connect()
+                restructurer.create_new_table()
+                start = time.perf_counter()
+                restructurer.transform_data()
+                samples.append(time.perf_counter() - start)
+                row_count = restructurer.conn.execute(
+                    'SELECT COUNT(*) FROM fulfillment_ratios').fetchone()[0]
+                restructurer.close()
+
+        elif stage == 'app_load':
+            from query_engine import create_engine
+            workspace.ensure_transformed_db()
+            for _ in range(repeat):
+                # 与 app.load_data 相同：按 INSURANCE_QUERY_ENGINE 创建引擎后整表读取
+                start = time.perf_counter()
+                engine = create_engine(db_path=workspace.transformed_db)
+                df = engine.query_df("SELECT * FROM product_fulfillment_rates")
+                engine.close()
+                samples.append(time.perf_counter() - start)
+                row_count = len(df)
+
+        else:
+            raise ValueError(f"未知阶段: {stage}")
+
+    p50 = statistics.median(samples)
+    return {
+        'stage': stage,
+        'size': rows,
+        'rows': row_count,
+        'repeat': repeat,
+        'p50_seconds': round(p50, 6),
+        'p95_seconds': round(percentile(samples, 95), 6),
+        'throughput_rows_per_sec': round(row_count / p50, 1) if p50 > 0 else None,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def run_benchmarks(stages: List[str], sizes: List[int], work_dir: str,
+                   repeat: int) -> List[Dict[str, Any]]:
+    """逐个 (阶段, 规模) 在新的子进程中运行，保证峰值RSS互不影响"""
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for rows in sizes:
+        for stage in stages:
+            # 大规模输入减少重复次数
+            stage_repeat = repeat if rows < 1_000_000 else max(repeat // 3, 1)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(_run_stage, stage, rows, work_dir, stage_repeat).result()
+            print(f"  {stage:<12} {rows:>9,} 行  p50 {result['p50_seconds']:.3f}s  "
+                  f"p95 {result['p95_seconds']:.3f}s  "
+                  f"{result['throughput_rows_per_sec'] or 0:,.0f} 行/秒  "
+                  f"RSS {result['peak_rss_mb']:.0f} MB")
+            results.append(result)
+    return results
+
+
+def compare_with_baseline(results: List[Dict[str, Any]],
+                          baseline: Dict[str, Any]) -> List[str]:
+    """与基线对比，返回退化描述列表"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    thresholds.update(baseline.get('thresholds', {}))
+    stage_thresholds = baseline.get('stage_thresholds', {})
+
+    baseline_index = {(r['stage'], r['size']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        base = baseline_index.get((result['stage'], result['size']))
+        if base is None:
+            continue
+        limits = dict(thresholds)
+        limits.update(stage_thresholds.get(result['stage'], {}))
+
+        latency_ratio = result['p50_seconds'] / base['p50_seconds'] - 1 if base['p50_seconds'] else 0
+        if latency_ratio > limits['latency']:
+            regressions.append(
+                f"{result['stage']}@{result['size']}: p50 {base['p50_seconds']:.3f}s -> "
+                f"{result['p50_seconds']:.3f}s (+{latency_ratio:.0%}, 阈值 {limits['latency']:.0%})")
+
+        rss_ratio = result['peak_rss_mb'] / base['peak_rss_mb'] - 1 if base['peak_rss_mb'] else 0
+        if rss_ratio > limits['rss']:
+            regressions.append(
+                f"{result['stage']}@{result['size']}: RSS {base['peak_rss_mb']:.0f}MB -> "
+                f"{result['peak_rss_mb']:.0f}MB (+{rss_ratio:.0%}, 阈值 {limits['rss']:.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    """主函数"""
+    arg_parser = argparse.ArgumentParser(description='ETL与应用查询性能基准测试')
+    arg_parser.add_argument('--stages', default=','.join(STAGES), help='逗号分隔的阶段列表')
+    arg_parser.add_argument('--sizes', default='10k,100k,1m', help='逗号分隔的数据规模')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='每个阶段重复次数')
+    arg_parser.add_argument('--work-dir', default='data/bench', help='合成输入缓存目录')
+    arg_parser.add_argument('--output', default='bench_results.json', help='结果JSON文件')
+    arg_parser.add_argument('--baseline', default='bench_baseline.json', help='基线JSON文件')
+    arg_parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    args = arg_parser.parse_args(argv)
+
+    stages = args.stages.split(',')
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        arg_parser.error(f"未知阶段: {sorted(unknown)}")
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+
+    print("=" * 60)
+    print("性能基准测试")
+    print("=" * 60)
+    results = run_benchmarks(stages, sizes, args.work_dir, args.repeat)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'query_engine': os.environ.get('INSURANCE_QUERY_ENGINE', 'sqlite'),
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline.setdefault('thresholds', dict(DEFAULT_THRESHOLDS))
+        baseline['results'] = results
+        baseline['created_at'] = report['created_at']
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"未找到基线文件 {args.baseline}，跳过退化检查")
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as f:
+        regressions = compare_with_baseline(results, json.load(f))
+    if regressions:
+        print(f"\n❌ 发现 {len(regressions)} 项性能退化:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+
+    print("\n✅ 未发现性能退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+批处理命令行工具
+Non-interactive Batch CLI
+
+把导入、重构、统计、导出和基准测试统一为一个非交互的命令行入口，
+全部参数都可以通过命令行指定，适合 cron / 定时任务 / 并行作业调用。
+成功时退出码为 0，失败时非 0。
+
+    python cli.py ingest --input-dir data/raw --year 2024 --clear
+    python cli.py ingest --input-dir data/archive --workers 8 --batch-size 5000
+    python cli.py pivot
+    python cli.py stats --json
+    python cli.py export --output-dir data/parquet
+    python cli.py bench --sizes 10k --stages parse,insert
+    python cli.py schedule --snapshot-dir data/snapshots
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from db_connections import connect_reader
+from validation_sink import add_sink_arguments, print_summary, sink_from_args
+
+
+def _stats_table(db_path: str) -> str:
+    """统计用的表：待导入表不存在时（已重构）改用兼容视图"""
+    conn = connect_reader(db_path)
+    try:
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'fulfillment_ratios' AND type = 'table'").fetchone()
+    finally:
+        conn.close()
+    return 'fulfillment_ratios' if row else 'fulfillment_ratios_backup'
+
+
+def cmd_ingest(args) -> int:
+    """导入原始文件；指定 --workers 时使用多进程并行回填"""
+    sink = sink_from_args(args, args.db)
+    try:
+        if args.workers:
+            from backfill import print_report, run_backfill
+            report = run_backfill(args.input_dir, args.db, workers=args.workers, batch_size=args.batch_size,
+                                  clear=args.clear, default_year=args.year, sink=sink)
+        else:
+            from data_loader import ingest
+            from etl_metrics import StageTracer
+            tracer = StageTracer(jsonl_path=args.trace_jsonl)
+            result = ingest(args.db, args.input_dir, data_year=args.year, clear=args.clear,
+                            bulk=args.bulk, batch_size=args.batch_size, tracer=tracer, sink=sink)
+    finally:
+        if sink is not None:
+            sink.close()
+    if sink is not None:
+        print("\n无效记录")
+        print_summary(sink.summary())
+
+    if args.workers:
+        print_report(report)
+        return 1 if report['failed_files'] else 0
+
+    from data_loader import print_statistics
+    print("\n数据库统计信息")
+    print_statistics(result['statistics'])
+    if args.prom_textfile:
+        tracer.write_prometheus(args.prom_textfile)
+    return 0
+
+
+def cmd_pivot(args) -> int:
+    """规范化待导入表并刷新宽表、排名、汇总和搜索索引；存在未确认的异常时退出码为2"""
+    from restructure_database import pivot
+    return pivot(args.db, keep_staging=args.keep_staging)
+
+
+def cmd_stats(args) -> int:
+    """打印数据库统计信息"""
+    from data_loader import DatabaseLoader, print_statistics
+    if not os.path.exists(args.db):
+        print(f"❌ 数据库不存在: {args.db}", file=sys.stderr)
+        return 1
+    stats = DatabaseLoader(args.db).get_statistics(_stats_table(args.db))
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+    else:
+        print_statistics(stats)
+    return 0
+
+
+def cmd_export(args) -> int:
+    """导出分区 Parquet 数据集"""
+    from parquet_export import ParquetExporter
+    results = ParquetExporter(args.db, args.output_dir).export()
+    for dataset, stats in results.items():
+        print(f"✅ {dataset}: 重写 {stats['written']} 个分区, "
+              f"未变化 {stats['unchanged']} 个, 删除 {stats['removed']} 个")
+    return 0
+
+
+def cmd_bench(args) -> int:
+    """性能基准测试（其余参数原样传给 benchmarks.py）"""
+    import benchmarks
+    return benchmarks.main(args.passthrough_args)
+
+
+def cmd_schedule(args) -> int:
+    """常驻调度器（其余参数原样传给 scheduler.py）"""
+    import scheduler
+    return scheduler.main(args.passthrough_args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """构建命令行解析器"""
+    arg_parser = argparse.ArgumentParser(description='香港保险分红实现率数据批处理工具')
+    subparsers = arg_parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help='解析原始文件并写入待导入表')
+    ingest.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    ingest.add_argument('--input-dir', default=os.path.join('data', 'raw'),
+                        help='原始文件目录（<报告年度>/ 子目录以目录名为报告年度）')
+    ingest.add_argument('--year', type=int, default=2024, help='不在年度子目录下的文件的报告年度')
+    ingest.add_argument('--workers', type=int, help='并行解析进程数（指定后使用并行回填）')
+    ingest.add_argument('--batch-size', type=int, default=5000, help='每批 upsert 行数')
+    ingest.add_argument('--bulk', action='store_true', help='批量模式：删除辅助索引后批量 upsert')
+    ingest.add_argument('--clear', action='store_true', help='导入前清空待导入表')
+    ingest.add_argument('--trace-jsonl', help='各阶段span记录（JSON Lines）输出文件')
+    ingest.add_argument('--prom-textfile', help='Prometheus textfile 输出路径')
+    add_sink_arguments(ingest)
+    ingest.set_defaults(func=cmd_ingest)
+
+    pivot = subparsers.add_parser('pivot', help='规范化为维度表 + 宽表并刷新派生数据')
+    pivot.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    pivot.add_argument('--keep-staging', action='store_true', help='保留待导入表（不归档、不VACUUM）')
+    pivot.set_defaults(func=cmd_pivot)
+
+    stats = subparsers.add_parser('stats', help='数据库统计信息')
+    stats.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    stats.add_argument('--json', action='store_true', help='以JSON格式输出')
+    stats.set_defaults(func=cmd_stats)
+
+    export = subparsers.add_parser('export', help='导出分区Parquet数据集')
+    export.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    export.add_argument('--output-dir', default=os.path.join('data', 'parquet'), help='输出目录')
+    export.set_defaults(func=cmd_export)
+
+    bench = subparsers.add_parser('bench', add_help=False, help='性能基准测试（参数同 benchmarks.py）')
+    bench.set_defaults(func=cmd_bench)
+
+    schedule = subparsers.add_parser('schedule', add_help=False, help='定时增量刷新并发布快照（参数同 scheduler.py）')
+    schedule.set_defaults(func=cmd_schedule)
+    return arg_parser
+
+
+def main(argv=None) -> int:
+    """主函数"""
+    arg_parser = build_parser()
+    args, extra = arg_parser.parse_known_args(argv)
+    if args.command in ('bench', 'schedule'):
+        args.passthrough_args = extra
+    elif extra:
+        arg_parser.error(f"未知参数: {' '.join(extra)}")
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+原始抓取文件的紧凑中间格式
+Compact Intermediate Format for Raw Extracts
+
+原始JSON在每个字段旁都重复一遍 *_citation URL，解析时还要对每行做正则/状态映射。
+这里把每个原始文件一次性转换为列式、gzip 压缩的 JSON：
+- 字符串列（产品名、类别、货币、状态、来源URL等）做字符串驻留，列中只存字符串表下标
+- 年份、实现率等整数列直接存已解析好的值
+- 记录源文件的大小和修改时间及解析器指纹（DataParser.fingerprint），源文件、映射表或标准化逻辑变化、
+  格式版本升级后自动失效
+
+DataParser 读取同一文件时优先使用紧凑格式，跳过 JSON 全量解析和标准化。
+
+    python compact_format.py --input-dir data/raw     # 预先转换目录下的全部原始文件
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+
+# 紧凑文件结构变化时递增，旧文件自动失效（标准化逻辑变化见 DataParser.PARSER_VERSION）
+FORMAT_VERSION = 1
+
+DEFAULT_COMPACT_DIR = os.path.join('data', 'cache', 'compact')
+
+STRING_COLUMNS = ('company', 'product_name', 'product_type', 'category', 'currency', 'status', 'data_source')
+INT_COLUMNS = ('policy_year', 'purchase_year', 'fulfillment_rate')
+RECORD_FIELDS = ('company', 'product_name', 'product_type', 'category', 'currency', 'policy_year',
+                 'purchase_year', 'fulfillment_rate', 'status', 'data_year', 'last_updated', 'data_source')
+
+
+def source_signature(source_path: str) -> Dict[str, int]:
+    """源文件签名：大小 + 修改时间"""
+    stat = os.stat(source_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def compact_path(compact_dir: str, source_path: str) -> str:
+    """紧凑文件路径：<compact_dir>/<源文件名>.<路径哈希>.cjson.gz"""
+    digest = hashlib.sha1(os.path.abspath(source_path).encode('utf-8')).hexdigest()[:10]
+    return os.path.join(compact_dir, f'{os.path.basename(source_path)}.{digest}.cjson.gz')
+
+
+def encode_records(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """标准化记录 -> 列式结构（不含 data_year / last_updated，读取时由解析器填充）"""
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+
+    def intern(value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    columns: Dict[str, List[Any]] = {}
+    for name in STRING_COLUMNS:
+        columns[name] = [intern(r[name]) for r in records]
+    for name in INT_COLUMNS:
+        columns[name] = [r[name] for r in records]
+    return {'rows': len(records), 'strings': strings, 'columns': columns}
+
+
+def decode_records(payload: Dict[str, Any], data_year: int, last_updated: str) -> List[Dict[str, Any]]:
+    """列式结构 -> 标准化记录（字段顺序与 DataParser.normalize_* 一致）"""
+    strings = payload['strings']
+    columns = {name: [None if i is None else strings[i] for i in payload['columns'][name]]
+               for name in STRING_COLUMNS}
+    columns.update({name: payload['columns'][name] for name in INT_COLUMNS})
+    rows = payload['rows']
+    columns['data_year'] = [data_year] * rows
+    columns['last_updated'] = [last_updated] * rows
+    return [dict(zip(RECORD_FIELDS, values)) for values in zip(*(columns[name] for name in RECORD_FIELDS))]
+
+
+def write_compact(path: str, source_path: str, insurer: str, records: List[Dict[str, Any]],
+                  parser_fingerprint: str):
+    """写出紧凑文件（先写临时文件再原子替换）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    document = {
+        'version': FORMAT_VERSION,
+        'insurer': insurer,
+        'source': source_signature(source_path),
+        'parser': parser_fingerprint,
+        **encode_records(records),
+    }
+    tmp_path = f'{path}.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        json.dump(document, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def read_compact(path: str, source_path: str, parser_fingerprint: str) -> Optional[Dict[str, Any]]:
+    """读取紧凑文件；不存在、格式版本或解析器指纹不符、源文件已变化时返回 None"""
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        document = json.load(f)
+    if (document.get('version') != FORMAT_VERSION or document.get('parser') != parser_fingerprint
+            or document.get('source') != source_signature(source_path)):
+        return None
+    return document
+
+
+def main(argv=None):
+    """主函数：预先转换原始文件"""
+    from data_parser import DataParser, discover_extracts
+
+    arg_parser = argparse.ArgumentParser(description='把原始抓取文件转换为紧凑中间格式')
+    arg_parser.add_argument('--input-dir', required=True, help='原始文件目录（递归查找）')
+    arg_parser.add_argument('--compact-dir', default=DEFAULT_COMPACT_DIR, help='紧凑文件输出目录')
+    args = arg_parser.parse_args(argv)
+
+    parser = DataParser(compact_dir=args.compact_dir)
+    for insurer, _, source_path in discover_extracts(args.input_dir, default_year=0):
+        records = parser.parse_file(insurer, source_path)
+        path = compact_path(args.compact_dir, source_path)
+        print(f"✅ {os.path.basename(source_path)}: {len(records)} 条, "
+              f"{os.path.getsize(source_path) / 1024:.0f} KB -> {os.path.getsize(path) / 1024:.0f} KB")
+
+
+if __name__ == '__main__':
+    main()
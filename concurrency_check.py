@@ -0,0 +1,224 @@
+"""
+读写并发检查
+Reader Latency Check During a Bulk Load
+
+在数据库副本上模拟应用读取 + 批量导入同时进行：
+N 个读线程（与应用相同的 mode=ro 只读连接）持续查询单个产品的数据（每次查询间隔 think_ms），
+先测一段无写入时的基线延迟，再启动一个写入进程用 DatabaseLoader.bulk_upsert 大批量导入
+（与 backfill 相同，整个导入是一个事务）。WAL 模式下读写互不阻塞：
+- 导入期间的读取 p99 应与基线基本持平
+- 导入耗时与无读者时相比不应明显变长（回滚日志模式下持续的共享锁会让写入端一直等待提交）
+超过阈值或出现 "database is locked" 时退出码为1。
+
+    python concurrency_check.py --db insurance_data.db --readers 8 --rows 200000
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks import percentile
+from data_loader import DatabaseLoader
+from db_connections import connect_reader, connect_writer
+
+
+READ_QUERY = 'SELECT * FROM product_fulfillment_rates WHERE company = ? AND product_name = ?'
+
+
+def _synthetic_records(rows: int) -> List[Dict[str, Any]]:
+    """压测用的待导入记录（报告年度 2099，键互不重复）"""
+    return [{
+        'company': '压测保险',
+        'product_name': f'压测产品{i // 3000}',
+        'product_type': None,
+        'category': '週年紅利',
+        'currency': 'USD',
+        'policy_year': (i % 3000) // 30 + 1,
+        'purchase_year': 1995 + i % 30,
+        'fulfillment_rate': 80 + i % 40,
+        'status': 'normal',
+        'data_year': 2099,
+        'last_updated': '2099-01-01',
+        'data_source': 'concurrency_check',
+    } for i in range(rows)]
+
+
+def _copy_database(source_path: str, target_path: str):
+    """用 backup API 复制数据库，并像导入流程一样初始化（切换为 WAL、建好待导入表）"""
+    source = connect_reader(source_path)
+    target = sqlite3.connect(target_path)
+    source.backup(target)
+    target.close()
+    source.close()
+    DatabaseLoader(target_path).init_database()
+
+
+def _run_writer(ctx, db_path: str, rows: int, batch_size: int) -> float:
+    """在独立进程中导入，返回从开始写入到提交完成的秒数"""
+    started = ctx.Event()
+    writer = ctx.Process(target=_bulk_load, args=(db_path, rows, batch_size, started))
+    writer.start()
+    started.wait()
+    start = time.perf_counter()
+    writer.join()
+    if writer.exitcode != 0:
+        raise RuntimeError(f"写入进程异常退出 (exit code {writer.exitcode})")
+    return time.perf_counter() - start
+
+
+def _bulk_load(db_path: str, rows: int, batch_size: int, started):
+    """写入进程：一个事务内分批 upsert，最后提交"""
+    records = _synthetic_records(rows)
+    loader = DatabaseLoader(db_path)
+    with loader.bulk_load():
+        started.set()
+        for i in range(0, rows, batch_size):
+            loader.bulk_upsert(records[i:i + batch_size])
+
+
+def _reader(db_path: str, products: List[tuple], stop: threading.Event, phase: Dict[str, str],
+            samples: Dict[str, List[float]], errors: List[str], seed: int, think_ms: float):
+    """读线程：循环查询随机产品，按当前阶段记录延迟（毫秒）"""
+    rng = random.Random(seed)
+    conn = connect_reader(db_path, check_same_thread=False)
+    try:
+        while not stop.is_set():
+            current = phase['name']
+            start = time.perf_counter()
+            try:
+                conn.execute(READ_QUERY, rng.choice(products)).fetchall()
+            except sqlite3.OperationalError as e:
+                errors.append(f'{current}: {e}')
+                continue
+            samples[current].append((time.perf_counter() - start) * 1000)
+            time.sleep(think_ms / 1000)
+    finally:
+        conn.close()
+
+
+def run_concurrency_check(db_path: str, readers: int = 4, rows: int = 200_000, batch_size: int = 5000,
+                          baseline_seconds: float = 3.0, think_ms: float = 1.0) -> Dict[str, Any]:
+    """在数据库副本上运行检查，返回各阶段读取延迟和写入耗时"""
+    work_dir = tempfile.mkdtemp(prefix='concurrency_check_')
+    solo_db = os.path.join(work_dir, 'solo.db')
+    work_db = os.path.join(work_dir, 'work.db')
+    ctx = multiprocessing.get_context('spawn')
+    try:
+        # 参照：没有读者时的导入耗时
+        _copy_database(db_path, solo_db)
+        solo_seconds = _run_writer(ctx, solo_db, rows, batch_size)
+
+        _copy_database(db_path, work_db)
+        conn = connect_writer(work_db)
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        products = conn.execute(
+            'SELECT DISTINCT company, product_name FROM product_fulfillment_rates').fetchall()
+        conn.close()
+        if not products:
+            raise ValueError(f"{db_path} 中没有 product_fulfillment_rates 数据")
+
+        phase = {'name': 'baseline'}
+        samples: Dict[str, List[float]] = {'baseline': [], 'load': [], 'after': []}
+        errors: List[str] = []
+        stop = threading.Event()
+        threads = [threading.Thread(target=_reader, daemon=True,
+                                    args=(work_db, products, stop, phase, samples, errors, seed, think_ms))
+                   for seed in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(baseline_seconds)
+
+        phase['name'] = 'load'
+        try:
+            load_seconds = _run_writer(ctx, work_db, rows, batch_size)
+        finally:
+            phase['name'] = 'after'
+            time.sleep(min(baseline_seconds, 1.0))
+            stop.set()
+            for thread in threads:
+                thread.join()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'journal_mode': journal_mode,
+        'readers': readers,
+        'rows': rows,
+        'solo_load_seconds': solo_seconds,
+        'load_seconds': load_seconds,
+        'errors': errors,
+        'phases': {
+            name: {
+                'reads': len(values),
+                'p50_ms': percentile(values, 50) if values else None,
+                'p99_ms': percentile(values, 99) if values else None,
+            }
+            for name, values in samples.items()
+        },
+    }
+
+
+def check_report(report: Dict[str, Any], max_ratio: float, slack_ms: float,
+                 max_writer_ratio: float) -> List[str]:
+    """检查结果，返回问题列表：
+    - 读取报错
+    - 导入期间 p99 超过 max(基线 p99 × max_ratio, 基线 p99 + slack_ms)
+    - 有读者时的导入耗时超过无读者时的 max_writer_ratio 倍
+    """
+    problems = [f"读取失败: {error}" for error in report['errors'][:5]]
+    writer_ratio = report['load_seconds'] / report['solo_load_seconds']
+    if writer_ratio > max_writer_ratio:
+        problems.append(f"有读者时导入耗时 {report['load_seconds']:.2f}s，是无读者时的 {writer_ratio:.1f} 倍"
+                        f"（阈值 {max_writer_ratio:.1f}）")
+    baseline = report['phases']['baseline']['p99_ms']
+    load = report['phases']['load']['p99_ms']
+    if baseline is None or load is None:
+        problems.append("没有采集到足够的读取样本")
+        return problems
+    limit = max(baseline * max_ratio, baseline + slack_ms)
+    if load > limit:
+        problems.append(f"导入期间读取 p99 {load:.1f}ms 超过阈值 {limit:.1f}ms（基线 {baseline:.1f}ms）")
+    return problems
+
+
+def main(argv=None) -> int:
+    """主函数"""
+    arg_parser = argparse.ArgumentParser(description='批量导入期间的读取延迟检查')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径（在副本上运行）')
+    arg_parser.add_argument('--readers', type=int, default=4, help='读线程数')
+    arg_parser.add_argument('--rows', type=int, default=200_000, help='导入行数')
+    arg_parser.add_argument('--batch-size', type=int, default=5000, help='每批 upsert 行数')
+    arg_parser.add_argument('--baseline-seconds', type=float, default=3.0, help='基线阶段时长')
+    arg_parser.add_argument('--think-ms', type=float, default=1.0, help='每个读线程两次查询之间的间隔（毫秒）')
+    arg_parser.add_argument('--max-ratio', type=float, default=3.0, help='导入期间 p99 / 基线 p99 上限')
+    arg_parser.add_argument('--slack-ms', type=float, default=2.0, help='基线很小时允许的绝对增量（毫秒）')
+    arg_parser.add_argument('--max-writer-ratio', type=float, default=3.0,
+                            help='有读者时导入耗时 / 无读者时导入耗时上限')
+    args = arg_parser.parse_args(argv)
+
+    report = run_concurrency_check(args.db, args.readers, args.rows, args.batch_size,
+                                   args.baseline_seconds, args.think_ms)
+    print(f"日志模式: {report['journal_mode']}，读线程: {report['readers']}，"
+          f"导入 {report['rows']:,} 行耗时 {report['load_seconds']:.2f}s（无读者时 {report['solo_load_seconds']:.2f}s）")
+    for name, stats in report['phases'].items():
+        if stats['reads']:
+            print(f"  {name:<8} 读取 {stats['reads']:>7,} 次  p50 {stats['p50_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms")
+
+    problems = check_report(report, args.max_ratio, args.slack_ms, args.max_writer_ratio)
+    if problems:
+        for problem in problems:
+            print(f"❌ {problem}")
+        return 1
+    print("✅ 导入期间读取延迟稳定，写入未被读者阻塞")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
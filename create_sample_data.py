@@ -1,232 +1,283 @@
 """
-基于周大福人寿网站结构创建样本数据集
-用于MVP开发和测试
+合成原始数据生成器
+Synthetic Raw-Extract Generator for Load Testing
+
+按各保险公司原始抓取文件的JSON格式生成可复现（固定随机种子）的合成数据：
+- 周大福: fulfillment_ratios 列表（ratio 为小数，policy_year 为购买年份）
+- 友邦: "第N個保單年度 (YYYY)" 字符串 + 百分比/状态文本
+- 保诚: 产品名称内含货币和 [报告年度的类别] 方括号说明
+
+输出目录结构为 <output_dir>/<报告年度>/synthetic_extract(<insurer>).json，
+可直接交给 DataParser 解析，用于百万行级别的导入和应用加载压测。
 """
 
-import pandas as pd
-import sqlite3
-from datetime import datetime
-
-def create_sample_dataset():
-    """
-    创建样本数据集
-    基于实际网页结构的真实数据示例
-    """
-    
-    records = []
-    
-    # 产品列表（从网页中提取的真实产品）
-    products = [
-        {
-            'name': '「传承宝」壽險計劃',
-            'type': '分紅人壽保險',
-            'currencies': ['美元'],
-            'categories': ['週年紅利', '終期紅利']
-        },
-        {
-            'name': '「财富100」壽險計劃',
-            'type': '分紅人壽保險',
-            'currencies': ['美元'],
-            'categories': ['週年紅利', '終期紅利']
-        },
-        {
-            'name': '「小龙 88」壽險計劃',
-            'type': '分紅人壽保險',
-            'currencies': ['美元'],
-            'categories': ['週年紅利', '終期紅利']
-        },
-        {
-            'name': '「守护168」危疾保障計劃 (加強版)',
-            'type': '分紅危疾人壽保險',
-            'currencies': ['美元'],
-            'categories': ['終期紅利']
-        },
-        {
-            'name': '「盛享 • 年金寶」入息計劃',
-            'type': '分紅年金保險',
-            'currencies': ['美元'],
-            'categories': ['週年紅利', '終期紅利']
-        },
-        {
-            'name': '「匠心 • 傳承」儲蓄壽險計劃2（尊尚版）',
-            'type': '分紅人壽保險',
-            'currencies': ['美元', '港元', '人民幣'],
-            'categories': ['復歸紅利', '終期分紅']
-        }
-    ]
-    
-    # 模拟数据（基于网页中看到的真实数据模式）
-    # 「传承宝」的真实数据示例
-    product_data_samples = {
-        '「传承宝」壽險計劃': {
-            '週年紅利': {
-                '美元': {
-                    1: ('discontinued', None),  # 已停售
-                    2: ('normal', 100),
-                    3: ('normal', 100),
-                    4: ('normal', 100),
-                    5: ('normal', 100),
-                    6: ('not_launched', None),  # 未推出
-                }
-            },
-            '終期紅利': {
-                '美元': {
-                    1: ('discontinued', None),
-                    2: ('no_termination', None),  # 沒有保單終結
-                    3: ('normal', 100),
-                    4: ('normal', 100),
-                    5: ('normal', 100),
-                    6: ('not_launched', None),
-                }
-            }
-        },
-        '「财富100」壽險計劃': {
-            '週年紅利': {
-                '美元': {i: ('normal', 100) for i in range(1, 12)}
-            },
-            '終期紅利': {
-                '美元': {
-                    1: ('no_dividend', None),
-                    2: ('no_dividend', None),
-                    **{i: ('normal', 100) for i in range(3, 12)}
-                }
-            }
-        },
-        '「小龙 88」壽險計劃': {
-            '週年紅利': {
-                '美元': {
-                    1: ('no_dividend', None),
-                    2: ('no_dividend', None),
-                    3: ('no_dividend', None),
-                    4: ('not_launched', None),
-                }
-            },
-            '終期紅利': {
-                '美元': {
-                    1: ('no_termination', None),
-                    2: ('normal', 100),
-                    3: ('no_termination', None),
-                    4: ('not_launched', None),
-                }
-            }
-        },
-        '「匠心 • 傳承」儲蓄壽險計劃2（尊尚版）': {
-            '復歸紅利': {
-                '美元': {1: ('not_reached_yet', None)},
-                '港元': {1: ('not_reached_yet', None)},
-                '人民幣': {1: ('not_reached_yet', None)},
-            },
-            '終期分紅': {
-                '美元': {1: ('not_reached_yet', None)},
-                '港元': {1: ('not_reached_yet', None)},
-                '人民幣': {1: ('not_reached_yet', None)},
-            }
-        }
-    }
-    
-    # 生成记录
-    for product_name, product_data in product_data_samples.items():
-        for category, currency_data in product_data.items():
-            for currency, year_data in currency_data.items():
-                for policy_year, (status, rate) in year_data.items():
-                    records.append({
-                        'company': '周大福人寿',
-                        'product_name': product_name,
-                        'product_type': next((p['type'] for p in products if p['name'] == product_name), ''),
-                        'category': category,
-                        'currency': currency,
-                        'policy_year': policy_year,
-                        'fulfillment_rate': rate,
-                        'status': status,
-                        'data_year': 2024,
-                        'last_updated': datetime.now().strftime('%Y-%m-%d')
+import argparse
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional, Sequence
+
+
+CTF_CITATION = 'https://www.ctflife.com.hk/zh-hk/fulfillment-ratio/'
+AIA_CITATION = 'https://www.aia.com.hk/zh-hk/our-products/fulfillment-ratio'
+PRUDENTIAL_CITATION = 'https://www.prudential.com.hk/performance/fulfillment-ratio/tc'
+
+# 产品名称词库
+NAME_PREFIXES = ['傳承', '盛世', '理想', '豐盛', '智選', '守護', '富饒', '匠心', '悅享', '康健',
+                 '宏揚', '尊尚', '安心', '雋逸', '卓越', '信守', '家傳', '榮耀', '喜樂', '啟航']
+NAME_SUFFIXES = ['人生', '財富', '寶', '年金', '儲蓄', '保障', '傳家', '未來', '世代', '100']
+NAME_SERIES = ['壽險計劃', '儲蓄壽險計劃', '保障系列', '入息計劃', '危疾保障計劃']
+NAME_EDITIONS = ['', ' II', ' III', '（尊尚版）', ' (加強版)']
+
+CHINESE_NUMERALS = ['一', '二', '三', '四', '五', '六', '七', '八', '九', '十']
+
+CURRENCY_NAMES = {'USD': '美元', 'HKD': '港元', 'RMB': '人民幣'}
+
+# 统一状态 -> 各公司原始文本
+RAW_STATUS_TEXT = {
+    'ctf': {'discontinued': None, 'not_launched': None, 'no_data': None},
+    'aia': {'discontinued': 'Closed to sales', 'not_launched': 'Not yet launched',
+            'no_data': 'N.A.<sup>(5)</sup>'},
+    'prudential': {'discontinued': 'N/A(2)', 'not_launched': 'N/A(1)', 'no_data': 'N/A(3)'},
+}
+
+DEFAULT_STATUS_MIX = {'normal': 0.6, 'discontinued': 0.2, 'not_launched': 0.15, 'no_data': 0.05}
+
+INSURER_FORMATS = ('ctf', 'aia', 'prudential')
+
+# 每个购买年份列数：第1~10保单年度 + "10+" 汇总列
+POLICY_YEARS = 10
+
+
+class SyntheticExtractGenerator:
+    """按原始格式生成合成抓取文件"""
+
+    def __init__(self, seed: int = 42,
+                 insurers: Sequence[str] = INSURER_FORMATS,
+                 products: int = 50,
+                 currencies: Sequence[str] = ('USD', 'HKD'),
+                 report_years: Sequence[int] = (2024,),
+                 status_mix: Optional[Dict[str, float]] = None):
+        unknown = set(insurers) - set(INSURER_FORMATS)
+        if unknown:
+            raise ValueError(f"不支持的保险公司格式: {sorted(unknown)}")
+        self.seed = seed
+        self.insurers = list(insurers)
+        self.products = products
+        self.currencies = list(currencies)
+        self.report_years = sorted(report_years)
+        self.status_mix = status_mix or DEFAULT_STATUS_MIX
+        self._statuses = list(self.status_mix)
+        self._weights = [self.status_mix[s] for s in self._statuses]
+
+    def _rng(self, *key) -> random.Random:
+        """按 (种子, 键) 派生独立随机数生成器，保证不同报告年度之间数据连贯"""
+        return random.Random(':'.join(str(k) for k in (self.seed,) + key))
+
+    def product_name(self, insurer: str, index: int) -> str:
+        """生成确定性的产品名称"""
+        rng = self._rng('name', insurer, index)
+        name = (f"「{rng.choice(NAME_PREFIXES)}{rng.choice(NAME_SUFFIXES)}」"
+                f"{rng.choice(NAME_SERIES)}{rng.choice(NAME_EDITIONS)}")
+        # 加序号保证唯一
+        return f"{name} {index + 1}"
+
+    def _series(self, insurer: str, product: int, series_key: str, report_year: int):
+        """生成一条 (购买年份 -> (状态, 实现率)) 序列
+
+        基准实现率由产品和序列决定，报告年度之间只做小幅漂移。
+        """
+        base_rng = self._rng('base', insurer, product, series_key)
+        base = base_rng.gauss(95, 12)
+        slope = base_rng.uniform(-2.0, 1.0)
+        launch_year = base_rng.randint(self.report_years[0] - 15, self.report_years[-1])
+
+        rng = self._rng('cell', insurer, product, series_key, report_year)
+        drift = rng.gauss(0, 2)
+        cells = []
+        for policy_year in range(1, POLICY_YEARS + 2):
+            purchase_year = report_year - min(policy_year, POLICY_YEARS)
+            if purchase_year > launch_year and policy_year <= POLICY_YEARS:
+                status = 'not_launched'
+            else:
+                status = rng.choices(self._statuses, self._weights)[0]
+            rate = None
+            if status == 'normal':
+                rate = max(0, round(base + slope * policy_year + drift + rng.gauss(0, 3)))
+            cells.append((policy_year, purchase_year, status, rate))
+        return cells
+
+    def generate_ctf(self, report_year: int) -> Dict[str, Any]:
+        """周大福格式"""
+        items = []
+        for product in range(self.products):
+            name = self.product_name('ctf', product)
+            if self._rng('closed', 'ctf', product).random() < 0.3:
+                name = f"{name} (Closed to sales)"
+            for currency in self.currencies:
+                for ratio_type in ('Dividend', 'Total Value'):
+                    cells = self._series('ctf', product, f'{currency}:{ratio_type}', report_year)
+                    for policy_year, purchase_year, status, rate in cells[:POLICY_YEARS]:
+                        items.append({
+                            'product_name': name,
+                            'product_name_citation': CTF_CITATION,
+                            'currency': currency,
+                            'currency_citation': CTF_CITATION,
+                            'report_year': report_year,
+                            'report_year_citation': CTF_CITATION,
+                            'policy_year': purchase_year,
+                            'policy_year_citation': CTF_CITATION,
+                            'ratio': None if rate is None else round(rate / 100, 2),
+                            'ratio_citation': CTF_CITATION,
+                            'type': ratio_type,
+                            'type_citation': CTF_CITATION,
+                        })
+        return {'fulfillment_ratios': items}
+
+    def _aia_policy_year(self, policy_year: int, purchase_year: int) -> str:
+        """友邦保单年度字符串"""
+        if policy_year > POLICY_YEARS:
+            return f"第十個保單年度+ ({purchase_year}之前)"
+        return f"第{CHINESE_NUMERALS[policy_year - 1]}個保單年度 ({purchase_year})"
+
+    def generate_aia(self, report_year: int) -> Dict[str, Any]:
+        """友邦格式"""
+        data = {'fulfillment_ratio_for_dividend_bonus': [], 'fulfillment_ratio_for_total_value': []}
+        for product in range(self.products):
+            name = self.product_name('aia', product)
+            # 友邦多数产品不区分货币
+            if self._rng('currency', 'aia', product).random() < 0.9:
+                currencies = ['所有']
+            else:
+                currencies = ['USD' if c == 'USD' else 'HKD/MOP' for c in self.currencies]
+            for section in data:
+                for currency in currencies:
+                    cells = self._series('aia', product, f'{currency}:{section}', report_year)
+                    for policy_year, purchase_year, status, rate in cells:
+                        if status == 'normal':
+                            ratio_text = f"{rate}%"
+                        else:
+                            ratio_text = RAW_STATUS_TEXT['aia'][status]
+                        data[section].append({
+                            'product_name': name,
+                            'product_name_citation': AIA_CITATION,
+                            'policy_year': self._aia_policy_year(policy_year, purchase_year),
+                            'policy_year_citation': AIA_CITATION,
+                            'fulfillment_ratio': ratio_text,
+                            'fulfillment_ratio_citation': AIA_CITATION,
+                            'currency': currency,
+                            'currency_citation': AIA_CITATION,
+                        })
+        return data
+
+    def generate_prudential(self, report_year: int) -> Dict[str, Any]:
+        """保诚格式"""
+        products = []
+        for product in range(self.products):
+            name = self.product_name('prudential', product)
+            payment = self._rng('payment', 'prudential', product).choice(['分期繳費', '整付'])
+            for currency in self.currencies:
+                for category in ('歸原紅利', '特別紅利'):
+                    cells = self._series('prudential', product, f'{currency}:{category}', report_year)
+                    ratios = []
+                    for policy_year, purchase_year, status, rate in cells:
+                        if policy_year > POLICY_YEARS:
+                            label = f"{POLICY_YEARS}+ ({purchase_year} 之前)"
+                        else:
+                            label = f"{policy_year} ({purchase_year})"
+                        ratios.append({
+                            'policy_year': label,
+                            'policy_year_citation': PRUDENTIAL_CITATION,
+                            'percentage': f"{rate}%" if status == 'normal' else RAW_STATUS_TEXT['prudential'][status],
+                            'percentage_citation': PRUDENTIAL_CITATION,
+                        })
+                    products.append({
+                        'product_name': (f"{name} - {payment} ({CURRENCY_NAMES.get(currency, currency)}) "
+                                         f"[{report_year} 報告年度的{category}現金價值分紅實現率]"),
+                        'product_name_citation': PRUDENTIAL_CITATION,
+                        'fulfillment_ratios': ratios,
                     })
-    
-    return pd.DataFrame(records)
-
-
-def create_database(df, db_path='/home/claude/insurance_data.db'):
-    """创建SQLite数据库并导入数据"""
-    
-    conn = sqlite3.connect(db_path)
-    
-    # 创建表
-    create_table_sql = """
-    CREATE TABLE IF NOT EXISTS fulfillment_ratios (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        company TEXT NOT NULL,
-        product_name TEXT NOT NULL,
-        product_type TEXT,
-        category TEXT NOT NULL,
-        currency TEXT NOT NULL,
-        policy_year INTEGER NOT NULL,
-        fulfillment_rate INTEGER,
-        status TEXT,
-        data_year INTEGER NOT NULL,
-        last_updated TEXT NOT NULL,
-        UNIQUE(company, product_name, category, currency, policy_year, data_year)
-    )
-    """
-    
-    conn.execute(create_table_sql)
-    
-    # 导入数据
-    df.to_sql('fulfillment_ratios', conn, if_exists='replace', index=False)
-    
-    # 创建索引
-    conn.execute("""
-        CREATE INDEX IF NOT EXISTS idx_product 
-        ON fulfillment_ratios(product_name)
-    """)
-    
-    conn.execute("""
-        CREATE INDEX IF NOT EXISTS idx_year 
-        ON fulfillment_ratios(policy_year)
-    """)
-    
-    conn.commit()
-    conn.close()
-    
-    print(f"数据库已创建: {db_path}")
-    print(f"总记录数: {len(df)}")
+        return {'prudential_products': products}
+
+    def generate(self, insurer: str, report_year: int) -> Dict[str, Any]:
+        """按公司格式生成一个报告年度的原始数据"""
+        return getattr(self, f'generate_{insurer}')(report_year)
+
+    def estimate_rows(self) -> int:
+        """估算解析后的记录数（每个报告年度 × 公司）"""
+        per_year = 0
+        n_currencies = len(self.currencies)
+        if 'ctf' in self.insurers:
+            per_year += self.products * n_currencies * 2 * POLICY_YEARS
+        if 'aia' in self.insurers:
+            per_year += self.products * 2 * (POLICY_YEARS + 1)
+        if 'prudential' in self.insurers:
+            per_year += self.products * n_currencies * 2 * (POLICY_YEARS + 1)
+        return per_year * len(self.report_years)
+
+    def write(self, output_dir: str) -> List[str]:
+        """写出全部原始文件，返回文件路径列表"""
+        paths = []
+        for report_year in self.report_years:
+            year_dir = os.path.join(output_dir, str(report_year))
+            os.makedirs(year_dir, exist_ok=True)
+            for insurer in self.insurers:
+                path = os.path.join(year_dir, f'synthetic_extract({insurer}).json')
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(self.generate(insurer, report_year), f, ensure_ascii=False, indent=2)
+                paths.append(path)
+        return paths
+
+
+def parse_status_mix(text: str) -> Dict[str, float]:
+    """解析 "normal=0.6,discontinued=0.2" 形式的状态比例"""
+    mix = {}
+    for part in text.split(','):
+        status, weight = part.split('=')
+        mix[status.strip()] = float(weight)
+    unknown = set(mix) - set(DEFAULT_STATUS_MIX)
+    if unknown:
+        raise ValueError(f"未知状态: {sorted(unknown)}")
+    return mix
 
 
 def main():
     """主函数"""
+    arg_parser = argparse.ArgumentParser(description='按原始格式生成合成分红实现率数据')
+    arg_parser.add_argument('--output-dir', default='data/synthetic', help='输出目录')
+    arg_parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    arg_parser.add_argument('--insurers', default=','.join(INSURER_FORMATS),
+                            help='保险公司格式，逗号分隔 (ctf,aia,prudential)')
+    arg_parser.add_argument('--products', type=int, default=50, help='每家公司产品数')
+    arg_parser.add_argument('--currencies', default='USD,HKD', help='货币，逗号分隔')
+    arg_parser.add_argument('--report-years', default='2024', help='报告年度，如 2017-2024 或 2023,2024')
+    arg_parser.add_argument('--status-mix', help='状态比例，如 normal=0.6,discontinued=0.2,not_launched=0.15,no_data=0.05')
+    args = arg_parser.parse_args()
+
+    if '-' in args.report_years:
+        first, last = args.report_years.split('-')
+        report_years = list(range(int(first), int(last) + 1))
+    else:
+        report_years = [int(y) for y in args.report_years.split(',')]
+
+    generator = SyntheticExtractGenerator(
+        seed=args.seed,
+        insurers=args.insurers.split(','),
+        products=args.products,
+        currencies=args.currencies.split(','),
+        report_years=report_years,
+        status_mix=parse_status_mix(args.status_mix) if args.status_mix else None,
+    )
+
     print("=" * 60)
-    print("周大福人寿分红实现率数据集生成器")
+    print("合成原始数据生成器")
     print("=" * 60)
-    
-    # 创建数据集
-    print("\n1. 生成样本数据...")
-    df = create_sample_dataset()
-    
-    # 显示统计信息
-    print(f"\n数据统计:")
-    print(f"  - 总记录数: {len(df)}")
-    print(f"  - 产品数量: {df['product_name'].nunique()}")
-    print(f"  - 货币种类: {', '.join(df['currency'].unique())}")
-    print(f"  - 类别: {', '.join(df['category'].unique())}")
-    
-    # 保存CSV
-    csv_path = '/home/claude/ctf_sample_data.csv'
-    df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-    print(f"\n2. CSV已保存: {csv_path}")
-    
-    # 创建数据库
-    print("\n3. 创建SQLite数据库...")
-    create_database(df)
-    
-    # 显示样例数据
-    print("\n4. 样例数据:")
-    print(df.head(10).to_string())
-    
-    # 按产品分组统计
-    print("\n5. 各产品记录数:")
-    print(df.groupby('product_name').size())
-    
-    return df
+    print(f"  预计解析记录数: {generator.estimate_rows():,}")
+
+    paths = generator.write(args.output_dir)
+    for path in paths:
+        print(f"  ✅ {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
 
 
 if __name__ == "__main__":
-    df = main()
+    main()
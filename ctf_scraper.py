@@ -7,27 +7,43 @@ import requests
 from bs4 import BeautifulSoup
 import pandas as pd
 import re
+import argparse
 from datetime import datetime
+from page_cache import PageCache
 
 class CTFScraper:
-    def __init__(self):
+    def __init__(self, cache: PageCache = None):
         self.url = "https://www.ctflife.com.hk/tc/support/important-information/fulfillment-ratios-dividends"
         self.company_name = "周大福人寿"
         self.data_year = 2024  # 报告年度
+        self.cache = cache if cache is not None else PageCache()
         
     def fetch_page(self):
-        """获取网页内容"""
+        """获取网页内容（同时写入本地缓存）"""
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
         response = requests.get(self.url, headers=headers)
         response.encoding = 'utf-8'
+        self.cache.put(self.url, response.text)
         return response.text
     
+    def load_cached_page(self):
+        """从本地缓存读取最近一次抓取的网页"""
+        cached = self.cache.latest(self.url)
+        if cached is None:
+            raise FileNotFoundError(f"缓存中没有 {self.url} 的页面，请先在线抓取一次")
+        fetched_at, sha256, html = cached
+        print(f"从缓存回放: {fetched_at} ({sha256[:12]})")
+        return html
+    
     def parse_product_tables(self, html_content):
         """解析产品数据表格"""
+        return list(self.iter_records(html_content))
+    
+    def iter_records(self, html_content):
+        """逐表格解析产品数据，边解析边产出记录（供流式管道使用）"""
         soup = BeautifulSoup(html_content, 'html.parser')
-        products_data = []
         
         # 查找所有产品名称（通常在表格前的标题中）
         # 周大福的页面结构：产品名 - 分红人寿保险
@@ -48,11 +64,7 @@ class CTFScraper:
                 continue
             
             # 解析表格数据
-            table_data = self._parse_single_table(table, product_name)
-            if table_data:
-                products_data.extend(table_data)
-        
-        return products_data
+            yield from self._parse_single_table(table, product_name)
     
     def _find_product_name_for_table(self, table):
         """找到表格对应的产品名称"""
@@ -103,6 +115,7 @@ class CTFScraper:
                     year_header = headers[col_idx]
                     # 提取年份数字（如 "1 (2023)" -> 1）
                     policy_year = self._extract_policy_year(year_header)
+                    purchase_year = self._extract_purchase_year(year_header)
                     
                     fulfillment_value = cells[col_idx]
                     
@@ -115,6 +128,7 @@ class CTFScraper:
                         'category': category,  # 週年紅利/復歸紅利/終期紅利等
                         'currency': currency,
                         'policy_year': policy_year,
+                        'purchase_year': purchase_year,
                         'fulfillment_rate': fulfillment_rate,
                         'status': status,  # 如：已停售、未推出、沒有保單等
                         'data_year': self.data_year,
@@ -131,6 +145,14 @@ class CTFScraper:
             return int(match.group(1))
         return None
     
+    def _extract_purchase_year(self, header_text):
+        """从表头提取购买年份"""
+        # 例如: "1 (2023)" -> 2023, "11+ (2013或之前)" -> 2013
+        match = re.search(r'\((\d{4})', header_text)
+        if match:
+            return int(match.group(1))
+        return None
+    
     def _parse_fulfillment_value(self, value_text):
         """解析分红实现率值"""
         value_text = value_text.strip()
@@ -167,12 +189,17 @@ class CTFScraper:
         print(f"总共 {len(df)} 条记录")
         return df
     
-    def run(self):
+    def replay_history(self, since=None):
+        """重新解析缓存中的全部历史页面，逐个返回 (fetched_at, records)"""
+        for _, fetched_at, html in self.cache.iter_pages(self.url, since=since):
+            yield fetched_at, self.parse_product_tables(html)
+    
+    def run(self, replay=False):
         """执行爬取流程"""
         print("开始爬取周大福人寿分红实现率数据...")
         
-        # 获取页面
-        html = self.fetch_page()
+        # 获取页面（回放模式直接读取缓存，不访问网络）
+        html = self.load_cached_page() if replay else self.fetch_page()
         
         # 解析数据
         products_data = self.parse_product_tables(html)
@@ -189,8 +216,21 @@ class CTFScraper:
         return df
 
 if __name__ == "__main__":
-    scraper = CTFScraper()
-    df = scraper.run()
+    arg_parser = argparse.ArgumentParser(description='周大福人寿分红实现率爬虫')
+    arg_parser.add_argument('--replay', action='store_true', help='从本地缓存解析，不访问网络')
+    arg_parser.add_argument('--replay-all', action='store_true', help='重新解析缓存中的全部历史页面')
+    arg_parser.add_argument('--since', help='配合 --replay-all，只回放该时间之后的页面 (ISO格式)')
+    arg_parser.add_argument('--cache-dir', default='data/cache/pages', help='网页缓存目录')
+    args = arg_parser.parse_args()
+    
+    scraper = CTFScraper(cache=PageCache(args.cache_dir))
+    
+    if args.replay_all:
+        for fetched_at, records in scraper.replay_history(since=args.since):
+            print(f"{fetched_at}: {len(records)} 条记录")
+        raise SystemExit(0)
+    
+    df = scraper.run(replay=args.replay)
     
     # 显示样例数据
     print("\n样例数据:")
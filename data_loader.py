@@ -5,8 +5,28 @@ Database Loader for Insurance Dividend Fulfillment Ratios
 
 import sqlite3
 import os
+import argparse
+from contextlib import contextmanager
 from typing import List, Dict, Any
-from data_parser import DataParser, DataValidator
+from data_parser import STATUS_CODES, DataParser, DataValidator, discover_extracts
+from db_connections import connect_writer, write_lock
+from etl_metrics import StageTracer
+from validation_sink import ValidationErrorSink, add_sink_arguments, print_summary, sink_from_args
+
+
+# upsert 冲突目标（与 idx_upsert_key 的列/表达式一致）
+UPSERT_KEY = ('company, product_name, category, currency, '
+              'IFNULL(policy_year, -1), IFNULL(purchase_year, -1), data_year')
+
+
+# 辅助查询索引：索引名 -> 列
+SECONDARY_INDEXES = {
+    'idx_company': 'company',
+    'idx_product': 'product_name',
+    'idx_currency': 'currency',
+    'idx_year': 'policy_year',
+    'idx_status': 'status',
+}
 
 
 class DatabaseLoader:
@@ -18,8 +38,8 @@ class DatabaseLoader:
         self.cursor = None
     
     def connect(self):
-        """连接数据库"""
-        self.conn = sqlite3.connect(self.db_path)
+        """连接数据库（WAL 模式，导入期间应用仍可读取）"""
+        self.conn = connect_writer(self.db_path)
         self.cursor = self.conn.cursor()
     
     def close(self):
@@ -32,7 +52,8 @@ class DatabaseLoader:
         self.connect()
         
         # 创建表
-        self.cursor.execute('''
+        statuses = ', '.join(f"'{code}'" for code in STATUS_CODES)
+        self.cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS fulfillment_ratios (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 company TEXT NOT NULL,
@@ -43,7 +64,7 @@ class DatabaseLoader:
                 policy_year INTEGER,
                 purchase_year INTEGER,
                 fulfillment_rate INTEGER,
-                status TEXT NOT NULL,
+                status TEXT NOT NULL CHECK (status IN ({statuses})),
                 data_year INTEGER NOT NULL,
                 last_updated TEXT NOT NULL,
                 data_source TEXT,
@@ -52,20 +73,55 @@ class DatabaseLoader:
         ''')
         
         # 创建索引
-        indexes = [
-            'CREATE INDEX IF NOT EXISTS idx_company ON fulfillment_ratios(company)',
-            'CREATE INDEX IF NOT EXISTS idx_product ON fulfillment_ratios(product_name)',
-            'CREATE INDEX IF NOT EXISTS idx_currency ON fulfillment_ratios(currency)',
-            'CREATE INDEX IF NOT EXISTS idx_year ON fulfillment_ratios(policy_year)',
-            'CREATE INDEX IF NOT EXISTS idx_status ON fulfillment_ratios(status)',
-        ]
-        
-        for index_sql in indexes:
-            self.cursor.execute(index_sql)
+        self.create_secondary_indexes()
+        self._create_upsert_index()
         
         self.conn.commit()
         print("✅ 数据库表结构初始化完成")
     
+    def create_secondary_indexes(self):
+        """创建辅助查询索引"""
+        for name, column in SECONDARY_INDEXES.items():
+            self.cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON fulfillment_ratios({column})')
+    
+    def drop_secondary_indexes(self):
+        """批量导入前删除辅助索引，导入后再用 create_secondary_indexes() 一次性重建（一般通过 bulk_load() 使用）"""
+        for name in SECONDARY_INDEXES:
+            self.cursor.execute(f'DROP INDEX IF EXISTS {name}')
+    
+    @contextmanager
+    def bulk_load(self):
+        """批量导入：连接并删除辅助索引，结束时（出错时也一样）重建辅助索引、提交并关闭连接
+
+            with loader.bulk_load():
+                loader.bulk_upsert(batch)
+        """
+        self.connect()
+        self.drop_secondary_indexes()
+        try:
+            yield self
+        finally:
+            self.create_secondary_indexes()
+            self.conn.commit()
+            self.close()
+    
+    def _create_upsert_index(self):
+        """批量 upsert 的冲突目标：NULL 的年份视为同一值（表上的 UNIQUE 约束对 NULL 不生效）"""
+        index_sql = f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_upsert_key ON fulfillment_ratios({UPSERT_KEY})
+        '''
+        try:
+            self.cursor.execute(index_sql)
+        except sqlite3.IntegrityError:
+            # 旧数据中已有重复行，保留最后写入的一条
+            self.cursor.execute(f'''
+                DELETE FROM fulfillment_ratios WHERE id NOT IN (
+                    SELECT MAX(id) FROM fulfillment_ratios GROUP BY {UPSERT_KEY}
+                )
+            ''')
+            print(f"⚠️  已删除 {self.cursor.rowcount} 条重复记录")
+            self.cursor.execute(index_sql)
+    
     def clear_data(self, company: str = None):
         """清空数据"""
         self.connect()
@@ -128,8 +184,8 @@ class DatabaseLoader:
                           AND product_name = ? 
                           AND category = ? 
                           AND currency = ? 
-                          AND policy_year = ? 
-                          AND purchase_year = ?
+                          AND policy_year IS ? 
+                          AND purchase_year IS ?
                           AND data_year = ?
                     ''', (
                         record['fulfillment_rate'],
@@ -167,42 +223,65 @@ class DatabaseLoader:
             'total': len(records)
         }
     
-    def get_statistics(self) -> Dict[str, Any]:
-        """获取数据库统计信息"""
+    def bulk_upsert(self, records: List[Dict[str, Any]]) -> int:
+        """批量 upsert（executemany + ON CONFLICT），整批一个事务，返回写入行数
+        
+        调用方负责 connect()/close()，适合由单个写入进程长时间持有连接。
+        """
+        with self.conn:
+            self.conn.executemany(f'''
+                INSERT INTO fulfillment_ratios
+                (company, product_name, product_type, category, currency,
+                 policy_year, purchase_year, fulfillment_rate, status, data_year,
+                 last_updated, data_source)
+                VALUES (:company, :product_name, :product_type, :category, :currency,
+                        :policy_year, :purchase_year, :fulfillment_rate, :status, :data_year,
+                        :last_updated, :data_source)
+                ON CONFLICT ({UPSERT_KEY}) DO UPDATE SET
+                    product_type = excluded.product_type,
+                    fulfillment_rate = excluded.fulfillment_rate,
+                    status = excluded.status,
+                    last_updated = excluded.last_updated,
+                    data_source = excluded.data_source
+            ''', records)
+        return len(records)
+    
+    def get_statistics(self, table: str = 'fulfillment_ratios') -> Dict[str, Any]:
+        """获取数据库统计信息（table 也可以是重构后的兼容视图 fulfillment_ratios_backup）"""
         self.connect()
         
         # 总记录数
-        self.cursor.execute('SELECT COUNT(*) FROM fulfillment_ratios')
+        self.cursor.execute(f'SELECT COUNT(*) FROM {table}')
         total_records = self.cursor.fetchone()[0]
         
         # 按公司统计
-        self.cursor.execute('''
+        self.cursor.execute(f'''
             SELECT company, COUNT(*) as count 
-            FROM fulfillment_ratios 
+            FROM {table} 
             GROUP BY company
         ''')
         by_company = dict(self.cursor.fetchall())
         
         # 按状态统计
-        self.cursor.execute('''
+        self.cursor.execute(f'''
             SELECT status, COUNT(*) as count 
-            FROM fulfillment_ratios 
+            FROM {table} 
             GROUP BY status
         ''')
         by_status = dict(self.cursor.fetchall())
         
         # 按货币统计
-        self.cursor.execute('''
+        self.cursor.execute(f'''
             SELECT currency, COUNT(*) as count 
-            FROM fulfillment_ratios 
+            FROM {table} 
             GROUP BY currency
         ''')
         by_currency = dict(self.cursor.fetchall())
         
         # 产品数量
-        self.cursor.execute('''
+        self.cursor.execute(f'''
             SELECT COUNT(DISTINCT product_name) 
-            FROM fulfillment_ratios
+            FROM {table}
         ''')
         total_products = self.cursor.fetchone()[0]
         
@@ -217,67 +296,121 @@ class DatabaseLoader:
         }
 
 
-def main():
-    """主函数：执行完整的ETL流程"""
-    print("="*60)
-    print("香港保险分红实现率数据导入系统")
-    print("="*60)
-    
-    # 1. 初始化数据库
-    print("\n步骤 1: 初始化数据库")
-    loader = DatabaseLoader('insurance_data.db')
-    loader.init_database()
-    
-    # 2. 清空旧数据（可选）
-    print("\n步骤 2: 清空旧数据")
-    response = input("是否清空现有数据？(y/n): ")
-    if response.lower() == 'y':
-        loader.clear_data()
-    
-    # 3. 解析JSON数据
-    print("\n步骤 3: 解析JSON数据")
-    parser = DataParser(data_year=2024)
-    
-    print("  解析周大福数据...")
-    ctf_records = parser.parse_ctf('/home/ubuntu/upload/pasted_file_WdsFng_extract-data-2026-02-12（ctf）.json')
-    print(f"  ✅ 周大福: {len(ctf_records)} 条记录")
-    
-    print("  解析友邦数据...")
-    aia_records = parser.parse_aia('/home/ubuntu/upload/pasted_file_liy7Iv_extract-data-2026-02-12(aia).json')
-    print(f"  ✅ 友邦: {len(aia_records)} 条记录")
-    
-    print("  解析保诚数据...")
-    pru_records = parser.parse_prudential('/home/ubuntu/upload/pasted_file_RiSJTW_extract-data-2026-02-12(prudential).json')
-    print(f"  ✅ 保诚: {len(pru_records)} 条记录")
-    
-    all_records = ctf_records + aia_records + pru_records
-    print(f"\n  总计: {len(all_records)} 条记录")
-    
-    # 4. 验证数据
-    print("\n步骤 4: 验证数据质量")
-    validation_result = DataValidator.validate_batch(all_records)
-    print(f"  总记录数: {validation_result['total']}")
-    print(f"  有效记录: {validation_result['valid']}")
-    print(f"  无效记录: {validation_result['invalid']}")
-    
-    if validation_result['errors']:
-        print(f"\n  ⚠️  发现 {len(validation_result['errors'])} 个错误:")
-        for error in validation_result['errors'][:5]:  # 只显示前5个
-            print(f"    - {error['product_name']}: {error['errors']}")
-    
-    # 5. 导入数据库
-    print("\n步骤 5: 导入数据到数据库")
-    # 过滤掉无效记录
-    valid_records = [r for r in all_records if DataValidator.validate_record(r)[0]]
-    
-    result = loader.insert_records(valid_records)
-    print(f"  ✅ 新增: {result['inserted']} 条")
-    print(f"  ✅ 更新: {result['updated']} 条")
-    print(f"  ⚠️  跳过: {result['skipped']} 条")
-    
-    # 6. 显示统计信息
-    print("\n步骤 6: 数据库统计信息")
-    stats = loader.get_statistics()
+# 保险公司标识 -> 显示名称
+INSURER_LABELS = {
+    'ctf': '周大福',
+    'aia': '友邦',
+    'prudential': '保诚',
+}
+
+
+def ingest(db_path: str = 'insurance_data.db', input_dir: str = os.path.join('data', 'raw'),
+           data_year: int = 2024, clear: bool = False, bulk: bool = False, batch_size: int = 5000,
+           tracer: StageTracer = None, sink: ValidationErrorSink = None) -> Dict[str, Any]:
+    """非交互式导入：解析 input_dir 下的原始文件，校验后写入待导入表，返回统计信息
+
+    input_dir 下的 <报告年度>/ 子目录使用目录名作为报告年度，其余文件使用 data_year。
+    bulk=True 时导入期间先删除辅助索引，按 batch_size 批量 upsert，最后重建索引。
+    传入 sink 时每条无效记录都写入 sink（按来源文件计数），由调用方关闭。
+    """
+    tracer = tracer or StageTracer()
+    extracts = discover_extracts(input_dir, default_year=data_year)
+    if not extracts:
+        raise FileNotFoundError(f"{input_dir} 下没有找到原始抓取文件")
+
+    # 与其他导入、重构和调度器互斥（等待其完成）
+    with write_lock(db_path), tracer.span('etl'):
+        # 1. 初始化数据库
+        print("\n步骤 1: 初始化数据库")
+        loader = DatabaseLoader(db_path)
+        with tracer.span('init_database'):
+            loader.init_database()
+        
+        # 2. 清空旧数据（可选）
+        if clear:
+            print("\n步骤 2: 清空旧数据")
+            with tracer.span('clear'):
+                loader.clear_data()
+        
+        # 3. 解析JSON数据
+        print("\n步骤 3: 解析JSON数据")
+        parsers: Dict[int, DataParser] = {}
+        
+        parsed = []
+        for insurer, year, json_file in extracts:
+            label = INSURER_LABELS[insurer]
+            parser = parsers.setdefault(year, DataParser(data_year=year))
+            print(f"  解析{label} {year} 数据...")
+            with tracer.span('file', insurer=insurer) as file_span:
+                with tracer.span('parse') as parse_span:
+                    records = parser.parse_file(insurer, json_file, tracer=tracer)
+                    parse_span.set_rows(rows_out=len(records))
+                file_span.set_rows(rows_out=len(records))
+            print(f"  ✅ {label}: {len(records)} 条记录")
+            parsed.append((json_file, records))
+        
+        total = sum(len(records) for _, records in parsed)
+        print(f"\n  总计: {total} 条记录")
+        
+        # 4. 验证数据（按文件，便于按来源文件统计无效记录）
+        print("\n步骤 4: 验证数据质量")
+        invalid = 0
+        by_rule: Dict[str, int] = {}
+        valid_records = []
+        with tracer.span('validate', rows_in=total) as span:
+            for json_file, records in parsed:
+                validation_result = DataValidator.validate_batch(records, sink=sink, source=json_file)
+                invalid += validation_result['invalid']
+                for rule, count in validation_result['by_rule'].items():
+                    by_rule[rule] = by_rule.get(rule, 0) + count
+                valid_records.extend(validation_result['valid_records'])
+            span.set_rows(rows_out=len(valid_records))
+        print(f"  总记录数: {total}")
+        print(f"  有效记录: {len(valid_records)}")
+        print(f"  无效记录: {invalid}")
+        
+        if by_rule:
+            print(f"\n  ⚠️  按规则统计:")
+            for rule, count in sorted(by_rule.items(), key=lambda item: -item[1]):
+                print(f"    - {rule}: {count}")
+        
+        # 5. 导入数据库
+        print("\n步骤 5: 导入数据到数据库")
+        with tracer.span('upsert', rows_in=len(valid_records)) as span:
+            if bulk:
+                written = 0
+                with loader.bulk_load():
+                    for i in range(0, len(valid_records), batch_size):
+                        written += loader.bulk_upsert(valid_records[i:i + batch_size])
+                result = {'written': written}
+                print(f"  ✅ 批量写入: {written} 条")
+            else:
+                result = loader.insert_records(valid_records)
+                written = result['inserted'] + result['updated']
+                print(f"  ✅ 新增: {result['inserted']} 条")
+                print(f"  ✅ 更新: {result['updated']} 条")
+                print(f"  ⚠️  跳过: {result['skipped']} 条")
+            span.set_rows(rows_out=written)
+        
+        # 6. 统计信息
+        with tracer.span('statistics') as span:
+            stats = loader.get_statistics()
+            span.set_rows(rows_in=stats['total_records'])
+
+    return {
+        'files': len(extracts),
+        'parsed': total,
+        'valid': len(valid_records),
+        'invalid': invalid,
+        'by_rule': by_rule,
+        'written': written,
+        'upsert': result,
+        'statistics': stats,
+    }
+
+
+def print_statistics(stats: Dict[str, Any]):
+    """打印数据库统计信息"""
     print(f"  总记录数: {stats['total_records']}")
     print(f"  总产品数: {stats['total_products']}")
     
@@ -292,11 +425,50 @@ def main():
     print(f"\n  按货币分布:")
     for currency, count in stats['by_currency'].items():
         print(f"    - {currency}: {count} 条")
+
+
+def main(argv=None) -> int:
+    """主函数：执行完整的ETL流程（非交互，可用于定时任务）"""
+    arg_parser = argparse.ArgumentParser(description='导入分红实现率数据')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--input-dir', default=os.path.join('data', 'raw'), help='原始文件目录')
+    arg_parser.add_argument('--year', type=int, default=2024, help='报告年度（<年度>/ 子目录下的文件以目录名为准）')
+    arg_parser.add_argument('--clear', action='store_true', help='导入前清空待导入表')
+    arg_parser.add_argument('--bulk', action='store_true', help='批量模式：删除辅助索引后批量 upsert')
+    arg_parser.add_argument('--batch-size', type=int, default=5000, help='批量模式每批行数')
+    arg_parser.add_argument('--trace-jsonl', help='各阶段span记录（JSON Lines）输出文件')
+    arg_parser.add_argument('--prom-textfile', help='Prometheus textfile 输出路径')
+    add_sink_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+
+    tracer = StageTracer(jsonl_path=args.trace_jsonl)
+    sink = sink_from_args(args, args.db)
+    
+    print("="*60)
+    print("香港保险分红实现率数据导入系统")
+    print("="*60)
+    
+    try:
+        result = ingest(args.db, args.input_dir, data_year=args.year, clear=args.clear,
+                        bulk=args.bulk, batch_size=args.batch_size, tracer=tracer, sink=sink)
+    finally:
+        if sink is not None:
+            sink.close()
+    if sink is not None:
+        print("\n无效记录")
+        print_summary(sink.summary())
+    
+    print("\n步骤 6: 数据库统计信息")
+    print_statistics(result['statistics'])
     
     print("\n" + "="*60)
     print("✅ 数据导入完成！")
     print("="*60)
+    
+    if args.prom_textfile:
+        tracer.write_prometheus(args.prom_textfile)
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    raise SystemExit(main())
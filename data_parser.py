@@ -3,15 +3,49 @@
 Data Parser and Cleaner for Insurance Dividend Fulfillment Ratios
 """
 
+import hashlib
 import json
+import os
 import re
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 
+from compact_format import DEFAULT_COMPACT_DIR, compact_path, decode_records, read_compact, write_compact
+from etl_metrics import NullTracer
+
+
+# 状态码 -> 小整数枚举（即 dim_status.id，事实表只存整数，固定不变）
+STATUS_CODES = {
+    'normal': 1,
+    'discontinued': 2,
+    'not_launched': 3,
+    'no_data': 4,
+    'no_dividend': 5,
+    'no_termination': 6,
+    'not_reached_yet': 7,
+    'no_policy': 8,
+}
+
+# 状态码 -> 显示名称（仅在展示时解码）
+STATUS_LABELS = {
+    'normal': '正常',
+    'discontinued': '已停售',
+    'not_launched': '未推出',
+    'no_data': '无数据',
+    'no_dividend': '無分紅',
+    'no_termination': '無保單終結',
+    'not_reached_yet': '未達保單年期',
+    'no_policy': '沒有保單',
+}
+
 
 class DataParser:
     """统一的数据解析器"""
     
+    # 标准化逻辑（正则、保单年度/产品名解析等）变化时递增，使已缓存的紧凑格式失效；
+    # 下面的映射表已计入 fingerprint()，修改映射无需递增
+    PARSER_VERSION = 1
+    
     # 状态码映射
     STATUS_MAPPING = {
         'closed to sales': 'discontinued',
@@ -50,17 +84,64 @@ class DataParser:
         '歸原紅利': '歸原紅利',
         '特别红利': '特別紅利',
         '特別紅利': '特別紅利',
+        '復歸紅利': '歸原紅利',
+        '复归红利': '歸原紅利',
+        '終期分紅': '終期紅利',
+        '终期分红': '終期紅利',
     }
     
-    def __init__(self, data_year: int = 2024):
+    def __init__(self, data_year: int = 2024, compact_dir: Optional[str] = DEFAULT_COMPACT_DIR):
         self.data_year = data_year
         self.last_updated = datetime.now().strftime('%Y-%m-%d')
+        # 紧凑中间格式目录（见 compact_format.py），None 表示每次都解析原始JSON
+        self.compact_dir = compact_dir
+    
+    @classmethod
+    def fingerprint(cls) -> str:
+        """解析器指纹：PARSER_VERSION + 状态/货币/类别映射表的哈希，写入紧凑文件用于判断缓存是否有效"""
+        tables = [cls.PARSER_VERSION, cls.STATUS_MAPPING, cls.CURRENCY_MAPPING, cls.CATEGORY_MAPPING]
+        return hashlib.sha1(json.dumps(tables, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+    
+    @staticmethod
+    def load_json(json_file: str) -> Dict[str, Any]:
+        """读取原始JSON文件"""
+        with open(json_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def parse_file(self, insurer: str, json_file: str, tracer=None) -> List[Dict[str, Any]]:
+        """解析原始文件：紧凑格式有效时直接读取，否则解析原始JSON并写出紧凑格式
+
+        传入 tracer（etl_metrics.StageTracer）时在当前 span 下记录子阶段：
+        缓存命中为 read_compact，未命中为 read / normalize / write_compact。
+        """
+        tracer = tracer or NullTracer()
+        if self.compact_dir is not None:
+            path = compact_path(self.compact_dir, json_file)
+            with tracer.span('read_compact') as span:
+                payload = read_compact(path, json_file, self.fingerprint())
+                if payload is not None and payload['insurer'] == insurer:
+                    records = decode_records(payload, self.data_year, self.last_updated)
+                    span.set_rows(rows_out=len(records))
+                    return records
+        with tracer.span('read'):
+            data = self.load_json(json_file)
+        with tracer.span('normalize') as span:
+            records = getattr(self, f'normalize_{insurer}')(data)
+            span.set_rows(rows_out=len(records))
+        if self.compact_dir is not None:
+            with tracer.span('write_compact', rows_in=len(records)):
+                try:
+                    write_compact(path, json_file, insurer, records, self.fingerprint())
+                except OSError as e:
+                    print(f"⚠️ 无法写出紧凑格式 {os.path.basename(path)}: {e}")
+        return records
     
     def parse_ctf(self, json_file: str) -> List[Dict[str, Any]]:
         """解析周大福JSON数据"""
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
+        return self.parse_file('ctf', json_file)
+    
+    def normalize_ctf(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """将周大福原始数据转换为统一记录格式"""
         records = []
         for item in data.get('fulfillment_ratios', []):
             # 提取产品名称（去除状态标识）
@@ -107,9 +188,10 @@ class DataParser:
     
     def parse_aia(self, json_file: str) -> List[Dict[str, Any]]:
         """解析友邦JSON数据"""
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
+        return self.parse_file('aia', json_file)
+    
+    def normalize_aia(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """将友邦原始数据转换为统一记录格式"""
         records = []
         
         # 处理两种类型的数据
@@ -158,9 +240,10 @@ class DataParser:
     
     def parse_prudential(self, json_file: str) -> List[Dict[str, Any]]:
         """解析保诚JSON数据"""
-        with open(json_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
+        return self.parse_file('prudential', json_file)
+    
+    def normalize_prudential(self, data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """将保诚原始数据转换为统一记录格式"""
         records = []
         
         for product in data.get('prudential_products', []):
@@ -317,72 +400,120 @@ class DataParser:
 
 
 class DataValidator:
-    """数据验证器"""
+    """数据验证器
+    
+    每条校验规则有固定的规则ID（check_record 返回 (规则ID, 错误信息)），
+    便于按规则汇总被拒绝的记录（见 validation_sink.py）。
+    """
+    
+    REQUIRED_FIELDS = ['company', 'product_name', 'category', 'currency',
+                       'status', 'data_year']
     
     @staticmethod
-    def validate_record(record: Dict[str, Any]) -> tuple[bool, List[str]]:
-        """验证单条记录"""
-        errors = []
+    def check_record(record: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """检查单条记录，返回未通过的规则 [(规则ID, 错误信息)]"""
+        failures = []
         
         # 必填字段检查
-        required_fields = ['company', 'product_name', 'category', 'currency', 
-                          'status', 'data_year']
-        for field in required_fields:
+        for field in DataValidator.REQUIRED_FIELDS:
             if not record.get(field):
-                errors.append(f"缺少必填字段: {field}")
+                failures.append((f'missing:{field}', f"缺少必填字段: {field}"))
+        
+        if record.get('status') and record['status'] not in STATUS_CODES:
+            failures.append(('enum:status', f"未知状态码: {record['status']}"))
         
         # policy_year和purchase_year至少要有一个
         if record.get('policy_year') is None and record.get('purchase_year') is None:
-            errors.append("缺少policy_year或purchase_year")
+            failures.append(('missing:year', "缺少policy_year或purchase_year"))
         
         # 数据类型检查
         if record.get('policy_year') is not None and not isinstance(record.get('policy_year'), int):
-            errors.append("policy_year必须是整数或None")
+            failures.append(('type:policy_year', "policy_year必须是整数或None"))
         
         if record.get('purchase_year') is not None and not isinstance(record.get('purchase_year'), int):
-            errors.append("purchase_year必须是整数或None")
+            failures.append(('type:purchase_year', "purchase_year必须是整数或None"))
         
         if record.get('fulfillment_rate') is not None:
             if not isinstance(record['fulfillment_rate'], int):
-                errors.append("fulfillment_rate必须是整数或None")
+                failures.append(('type:fulfillment_rate', "fulfillment_rate必须是整数或None"))
             elif record['fulfillment_rate'] < 0 or record['fulfillment_rate'] > 500:
-                errors.append(f"fulfillment_rate值异常: {record['fulfillment_rate']}")
+                failures.append(('range:fulfillment_rate', f"fulfillment_rate值异常: {record['fulfillment_rate']}"))
         
         # 逻辑检查
         if record.get('status') == 'normal' and record.get('fulfillment_rate') is None:
-            errors.append("状态为normal但fulfillment_rate为空")
+            failures.append(('logic:normal_without_rate', "状态为normal但fulfillment_rate为空"))
         
+        return failures
+    
+    @staticmethod
+    def validate_record(record: Dict[str, Any]) -> tuple[bool, List[str]]:
+        """验证单条记录"""
+        errors = [message for _, message in DataValidator.check_record(record)]
         return len(errors) == 0, errors
     
     @staticmethod
-    def validate_batch(records: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """批量验证记录"""
+    def validate_batch(records: List[Dict[str, Any]], sink=None, source: Optional[str] = None) -> Dict[str, Any]:
+        """批量验证记录
+        
+        errors 只保留前10条详情；by_rule 是全部无效记录按规则的计数；valid_records 是通过验证的记录。
+        传入 sink（ValidationErrorSink）时每条无效记录及其规则都写入 sink，source 为来源文件。
+        """
         total = len(records)
         valid = 0
         invalid = 0
         errors_summary = []
+        by_rule: Dict[str, int] = {}
+        valid_records = []
         
         for i, record in enumerate(records):
-            is_valid, errors = DataValidator.validate_record(record)
-            if is_valid:
+            failures = DataValidator.check_record(record)
+            if not failures:
                 valid += 1
-            else:
-                invalid += 1
-                if invalid <= 10:  # 只记录前10个错误
-                    errors_summary.append({
-                        'record_index': i,
-                        'product_name': record.get('product_name'),
-                        'errors': errors
-                    })
+                valid_records.append(record)
+                continue
+            invalid += 1
+            for rule, _ in failures:
+                by_rule[rule] = by_rule.get(rule, 0) + 1
+            if sink is not None:
+                sink.add(record, failures, source=source, record_index=i)
+            if invalid <= 10:  # 只记录前10个错误详情
+                errors_summary.append({
+                    'record_index': i,
+                    'product_name': record.get('product_name'),
+                    'errors': [message for _, message in failures]
+                })
         
         return {
             'total': total,
             'valid': valid,
             'invalid': invalid,
-            'errors': errors_summary
+            'errors': errors_summary,
+            'by_rule': by_rule,
+            'valid_records': valid_records,
         }
 
 
+# 文件名中的保险公司标识，如 extract-data-2026-02-12(aia).json / （ctf）.json
+_INSURER_RE = re.compile(r'[(（](ctf|aia|prudential)[)）]\.json$')
+
+
+def discover_extracts(root: str, default_year: Optional[int] = None) -> List[Tuple[str, int, str]]:
+    """查找原始抓取文件，返回 [(insurer, data_year, path)]
+
+    报告年度取自上级目录名（4位数字）；直接放在 root 下的文件使用 default_year，未指定则跳过。
+    """
+    extracts = []
+    for dirpath, _, filenames in os.walk(root):
+        dirname = os.path.basename(dirpath)
+        year = int(dirname) if re.fullmatch(r'\d{4}', dirname) else default_year
+        for filename in sorted(filenames):
+            match = _INSURER_RE.search(filename)
+            if match and year is not None:
+                extracts.append((match.group(1), year, os.path.join(dirpath, filename)))
+    # 大文件先解析，减少尾部等待
+    return sorted(extracts, key=lambda e: -os.path.getsize(e[2]))
+
+
 def main():
     """测试函数"""
     parser = DataParser(data_year=2024)
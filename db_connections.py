@@ -0,0 +1,70 @@
+"""
+SQLite 连接约定
+SQLite Connection Conventions for Writers and Readers
+
+- 写入端（导入、重构、派生表刷新）统一使用 WAL 日志模式 + synchronous=NORMAL：
+  写入进行中读者继续读取提交前的一致快照，读者也不会阻塞写入
+- 读者（应用、查询计划检查、导出）统一使用 mode=ro 的 URI 只读打开
+- 调度器发布的快照发布后不再修改，使用 immutable=1 打开，跳过文件锁和变更检测
+- 写入端之间用 <db>.lock 文件锁串行化（write_lock）：手动导入/重构等待锁，调度器拿不到锁时跳过本轮
+"""
+
+import fcntl
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Optional
+from urllib.parse import quote
+
+
+# 写入端等待锁的秒数（多个写入端时由调度器文件锁串行化，这里只兜底）
+WRITER_TIMEOUT = 30.0
+
+
+def reader_uri(db_path: str, immutable: bool = False) -> str:
+    """只读连接的 URI"""
+    path = quote(os.path.abspath(db_path))
+    return f"file:{path}?{'immutable=1' if immutable else 'mode=ro'}"
+
+
+def connect_reader(db_path: str, immutable: bool = False, check_same_thread: bool = True) -> sqlite3.Connection:
+    """只读连接；immutable=True 只能用于发布后不再修改的快照文件"""
+    return sqlite3.connect(reader_uri(db_path, immutable), uri=True, check_same_thread=check_same_thread)
+
+
+def connect_writer(db_path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+    """写入连接：WAL 模式（持久化在数据库文件中）+ synchronous=NORMAL"""
+    conn = sqlite3.connect(db_path, timeout=WRITER_TIMEOUT, check_same_thread=check_same_thread)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    return conn
+
+
+def lock_path_for(db_path: str) -> str:
+    """写入锁文件路径"""
+    return f'{db_path}.lock'
+
+
+@contextmanager
+def write_lock(db_path: str, blocking: bool = True, lock_path: Optional[str] = None):
+    """写入端之间的文件锁：导入、回填、重构和调度器每轮都持有，彼此不会重叠
+
+    blocking=True 时等待其他写入端完成后 yield True；
+    blocking=False 时不等待，获得锁 yield True，已被其他进程持有时 yield False。
+    同一进程内不可嵌套获取（flock 按打开的文件区分）。
+    """
+    lock_path = lock_path or lock_path_for(db_path)
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'a') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not blocking:
+                yield False
+                return
+            print(f"⏳ 其他导入/重构正在写入 {db_path}，等待完成...")
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,182 @@
+"""
+ETL 阶段计时与行数统计模块
+Per-stage Timing and Row-count Instrumentation for the ETL
+
+用法::
+
+    tracer = StageTracer(jsonl_path='etl_trace.jsonl')
+    with tracer.span('file', insurer='aia') as file_span:
+        with tracer.span('parse') as span:
+            records = ...
+            span.set_rows(rows_out=len(records))
+    tracer.write_prometheus('/var/lib/node_exporter/textfile/etl.prom')
+
+span 可以嵌套（file -> parse -> normalize），结束时以 JSON Lines 输出一行，
+也可汇总为 Prometheus textfile 供 node exporter 采集。
+"""
+
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, TextIO
+
+
+class Span:
+    """一个计时区间"""
+
+    def __init__(self, name: str, parent: Optional['Span'] = None,
+                 rows_in: Optional[int] = None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.span_id = uuid.uuid4().hex[:16]
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.attrs = attrs
+        self.status = 'ok'
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    @property
+    def path(self) -> str:
+        """从根到当前span的名称路径，如 etl/file/parse"""
+        if self.parent is None:
+            return self.name
+        return f'{self.parent.path}/{self.name}'
+
+    @property
+    def labels(self) -> Dict[str, Any]:
+        """继承父span的属性（如 insurer），子span可覆盖"""
+        labels = dict(self.parent.labels) if self.parent else {}
+        labels.update(self.attrs)
+        return labels
+
+    def set_rows(self, rows_in: Optional[int] = None, rows_out: Optional[int] = None):
+        """记录输入/输出行数"""
+        if rows_in is not None:
+            self.rows_in = rows_in
+        if rows_out is not None:
+            self.rows_out = rows_out
+
+    @property
+    def rows_per_sec(self) -> Optional[float]:
+        rows = self.rows_out if self.rows_out is not None else self.rows_in
+        if rows is None or not self.duration:
+            return None
+        return rows / self.duration
+
+    def to_dict(self, trace_id: str) -> Dict[str, Any]:
+        rows_per_sec = self.rows_per_sec
+        return {
+            'ts': round(self.start_time, 6),
+            'trace_id': trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'name': self.name,
+            'path': self.path,
+            'attrs': self.labels,
+            'status': self.status,
+            'duration_seconds': round(self.duration, 6),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_sec': round(rows_per_sec, 1) if rows_per_sec is not None else None,
+        }
+
+
+class StageTracer:
+    """嵌套span记录器"""
+
+    def __init__(self, jsonl_path: Optional[str] = None, stream: Optional[TextIO] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.jsonl_path = jsonl_path
+        self.stream = stream
+        self.finished: List[Span] = []
+        self._stack: List[Span] = []
+
+    @contextmanager
+    def span(self, name: str, rows_in: Optional[int] = None, **attrs):
+        """开启一个span，嵌套在当前活动span之下"""
+        parent = self._stack[-1] if self._stack else None
+        span = Span(name, parent=parent, rows_in=rows_in, **attrs)
+        self._stack.append(span)
+        try:
+            yield span
+        except BaseException:
+            span.status = 'error'
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._start
+            self._stack.pop()
+            self.finished.append(span)
+            self._emit(span)
+
+    def _emit(self, span: Span):
+        """输出一行JSON"""
+        line = json.dumps(span.to_dict(self.trace_id), ensure_ascii=False)
+        if self.stream is not None:
+            print(line, file=self.stream)
+        if self.jsonl_path:
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """按 (路径, 标签) 汇总耗时和行数"""
+        groups: Dict[tuple, Dict[str, Any]] = {}
+        for span in self.finished:
+            labels = {k: str(v) for k, v in span.labels.items()}
+            key = (span.path, tuple(sorted(labels.items())))
+            group = groups.setdefault(key, {
+                'stage': span.path, 'labels': labels,
+                'duration_seconds': 0.0, 'rows_in': 0, 'rows_out': 0, 'count': 0,
+            })
+            group['duration_seconds'] += span.duration
+            group['rows_in'] += span.rows_in or 0
+            group['rows_out'] += span.rows_out or 0
+            group['count'] += 1
+        return list(groups.values())
+
+    def write_prometheus(self, path: str, prefix: str = 'etl'):
+        """写出 Prometheus textfile（先写临时文件再原子替换）"""
+        metrics = {
+            'stage_duration_seconds': ('gauge', '阶段耗时（秒）', lambda g: g['duration_seconds']),
+            'stage_rows_in': ('gauge', '阶段输入行数', lambda g: g['rows_in']),
+            'stage_rows_out': ('gauge', '阶段输出行数', lambda g: g['rows_out']),
+            'stage_rows_per_second': (
+                'gauge', '阶段吞吐量（行/秒）',
+                lambda g: (g['rows_out'] or g['rows_in']) / g['duration_seconds']
+                if g['duration_seconds'] else 0),
+        }
+        summary = self.summary()
+        lines = []
+        for metric, (metric_type, help_text, value_of) in metrics.items():
+            name = f'{prefix}_{metric}'
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for group in summary:
+                labels = {'stage': group['stage'], **group['labels']}
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value_of(group):.6g}')
+        lines.append(f'# HELP {prefix}_last_run_timestamp_seconds 最近一次运行完成时间')
+        lines.append(f'# TYPE {prefix}_last_run_timestamp_seconds gauge')
+        lines.append(f'{prefix}_last_run_timestamp_seconds {time.time():.3f}')
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+class NullTracer:
+    """不记录任何内容的 tracer（调用方未传入 tracer 时使用），span 接口与 StageTracer 相同"""
+
+    @contextmanager
+    def span(self, name: str, rows_in: Optional[int] = None, **attrs):
+        yield Span(name, rows_in=rows_in, **attrs)
+
+
+def _escape_label(value: Any) -> str:
+    """Prometheus 标签值转义"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
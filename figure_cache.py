@@ -0,0 +1,96 @@
+"""
+图表缓存模块
+Shared LRU Cache for Serialized Plotly Figures
+
+按 (数据库版本, 规范化后的筛选条件, 图表类型) 缓存图表的 JSON 序列化结果：
+- 筛选条件不变时（例如只是切换标签页），直接反序列化，不再重新构建 go.Figure
+- 进程内所有会话共享，热门产品的图表对所有用户都是即时渲染
+- 按序列化后的字节数做 LRU 淘汰，内存占用有上限
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def database_version(db_path: str) -> str:
+    """数据库版本：文件（及WAL文件）的大小和修改时间，数据库被重写后自动变化"""
+    parts = []
+    for path in (db_path, f'{db_path}-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        parts.append(f'{stat.st_size}:{stat.st_mtime_ns}')
+    return '/'.join(parts)
+
+
+def figure_key(db_version: str, filters: Dict[str, Any], kind: str) -> str:
+    """缓存键：筛选条件规范化（去掉空值、列表排序、键排序）后取哈希"""
+    normalized = {}
+    for name, value in filters.items():
+        if value is None or value == [] or value == '全部':
+            continue
+        if isinstance(value, (list, tuple, set)):
+            # 列表型筛选条件都是年份（可能是 numpy 整数或浮点）
+            value = sorted(int(v) for v in value)
+        normalized[name] = value
+    payload = json.dumps([db_version, kind, normalized], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class FigureCache:
+    """按字节数限制大小的 LRU 缓存（线程安全）"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, figure_json: str):
+        size = len(figure_json.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size_bytes -= len(old.encode('utf-8'))
+            self._entries[key] = figure_json
+            self.size_bytes += size
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted.encode('utf-8'))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'size_bytes': self.size_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,117 @@
+"""
+网页原始内容缓存模块
+Content-addressed Raw Page Cache for Scrapers
+
+每次抓取的网页以 gzip 压缩后按内容哈希(SHA-256)存储，
+索引库记录 (URL, 抓取时间, 内容哈希)，相同内容只存一份。
+解析逻辑调整或 ETL 重跑时可直接从缓存回放，无需访问网络。
+"""
+
+import gzip
+import hashlib
+import os
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+
+from db_connections import connect_writer
+
+
+class PageCache:
+    """内容寻址的网页缓存"""
+
+    def __init__(self, cache_dir: str = 'data/cache/pages'):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_path = os.path.join(cache_dir, 'index.db')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._init_index()
+
+    def _connect(self):
+        """连接索引库"""
+        return connect_writer(self.index_path)
+
+    def _init_index(self):
+        """初始化索引表"""
+        conn = self._connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT NOT NULL,
+                fetched_at TEXT NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (url, fetched_at)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_sha256 ON pages(sha256)')
+        conn.commit()
+        conn.close()
+
+    def _object_path(self, sha256: str) -> str:
+        """内容哈希对应的对象文件路径（按前两位分目录）"""
+        return os.path.join(self.objects_dir, sha256[:2], f'{sha256}.html.gz')
+
+    def put(self, url: str, content: str, fetched_at: Optional[str] = None) -> str:
+        """保存一次抓取结果，返回内容哈希"""
+        data = content.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+        fetched_at = fetched_at or datetime.now().isoformat(timespec='seconds')
+
+        path = self._object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.tmp'
+            with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO pages (url, fetched_at, sha256, size) VALUES (?, ?, ?, ?)',
+            (url, fetched_at, sha256, len(data))
+        )
+        conn.commit()
+        conn.close()
+        return sha256
+
+    def get(self, sha256: str) -> str:
+        """按内容哈希读取网页"""
+        with gzip.open(self._object_path(sha256), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def latest(self, url: str) -> Optional[Tuple[str, str, str]]:
+        """获取某URL最近一次抓取: (fetched_at, sha256, html)"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT fetched_at, sha256 FROM pages WHERE url = ? ORDER BY fetched_at DESC LIMIT 1',
+            (url,)
+        ).fetchone()
+        conn.close()
+        if row is None:
+            return None
+        return row[0], row[1], self.get(row[1])
+
+    def iter_pages(self, url: Optional[str] = None,
+                   since: Optional[str] = None) -> Iterator[Tuple[str, str, str]]:
+        """按抓取时间顺序遍历缓存页面: (url, fetched_at, html)
+
+        相同内容只解压一次。
+        """
+        sql = 'SELECT url, fetched_at, sha256 FROM pages WHERE 1=1'
+        params = []
+        if url:
+            sql += ' AND url = ?'
+            params.append(url)
+        if since:
+            sql += ' AND fetched_at >= ?'
+            params.append(since)
+        sql += ' ORDER BY fetched_at'
+
+        conn = self._connect()
+        rows = conn.execute(sql, params).fetchall()
+        conn.close()
+
+        last_sha, last_html = None, None
+        for page_url, fetched_at, sha256 in rows:
+            if sha256 != last_sha:
+                last_sha, last_html = sha256, self.get(sha256)
+            yield page_url, fetched_at, last_html
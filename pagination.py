@@ -0,0 +1,85 @@
+"""
+明细表分页查询
+Keyset Pagination for the Detail Table
+
+明细表按 公司、产品、货币 升序，购买年份、报告年度 降序排列。
+查询直接走维度表唯一索引 + 事实表覆盖索引 idx_rates_product_curve（反向扫描），
+排序由索引顺序满足，不需要临时B树；翻页用上一页最后一行作为游标（keyset），
+每次只读取一页数据，耗时与结果集总行数无关。总行数由 metric_rollups 提供。
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+# (列名, SQL表达式)
+PAGE_COLUMNS = [
+    ('company', 'c.name'),
+    ('product_name', 'p.name'),
+    ('currency', 'cu.code'),
+    ('purchase_year', 'f.purchase_year'),
+    ('data_year', 'f.data_year'),
+    ('reversionary_bonus_rate', 'f.reversionary_bonus_rate'),
+    ('special_bonus_rate', 'f.special_bonus_rate'),
+    ('annual_bonus_rate', 'f.annual_bonus_rate'),
+    ('terminal_bonus_rate', 'f.terminal_bonus_rate'),
+    ('total_cash_value_rate', 'f.total_cash_value_rate'),
+]
+
+# 游标：上一页最后一行的排序键 (company, product_name, currency, purchase_year, data_year)
+PageCursor = Tuple[str, str, str, int, int]
+
+_KEYSET_CONDITION = '''(c.name, p.name) >= (?, ?)
+  AND ((c.name, p.name, cu.code) > (?, ?, ?)
+       OR ((c.name, p.name, cu.code) = (?, ?, ?) AND (f.purchase_year, f.data_year) < (?, ?)))'''
+
+
+def page_query(company: Optional[str] = None, product_name: Optional[str] = None,
+               currency: Optional[str] = None, purchase_years: Optional[Sequence[int]] = None,
+               cursor: Optional[PageCursor] = None, limit: int = 50) -> Tuple[str, List[Any]]:
+    """生成一页数据的 SQL 和参数（多取一行用于判断是否还有下一页）"""
+    clauses, params = [], []
+    for expr, value in (('c.name', company), ('p.name', product_name), ('cu.code', currency)):
+        if value is not None:
+            clauses.append(f'{expr} = ?')
+            params.append(value)
+    if purchase_years:
+        clauses.append(f"f.purchase_year IN ({', '.join('?' * len(purchase_years))})")
+        params.extend(int(y) for y in purchase_years)
+    if cursor is not None:
+        company_key, product_key, currency_key, year_key, data_year_key = cursor
+        clauses.append(_KEYSET_CONDITION)
+        params.extend([company_key, product_key,
+                       company_key, product_key, currency_key,
+                       company_key, product_key, currency_key, year_key, data_year_key])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    sql = f'''
+        SELECT {', '.join(f'{expr} AS {name}' for name, expr in PAGE_COLUMNS)}
+        FROM dim_company c
+        JOIN dim_product p ON p.company_id = c.id
+        JOIN fulfillment_rates f ON f.product_id = p.id
+        JOIN dim_currency cu ON cu.id = f.currency_id
+        {where}
+        ORDER BY c.name, p.name, cu.code, f.purchase_year DESC, f.data_year DESC
+        LIMIT ?
+    '''
+    params.append(limit + 1)
+    return sql, params
+
+
+def fetch_page(conn, filters: Dict[str, Any], cursor: Optional[PageCursor] = None,
+               limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[PageCursor]]:
+    """读取一页数据，返回 (行列表, 下一页游标)；没有下一页时游标为 None
+
+    conn 可以是 sqlite3 连接或 query_engine 中的查询引擎。
+    """
+    sql, params = page_query(cursor=cursor, limit=limit, **filters)
+    rows = conn.execute(sql, params).fetchall()
+    names = [name for name, _ in PAGE_COLUMNS]
+    records = [dict(zip(names, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = records[-1]
+        next_cursor = (last['company'], last['product_name'], last['currency'],
+                       last['purchase_year'], last['data_year'])
+    return records, next_cursor
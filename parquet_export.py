@@ -0,0 +1,196 @@
+"""
+Parquet 分区导出模块
+Partitioned Parquet Export for Analytics Consumers
+
+将宽表 product_fulfillment_rates 和长格式历史表导出为按 company / data_year
+分区的 Parquet 数据集（Hive目录风格）：
+- 字符串列使用字典编码，写入行组统计信息，便于谓词下推
+- 每个分区记录内容哈希，刷新时只重写发生变化的分区
+- 读取端可使用 memory_map 零拷贝加载
+
+需要可选依赖 pyarrow。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+
+from db_connections import connect_reader
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow 为可选依赖
+    pa = None
+    pq = None
+
+
+# 数据集名称 -> 候选源表（按顺序取第一个存在的）
+EXPORT_DATASETS = {
+    'fulfillment_rates': ['product_fulfillment_rates'],
+    'fulfillment_history': ['fulfillment_ratios_backup', 'fulfillment_ratios'],
+}
+
+PARTITION_COLUMNS = ('company', 'data_year')
+
+MANIFEST_NAME = '_manifest.json'
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet导出需要 pyarrow，请先执行: pip install pyarrow")
+
+
+def _arrow_type(declared: str):
+    """SQLite 声明类型 -> Arrow 类型"""
+    declared = (declared or '').upper()
+    if 'INT' in declared:
+        return pa.int64()
+    if any(t in declared for t in ('REAL', 'FLOA', 'DOUB')):
+        return pa.float64()
+    return pa.string()
+
+
+class ParquetExporter:
+    """增量分区Parquet导出器"""
+
+    def __init__(self, db_path: str = 'insurance_data.db', output_dir: str = 'data/parquet',
+                 compression: str = 'zstd', row_group_size: int = 64 * 1024):
+        _require_pyarrow()
+        self.db_path = db_path
+        self.output_dir = output_dir
+        self.compression = compression
+        self.row_group_size = row_group_size
+
+    def _source_table(self, conn: sqlite3.Connection, candidates: List[str]) -> Optional[str]:
+        for name in candidates:
+            row = conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (name,)).fetchone()
+            if row is not None:
+                return name
+        return None
+
+    def _partition_dir(self, dataset: str, company: str, data_year: int) -> str:
+        return os.path.join(self.output_dir, dataset,
+                            f'company={quote(company, safe="")}', f'data_year={data_year}')
+
+    def _load_manifest(self, dataset: str) -> Dict[str, Any]:
+        path = os.path.join(self.output_dir, dataset, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return {'partitions': {}}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self, dataset: str, manifest: Dict[str, Any]):
+        path = os.path.join(self.output_dir, dataset, MANIFEST_NAME)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def export_dataset(self, conn: sqlite3.Connection, dataset: str, table: str) -> Dict[str, int]:
+        """导出一个数据集，返回 {'written', 'unchanged', 'removed'}"""
+        columns_info = conn.execute(f'PRAGMA table_info({table})').fetchall()
+        columns = [c[1] for c in columns_info if c[1] not in PARTITION_COLUMNS and c[1] != 'id']
+        schema = pa.schema([(c[1], _arrow_type(c[2])) for c in columns_info if c[1] in columns])
+        order_by = ', '.join(c for c in ('product_name', 'currency', 'category', 'purchase_year', 'policy_year')
+                             if c in columns)
+
+        os.makedirs(os.path.join(self.output_dir, dataset), exist_ok=True)
+        manifest = self._load_manifest(dataset)
+        old_partitions = manifest.get('partitions', {})
+        new_partitions = {}
+        stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+
+        partitions = conn.execute(
+            f'SELECT DISTINCT company, data_year FROM {table} ORDER BY company, data_year'
+        ).fetchall()
+        for company, data_year in partitions:
+            rows = conn.execute(
+                f'SELECT {", ".join(columns)} FROM {table} '
+                f'WHERE company = ? AND data_year = ? ORDER BY {order_by}',
+                (company, data_year)
+            ).fetchall()
+            digest = hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()
+            key = f'{company}/{data_year}'
+            new_partitions[key] = {'sha256': digest, 'rows': len(rows)}
+
+            partition_dir = self._partition_dir(dataset, company, data_year)
+            if old_partitions.get(key, {}).get('sha256') == digest and os.path.isdir(partition_dir):
+                stats['unchanged'] += 1
+                continue
+
+            arrays = [pa.array([row[i] for row in rows], type=field.type)
+                      for i, field in enumerate(schema)]
+            arrow_table = pa.Table.from_arrays(arrays, schema=schema)
+
+            os.makedirs(partition_dir, exist_ok=True)
+            path = os.path.join(partition_dir, 'part-0.parquet')
+            tmp_path = f'{path}.tmp'
+            pq.write_table(
+                arrow_table, tmp_path,
+                compression=self.compression,
+                use_dictionary=True,
+                write_statistics=True,
+                row_group_size=self.row_group_size,
+            )
+            os.replace(tmp_path, path)
+            stats['written'] += 1
+
+        # 删除源数据中已不存在的分区
+        for key in set(old_partitions) - set(new_partitions):
+            company, data_year = key.rsplit('/', 1)
+            partition_dir = self._partition_dir(dataset, company, int(data_year))
+            if os.path.isdir(partition_dir):
+                shutil.rmtree(partition_dir)
+            stats['removed'] += 1
+
+        manifest['partitions'] = new_partitions
+        manifest['source_table'] = table
+        self._save_manifest(dataset, manifest)
+        return stats
+
+    def export(self) -> Dict[str, Dict[str, int]]:
+        """导出全部数据集"""
+        conn = connect_reader(self.db_path)
+        results = {}
+        try:
+            for dataset, candidates in EXPORT_DATASETS.items():
+                table = self._source_table(conn, candidates)
+                if table is None:
+                    print(f"⚠️  {dataset}: 未找到源表 {candidates}，跳过")
+                    continue
+                results[dataset] = self.export_dataset(conn, dataset, table)
+        finally:
+            conn.close()
+        return results
+
+
+def read_dataset(path: str, filters: Optional[List[tuple]] = None, columns: Optional[List[str]] = None):
+    """读取导出的数据集（分区裁剪 + 行组统计谓词下推 + memory map）
+
+    示例: read_dataset('data/parquet/fulfillment_rates', filters=[('company', '=', '保诚保险')])
+    """
+    _require_pyarrow()
+    return pq.read_table(path, filters=filters, columns=columns, memory_map=True)
+
+
+def main():
+    """主函数"""
+    arg_parser = argparse.ArgumentParser(description='导出分区Parquet数据集')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--output-dir', default='data/parquet', help='输出目录')
+    args = arg_parser.parse_args()
+
+    results = ParquetExporter(args.db, args.output_dir).export()
+    for dataset, stats in results.items():
+        print(f"✅ {dataset}: 重写 {stats['written']} 个分区, "
+              f"未变化 {stats['unchanged']} 个, 删除 {stats['removed']} 个")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+流式数据管道模块
+Streaming Scrape -> Normalize -> Validate -> Load Pipeline
+
+各阶段通过有界队列连接，下游处理不过来时上游自动阻塞（背压），
+内存占用与数据总量无关；入库端按批次写入，无需中间CSV文件。
+"""
+
+import argparse
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from data_loader import DatabaseLoader
+from data_parser import DataParser, DataValidator
+from db_connections import write_lock
+
+
+# 队列结束标记
+_DONE = object()
+
+# 出错停止后等待各阶段线程退出的最长秒数
+_JOIN_TIMEOUT = 5.0
+
+# 爬虫状态 -> 统一状态码
+SCRAPER_STATUS_MAPPING = {
+    'normal': 'normal',
+    'discontinued': 'discontinued',
+    'not_launched': 'not_launched',
+    'no_policy': 'no_policy',
+    'no_dividend': 'no_dividend',
+    'no_policy_terminated': 'no_termination',
+    'not_yet_reached': 'not_reached_yet',
+}
+
+
+class RecordNormalizer:
+    """将爬虫原始记录转换为 DatabaseLoader.insert_records 所需的格式"""
+
+    def __init__(self, data_source: str = '', parser: Optional[DataParser] = None):
+        self.data_source = data_source
+        self.parser = parser or DataParser()
+
+    def normalize(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """标准化单条记录"""
+        return {
+            'company': record['company'],
+            'product_name': record['product_name'].strip(),
+            'product_type': record.get('product_type'),
+            'category': self.parser._normalize_category(record.get('category', '')),
+            'currency': self.parser._normalize_currency(record.get('currency', '')),
+            'policy_year': record.get('policy_year'),
+            'purchase_year': record.get('purchase_year'),
+            'fulfillment_rate': record.get('fulfillment_rate'),
+            'status': SCRAPER_STATUS_MAPPING.get(record.get('status'), 'no_data'),
+            'data_year': record['data_year'],
+            'last_updated': record.get('last_updated') or self.parser.last_updated,
+            'data_source': record.get('data_source') or self.data_source,
+        }
+
+
+class StreamingPipeline:
+    """有界队列连接的流式ETL管道"""
+
+    def __init__(self, loader: DatabaseLoader, normalizer: RecordNormalizer,
+                 queue_size: int = 1000, batch_size: int = 500,
+                 flush_interval: float = 1.0):
+        self.loader = loader
+        self.normalizer = normalizer
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval  # 批次未满时最长等待秒数
+
+        self.stats = {
+            'fetched': 0,
+            'invalid': 0,
+            'inserted': 0,
+            'updated': 0,
+            'skipped': 0,
+            'batches': 0,
+        }
+        self._errors = []
+        # 任一阶段出错时置位，其余阶段不再阻塞在队列上
+        self._stop = threading.Event()
+
+    def _fail(self, error: Exception):
+        self._errors.append(error)
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """放入队列（队列满时阻塞），管道已停止时放弃并返回 False"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """取出队列元素，管道已停止时返回 _DONE"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _produce(self, source: Iterable[Dict[str, Any]], raw_q: queue.Queue):
+        """阶段1：抓取/解析，产出原始记录"""
+        try:
+            for record in source:
+                if not self._put(raw_q, record):
+                    break
+                self.stats['fetched'] += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(raw_q, _DONE)
+
+    def _transform(self, raw_q: queue.Queue, valid_q: queue.Queue):
+        """阶段2：标准化 + 验证"""
+        try:
+            while True:
+                record = self._get(raw_q)
+                if record is _DONE:
+                    break
+                normalized = self.normalizer.normalize(record)
+                is_valid, _ = DataValidator.validate_record(normalized)
+                if is_valid:
+                    if not self._put(valid_q, normalized):
+                        break
+                else:
+                    self.stats['invalid'] += 1
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(valid_q, _DONE)
+
+    def _flush(self, batch):
+        """阶段3：批量写入数据库"""
+        result = self.loader.insert_records(batch, batch_size=len(batch))
+        for key in ('inserted', 'updated', 'skipped'):
+            self.stats[key] += result[key]
+        self.stats['batches'] += 1
+
+    def run(self, source: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """运行管道，返回统计信息"""
+        raw_q = queue.Queue(maxsize=self.queue_size)
+        valid_q = queue.Queue(maxsize=self.queue_size)
+        self._errors = []
+        self._stop.clear()
+        start = time.perf_counter()
+
+        workers = [
+            threading.Thread(target=self._produce, args=(source, raw_q), daemon=True),
+            threading.Thread(target=self._transform, args=(raw_q, valid_q), daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        # 入库阶段在当前线程执行：批次满或等待超时即提交
+        try:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while not self._stop.is_set():
+                timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    record = valid_q.get(timeout=timeout)
+                except queue.Empty:
+                    record = None
+
+                if record is _DONE:
+                    break
+                if record is not None:
+                    batch.append(record)
+                if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                    self._flush(batch)
+                    batch = []
+                if time.monotonic() >= deadline:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and not self._stop.is_set():
+                self._flush(batch)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for worker in workers:
+                worker.join(timeout=_JOIN_TIMEOUT)
+        if self._errors:
+            raise self._errors[0]
+
+        self.stats['elapsed_seconds'] = round(time.perf_counter() - start, 3)
+        return self.stats
+
+
+def main():
+    """主函数：抓取周大福数据并直接流式入库"""
+    from ctf_scraper import CTFScraper
+
+    arg_parser = argparse.ArgumentParser(description='流式抓取并导入分红实现率数据')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--replay', action='store_true', help='从本地网页缓存解析，不访问网络')
+    arg_parser.add_argument('--batch-size', type=int, default=500, help='每批写入记录数')
+    arg_parser.add_argument('--queue-size', type=int, default=1000, help='阶段间队列容量')
+    args = arg_parser.parse_args()
+
+    scraper = CTFScraper()
+    html = scraper.load_cached_page() if args.replay else scraper.fetch_page()
+
+    # 与其他导入、重构和调度器互斥（等待其完成）
+    with write_lock(args.db):
+        loader = DatabaseLoader(args.db)
+        loader.init_database()
+
+        pipeline = StreamingPipeline(
+            loader,
+            RecordNormalizer(data_source=scraper.url, parser=DataParser(data_year=scraper.data_year)),
+            queue_size=args.queue_size,
+            batch_size=args.batch_size,
+        )
+        stats = pipeline.run(scraper.iter_records(html))
+
+    print(f"✅ 抓取: {stats['fetched']} 条")
+    print(f"⚠️  无效: {stats['invalid']} 条")
+    print(f"✅ 新增: {stats['inserted']} 条, 更新: {stats['updated']} 条, 跳过: {stats['skipped']} 条")
+    print(f"⏱  耗时: {stats['elapsed_seconds']} 秒 ({stats['batches']} 批)")
+
+
+if __name__ == '__main__':
+    main()
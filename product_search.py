@@ -0,0 +1,179 @@
+"""
+产品名称模糊搜索模块
+FTS5-backed Fuzzy Product Search with Traditional/Simplified Folding
+
+产品名称统一折叠（全角转半角、繁体转简体、去除括号/空白/标点、转小写）后
+写入 SQLite FTS5 trigram 索引：
+- 3个字符以上：trigram 子串匹配，无结果时依次退化为 trigram OR、bigram 模糊匹配（容错）
+- 1~2个字符：在折叠后的名称上做前缀/子串匹配
+排序：前缀匹配优先，其次 bm25 相关度，再按名称长度。
+"""
+
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db_connections import connect_reader, connect_writer
+from t2s_table import SIMPLIFIED, TRADITIONAL
+
+
+# 繁体字 -> 简体字（OpenCC 单字对照，仅用于搜索折叠）
+_T2S = str.maketrans(TRADITIONAL, SIMPLIFIED)
+
+
+def fold_text(text: str) -> str:
+    """搜索用折叠：全角->半角、繁->简、小写，并去除非字母数字字符"""
+    text = unicodedata.normalize('NFKC', text or '').lower().translate(_T2S)
+    return ''.join(ch for ch in text if ch.isalnum())
+
+
+class ProductSearchIndex:
+    """基于 FTS5 trigram 的产品名称索引"""
+
+    def __init__(self, db_path: str = 'insurance_data.db', read_only: bool = False, immutable: bool = False):
+        self.db_path = db_path
+        if read_only:
+            self.conn = connect_reader(db_path, immutable=immutable, check_same_thread=False)
+        else:
+            self.conn = connect_writer(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_names(cls, names: Iterable[Tuple[str, str]]) -> 'ProductSearchIndex':
+        """由 (公司, 产品名称) 列表构建内存索引（数据库中尚无索引表时使用）"""
+        index = cls(':memory:')
+        index.create_tables()
+        index._load(names)
+        return index
+
+    def close(self):
+        self.conn.close()
+
+    def exists(self) -> bool:
+        """数据库中是否已有索引表"""
+        row = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_search'"
+        ).fetchone()
+        return row is not None
+
+    def create_tables(self):
+        """创建产品目录表和FTS5索引"""
+        self.conn.executescript('''
+            DROP TABLE IF EXISTS product_search;
+            DROP TABLE IF EXISTS product_catalog;
+            CREATE TABLE product_catalog (
+                id INTEGER PRIMARY KEY,
+                company TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                folded TEXT NOT NULL,
+                UNIQUE(company, product_name)
+            );
+            CREATE VIRTUAL TABLE product_search USING fts5(
+                folded,
+                content='product_catalog',
+                content_rowid='id',
+                tokenize='trigram'
+            );
+        ''')
+
+    def _load(self, names: Iterable[Tuple[str, str]]):
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO product_catalog (company, product_name, folded) VALUES (?, ?, ?)',
+            ((company, name, fold_text(name)) for company, name in names)
+        )
+        self.conn.execute("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+        self.conn.commit()
+
+    def rebuild(self, source_table: str = 'product_fulfillment_rates') -> int:
+        """从宽表重建索引，返回产品数"""
+        names = self.conn.execute(
+            f'SELECT DISTINCT company, product_name FROM {source_table} ORDER BY company, product_name'
+        ).fetchall()
+        self.create_tables()
+        self._load(names)
+        return len(names)
+
+    def search(self, query: str, company: Optional[str] = None,
+               limit: int = 20) -> List[Dict[str, Any]]:
+        """搜索产品，返回 [{'company', 'product_name', 'score'}]"""
+        folded = fold_text(query)
+        if not folded:
+            return []
+
+        with self._lock:
+            if len(folded) >= 3:
+                rows = self._match(f'"{folded}"', company, limit)
+                if not rows:
+                    # 模糊匹配：任一trigram命中即可，bm25按命中数排序
+                    trigrams = {folded[i:i + 3] for i in range(len(folded) - 2)}
+                    rows = self._match(' OR '.join(f'"{t}"' for t in sorted(trigrams)), company, limit)
+                if not rows:
+                    rows = self._bigram_fallback(folded, company, limit)
+            else:
+                rows = self._like(folded, company, limit)
+
+        ranked = sorted(rows, key=lambda r: (not r[3].startswith(folded), r[2], len(r[3])))
+        return [{'company': r[0], 'product_name': r[1], 'score': r[2]} for r in ranked[:limit]]
+
+    def _match(self, match_expr: str, company: Optional[str], limit: int):
+        sql = '''
+            SELECT c.company, c.product_name, bm25(product_search) AS score, c.folded
+            FROM product_search
+            JOIN product_catalog c ON c.id = product_search.rowid
+            WHERE product_search MATCH ?
+        '''
+        params: List[Any] = [match_expr]
+        if company:
+            sql += ' AND c.company = ?'
+            params.append(company)
+        # 多取一些候选，再在Python中做前缀优先排序
+        sql += ' ORDER BY score LIMIT ?'
+        params.append(limit * 5)
+        return self.conn.execute(sql, params).fetchall()
+
+    def _like(self, folded: str, company: Optional[str], limit: int):
+        pattern = folded.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        sql = '''
+            SELECT company, product_name, 0.0 AS score, folded
+            FROM product_catalog
+            WHERE folded LIKE ? ESCAPE '\\'
+        '''
+        params: List[Any] = [f'%{pattern}%']
+        if company:
+            sql += ' AND company = ?'
+            params.append(company)
+        sql += ' ORDER BY length(folded) LIMIT ?'
+        params.append(limit * 5)
+        return self.conn.execute(sql, params).fetchall()
+
+    def _bigram_fallback(self, folded: str, company: Optional[str], limit: int):
+        """按命中的二元组数量排序（trigram 全部落空时，如单字错别字）"""
+        hits: Dict[Tuple[str, str], List[Any]] = {}
+        for i in range(len(folded) - 1):
+            for row in self._like(folded[i:i + 2], company, limit):
+                entry = hits.setdefault((row[0], row[1]), [row[0], row[1], 0.0, row[3]])
+                entry[2] -= 1  # 分数越小越相关，与 bm25 一致
+        return sorted(hits.values(), key=lambda r: r[2])[:limit * 5]
+
+
+def main():
+    """主函数：重建索引并演示查询"""
+    import sys
+    import time
+
+    index = ProductSearchIndex('insurance_data.db')
+    count = index.rebuild()
+    print(f"✅ 产品搜索索引已重建，共 {count} 个产品")
+
+    for query in sys.argv[1:]:
+        start = time.perf_counter()
+        results = index.search(query)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"\n🔍 {query} ({elapsed:.1f} ms)")
+        for result in results[:10]:
+            print(f"  - [{result['company']}] {result['product_name']}")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
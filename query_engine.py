@@ -0,0 +1,262 @@
+"""
+可插拔查询引擎
+Pluggable Query Engines for the App's Read Path
+
+应用的所有读取都通过同一个接口执行，后端可按部署环境切换（环境变量 INSURANCE_QUERY_ENGINE）：
+- sqlite: 直接读取磁盘上的数据库文件（只读连接，默认）
+- memory: 启动时用 SQLite backup API 把数据库整体复制到内存
+- duckdb: DuckDB 读取同一个 SQLite 文件，或读取 parquet_export.py 导出的 Parquet 数据集
+  （设置 INSURANCE_PARQUET_DIR 时）；需要可选依赖 duckdb
+
+对比各后端在应用查询上的耗时：
+
+    python query_engine.py --db insurance_data.db --engines sqlite,memory,duckdb
+"""
+
+import abc
+import argparse
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from db_connections import connect_reader
+
+try:
+    import duckdb
+except ImportError:  # duckdb 为可选依赖
+    duckdb = None
+
+
+class QueryEngine(abc.ABC):
+    """查询引擎接口
+
+    execute() 返回带 fetchone/fetchall/description 的游标，
+    可直接传给 rollups.headline_metrics、rankings.leaderboard 等接收连接的函数。
+    """
+
+    name = 'base'
+
+    @abc.abstractmethod
+    def execute(self, sql: str, params: Sequence[Any] = ()):
+        """执行查询，返回游标"""
+
+    @abc.abstractmethod
+    def query_df(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        """执行查询，返回 DataFrame"""
+
+    @abc.abstractmethod
+    def table_exists(self, name: str) -> bool:
+        """数据库中是否存在某表或视图"""
+
+    def close(self):
+        pass
+
+
+class SQLiteEngine(QueryEngine):
+    """磁盘上的 SQLite 文件（只读；immutable=True 用于发布后不再修改的快照）"""
+
+    name = 'sqlite'
+
+    def __init__(self, db_path: str = 'insurance_data.db', immutable: bool = False):
+        self.db_path = db_path
+        self.immutable = immutable
+        self.conn = self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect_reader(self.db_path, immutable=self.immutable, check_same_thread=False)
+
+    def execute(self, sql: str, params: Sequence[Any] = ()):
+        return self.conn.execute(sql, params)
+
+    def query_df(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def table_exists(self, name: str) -> bool:
+        row = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+        return row is not None
+
+    def close(self):
+        self.conn.close()
+
+
+class MemorySQLiteEngine(SQLiteEngine):
+    """启动时通过 backup API 复制到内存的 SQLite 数据库"""
+
+    name = 'memory'
+
+    def _connect(self) -> sqlite3.Connection:
+        source = connect_reader(self.db_path, immutable=self.immutable)
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        source.backup(conn)
+        source.close()
+        return conn
+
+
+class FetchedResult:
+    """已取回的查询结果，提供与 sqlite3 游标相同的读取接口（description / fetchone / fetchall / 迭代）"""
+
+    def __init__(self, rows: List[tuple], description):
+        self.description = description
+        self._rows = rows
+        self._position = 0
+
+    def fetchone(self) -> Optional[tuple]:
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchall(self) -> List[tuple]:
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+class DuckDBEngine(QueryEngine):
+    """DuckDB：读取 SQLite 文件（sqlite 扩展）或 Parquet 数据集"""
+
+    name = 'duckdb'
+
+    # Parquet 数据集 -> 兼容视图名
+    PARQUET_VIEWS = {
+        'fulfillment_rates': 'product_fulfillment_rates',
+        'fulfillment_history': 'fulfillment_ratios_backup',
+    }
+
+    def __init__(self, db_path: str = 'insurance_data.db', parquet_dir: Optional[str] = None):
+        if duckdb is None:
+            raise ImportError("DuckDB引擎需要 duckdb，请先执行: pip install duckdb")
+        self.db_path = db_path
+        self.parquet_dir = parquet_dir
+        self.conn = duckdb.connect()
+        self._lock = threading.Lock()
+        if parquet_dir:
+            for dataset, view in self.PARQUET_VIEWS.items():
+                pattern = os.path.join(parquet_dir, dataset, '**', '*.parquet')
+                self.conn.execute(f'''
+                    CREATE VIEW {view} AS
+                    SELECT company, data_year, * EXCLUDE (company, data_year)
+                    FROM read_parquet('{pattern}', hive_partitioning = true)
+                ''')
+        else:
+            self.conn.execute(f"ATTACH '{db_path}' AS source (TYPE sqlite, READ_ONLY)")
+            self.conn.execute('USE source')
+
+    def _cursor(self):
+        # DuckDB 连接不能跨线程共享，每次查询使用独立游标，取完结果即关闭
+        with self._lock:
+            cursor = self.conn.cursor()
+        if not self.parquet_dir:
+            cursor.execute('USE source')
+        return cursor
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> FetchedResult:
+        with self._cursor() as cursor:
+            cursor.execute(sql, list(params))
+            return FetchedResult(cursor.fetchall(), cursor.description)
+
+    def query_df(self, sql: str, params: Sequence[Any] = ()) -> pd.DataFrame:
+        with self._cursor() as cursor:
+            return cursor.execute(sql, list(params)).df()
+
+    def table_exists(self, name: str) -> bool:
+        row = self.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    def close(self):
+        self.conn.close()
+
+
+ENGINES = {
+    'sqlite': SQLiteEngine,
+    'memory': MemorySQLiteEngine,
+    'duckdb': DuckDBEngine,
+}
+
+
+def create_engine(kind: Optional[str] = None, db_path: str = 'insurance_data.db',
+                  parquet_dir: Optional[str] = None, immutable: bool = False) -> QueryEngine:
+    """按名称创建查询引擎；未指定时读取环境变量 INSURANCE_QUERY_ENGINE（默认 sqlite）
+
+    immutable=True 表示 db_path 是发布后不再修改的快照（SQLite 后端以 immutable=1 打开）。
+    """
+    kind = kind or os.environ.get('INSURANCE_QUERY_ENGINE', 'sqlite')
+    if kind not in ENGINES:
+        raise ValueError(f"未知查询引擎: {kind}（可选: {', '.join(ENGINES)}）")
+    if kind == 'duckdb':
+        return DuckDBEngine(db_path, parquet_dir or os.environ.get('INSURANCE_PARQUET_DIR'))
+    return ENGINES[kind](db_path, immutable=immutable)
+
+
+def compare_engines(engines: List[QueryEngine], queries: List[Dict[str, Any]],
+                    repeat: int = 20) -> List[Dict[str, Any]]:
+    """在同一组查询上比较各引擎，返回每个 (引擎, 查询) 的 p50/p95（毫秒）"""
+    results = []
+    for engine in engines:
+        for query in queries:
+            result = {'engine': engine.name, 'query': query['name'], 'rows': None,
+                      'p50_ms': None, 'p95_ms': None, 'error': None}
+            timings = []
+            try:
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    rows = engine.execute(query['sql'], query['params']).fetchall()
+                    timings.append((time.perf_counter() - start) * 1000)
+            except Exception as e:  # 后端不支持该查询（如 Parquet 中没有派生表）
+                result['error'] = str(e).splitlines()[0]
+            else:
+                timings.sort()
+                result['rows'] = len(rows)
+                result['p50_ms'] = round(statistics.median(timings), 3)
+                result['p95_ms'] = round(timings[min(int(0.95 * len(timings)), len(timings) - 1)], 3)
+            results.append(result)
+    return results
+
+
+def main(argv=None):
+    """主函数：比较各查询引擎"""
+    from query_plans import CANONICAL_QUERIES
+
+    arg_parser = argparse.ArgumentParser(description='比较查询引擎在应用查询上的耗时')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--engines', default='sqlite,memory,duckdb', help='逗号分隔的引擎列表')
+    arg_parser.add_argument('--parquet-dir', help='DuckDB 读取的 Parquet 导出目录')
+    arg_parser.add_argument('--repeat', type=int, default=20, help='每条查询重复次数')
+    args = arg_parser.parse_args(argv)
+
+    engines = []
+    for kind in args.engines.split(','):
+        start = time.perf_counter()
+        try:
+            engine = create_engine(kind, args.db, args.parquet_dir)
+        except Exception as e:
+            print(f"⚠️  {kind}: 无法创建 ({str(e).splitlines()[0]})")
+            continue
+        print(f"✓ {kind}: 启动耗时 {(time.perf_counter() - start) * 1000:.1f} ms")
+        engines.append(engine)
+
+    results = compare_engines(engines, CANONICAL_QUERIES, args.repeat)
+    print(f"\n{'查询':<32} {'引擎':<8} {'行数':>6} {'p50(ms)':>10} {'p95(ms)':>10}")
+    print("-" * 70)
+    for r in sorted(results, key=lambda r: (r['query'], r['engine'])):
+        if r['error']:
+            print(f"{r['query']:<32} {r['engine']:<8} {'-':>6} 不支持: {r['error'][:40]}")
+        else:
+            print(f"{r['query']:<32} {r['engine']:<8} {r['rows']:>6} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f}")
+
+    for engine in engines:
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""
+查询计划回归检查
+EXPLAIN QUERY PLAN Regression Check for the Canonical Queries
+
+对应用、排行榜和指标卡实际执行的每条查询运行 EXPLAIN QUERY PLAN，
+出现全表扫描（SCAN 表）或临时B树排序（USE TEMP B-TREE FOR ORDER BY / GROUP BY / DISTINCT）
+即判定为退化。修改表结构或索引后运行：
+
+    python query_plans.py --db insurance_data.db
+
+存在退化时返回退出码 1，可直接用于 CI。
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+from typing import Any, Dict, List
+
+from db_connections import connect_reader
+from pagination import page_query
+
+
+_FIRST_PAGE = page_query(limit=50)
+_KEYSET_PAGE = page_query(company='保诚保险', cursor=('保诚保险', '「倍豐盛」計劃', 'USD', 2018, 2024))
+
+_RATE_COLUMNS = ('reversionary_bonus_rate, special_bonus_rate, annual_bonus_rate, '
+                 'terminal_bonus_rate, total_cash_value_rate')
+
+# 规范查询：name -> sql / params / allow_scan
+# allow_scan: True 表示整表加载、无筛选汇总本来就需要扫描；也可以是允许按序扫描的小维度表别名
+CANONICAL_QUERIES: List[Dict[str, Any]] = [
+    {
+        'name': 'app.load_data',
+        'sql': 'SELECT * FROM product_fulfillment_rates',
+        'params': (),
+        'allow_scan': True,
+    },
+    {
+        'name': 'product_curve',
+        'sql': f'''
+            SELECT purchase_year, data_year, policy_year, {_RATE_COLUMNS}
+            FROM product_fulfillment_rates
+            WHERE company = ? AND product_name = ? AND currency = ?
+            ORDER BY purchase_year
+        ''',
+        'params': ('保诚保险', '「倍豐盛」計劃', 'USD'),
+    },
+    {
+        'name': 'product_curve.purchase_years',
+        'sql': f'''
+            SELECT purchase_year, data_year, {_RATE_COLUMNS}
+            FROM product_fulfillment_rates
+            WHERE company = ? AND product_name = ? AND currency = ? AND purchase_year IN (?, ?, ?)
+            ORDER BY purchase_year
+        ''',
+        'params': ('保诚保险', '「倍豐盛」計劃', 'USD', 2018, 2019, 2020),
+    },
+    {
+        'name': 'cohort_comparison',
+        'sql': f'''
+            SELECT company, product_name, {_RATE_COLUMNS}
+            FROM product_fulfillment_rates
+            WHERE data_year = ? AND purchase_year = ? AND currency = ?
+        ''',
+        'params': (2024, 2018, 'USD'),
+    },
+    {
+        'name': 'detail_page.first',
+        'sql': _FIRST_PAGE[0],
+        'params': _FIRST_PAGE[1],
+        'allow_scan': ('c', 'cu'),  # 按名称顺序遍历小维度表，LIMIT 后即停止
+    },
+    {
+        'name': 'detail_page.keyset',
+        'sql': _KEYSET_PAGE[0],
+        'params': _KEYSET_PAGE[1],
+        'allow_scan': ('cu',),
+    },
+    {
+        'name': 'headline_metrics.all',
+        'sql': '''
+            SELECT COUNT(DISTINCT product_name), SUM(reversionary_sum), SUM(reversionary_count),
+                   SUM(special_sum), SUM(special_count), SUM(row_count)
+            FROM metric_rollups
+        ''',
+        'params': (),
+        'allow_scan': True,
+    },
+    {
+        'name': 'headline_metrics.company',
+        'sql': '''
+            SELECT COUNT(DISTINCT product_name), SUM(reversionary_sum), SUM(reversionary_count),
+                   SUM(special_sum), SUM(special_count), SUM(row_count)
+            FROM metric_rollups
+            WHERE company = ? AND currency = ?
+        ''',
+        'params': ('保诚保险', 'USD'),
+    },
+    {
+        'name': 'headline_metrics.product',
+        'sql': '''
+            SELECT COUNT(DISTINCT product_name), SUM(reversionary_sum), SUM(reversionary_count),
+                   SUM(special_sum), SUM(special_count), SUM(row_count)
+            FROM metric_rollups
+            WHERE company = ? AND product_name = ? AND currency = ? AND purchase_year IN (?, ?)
+        ''',
+        'params': ('保诚保险', '「倍豐盛」計劃', 'USD', 2018, 2019),
+    },
+    {
+        'name': 'headline_metrics.currency',
+        'sql': '''
+            SELECT COUNT(DISTINCT product_name), SUM(reversionary_sum), SUM(reversionary_count),
+                   SUM(special_sum), SUM(special_count), SUM(row_count)
+            FROM metric_rollups
+            WHERE currency = ? AND purchase_year IN (?, ?)
+        ''',
+        'params': ('USD', 2018, 2019),
+    },
+    {
+        'name': 'leaderboard.market',
+        'sql': '''
+            SELECT company, product_name, mean_rate, market_rank FROM product_rankings
+            WHERE data_year = ? AND currency = ? AND metric = ?
+            ORDER BY market_rank LIMIT ?
+        ''',
+        'params': (2024, 'USD', 'reversionary', 20),
+    },
+    {
+        'name': 'leaderboard.company',
+        'sql': '''
+            SELECT company, product_name, mean_rate, company_rank FROM product_rankings
+            WHERE data_year = ? AND currency = ? AND metric = ? AND company = ?
+            ORDER BY company_rank LIMIT ?
+        ''',
+        'params': (2024, 'USD', 'reversionary', '保诚保险', 20),
+    },
+]
+
+# SCAN 后面跟表名（不含 "USING COVERING INDEX"，覆盖索引扫描也算全扫描）
+_SCAN_RE = re.compile(r'^SCAN (\w+)')
+_TEMP_SORT_RE = re.compile(r'USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY|LAST TERM OF ORDER BY)')
+
+
+def explain(conn: sqlite3.Connection, sql: str, params=()) -> List[str]:
+    """返回 EXPLAIN QUERY PLAN 的 detail 列"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+
+def plan_problems(plan: List[str], allow_scan=False) -> List[str]:
+    """找出计划中的全表扫描和临时B树排序"""
+    problems = []
+    for detail in plan:
+        scan = _SCAN_RE.match(detail)
+        if _TEMP_SORT_RE.search(detail):
+            problems.append(detail)
+        elif scan and allow_scan is not True and scan.group(1) not in (allow_scan or ()):
+            problems.append(detail)
+    return problems
+
+
+def check_query_plans(conn: sqlite3.Connection,
+                      queries: List[Dict[str, Any]] = CANONICAL_QUERIES) -> List[Dict[str, Any]]:
+    """检查所有规范查询，返回 [{'name', 'plan', 'problems', 'skipped'}]"""
+    results = []
+    for query in queries:
+        result = {'name': query['name'], 'plan': [], 'problems': [], 'skipped': None}
+        try:
+            result['plan'] = explain(conn, query['sql'], query['params'])
+        except sqlite3.OperationalError as e:
+            # 派生表尚未生成（如旧数据库没有 metric_rollups）
+            result['skipped'] = str(e)
+        else:
+            result['problems'] = plan_problems(result['plan'], query.get('allow_scan', False))
+        results.append(result)
+    return results
+
+
+def main(argv=None) -> int:
+    """主函数，存在退化时返回 1"""
+    arg_parser = argparse.ArgumentParser(description='检查规范查询的执行计划')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--verbose', action='store_true', help='打印完整执行计划')
+    args = arg_parser.parse_args(argv)
+
+    conn = connect_reader(args.db)
+    results = check_query_plans(conn)
+    conn.close()
+
+    failed = 0
+    for result in results:
+        if result['skipped']:
+            print(f"⚠️  {result['name']}: 跳过 ({result['skipped']})")
+            continue
+        if result['problems']:
+            failed += 1
+            print(f"❌ {result['name']}")
+            for detail in result['problems']:
+                print(f"     {detail}")
+        else:
+            print(f"✅ {result['name']}")
+        if args.verbose:
+            for detail in result['plan']:
+                print(f"       | {detail}")
+
+    print(f"\n{len(results) - failed}/{len(results)} 条查询计划通过")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+产品排行榜物化表
+Materialized Cross-company Ranking and Percentile Tables
+
+每次刷新后用 SQL 窗口函数计算每个 (报告年度, 货币, 指标, 公司, 产品) 跨购买年份的：
+平均实现率、最低实现率、达到100%的年份占比，以及在公司内和全市场的排名/百分位。
+排行榜查询只需一次索引读取。
+"""
+
+import sqlite3
+from typing import Any, Dict, List, Optional
+
+from db_connections import connect_writer
+
+
+# 指标名 -> 宽表列
+RANKING_METRICS = {
+    'reversionary': 'reversionary_bonus_rate',
+    'special': 'special_bonus_rate',
+}
+
+
+class RankingBuilder:
+    """排行榜物化表构建器"""
+
+    def __init__(self, db_path: str = 'insurance_data.db'):
+        self.db_path = db_path
+
+    def create_table(self, conn: sqlite3.Connection):
+        """创建排行榜表和索引"""
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS product_rankings (
+                data_year INTEGER NOT NULL,
+                currency TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                company TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                years_count INTEGER NOT NULL,
+                mean_rate REAL NOT NULL,
+                min_rate INTEGER NOT NULL,
+                share_at_least_100 REAL NOT NULL,
+                company_rank INTEGER NOT NULL,
+                company_percentile REAL NOT NULL,
+                market_rank INTEGER NOT NULL,
+                market_percentile REAL NOT NULL,
+                PRIMARY KEY (data_year, currency, metric, company, product_name)
+            ) WITHOUT ROWID;
+
+            CREATE INDEX IF NOT EXISTS idx_rankings_market
+                ON product_rankings(data_year, currency, metric, market_rank);
+            CREATE INDEX IF NOT EXISTS idx_rankings_company
+                ON product_rankings(data_year, currency, metric, company, company_rank);
+        ''')
+
+    def _stats_sql(self) -> str:
+        """各指标的聚合子查询（UNION ALL）"""
+        parts = []
+        for metric, column in RANKING_METRICS.items():
+            parts.append(f'''
+                SELECT data_year, currency, '{metric}' AS metric, company, product_name,
+                       COUNT({column}) AS years_count,
+                       AVG({column}) AS mean_rate,
+                       MIN({column}) AS min_rate,
+                       SUM(CASE WHEN {column} >= 100 THEN 1 ELSE 0 END) * 1.0 / COUNT({column})
+                           AS share_at_least_100
+                FROM product_fulfillment_rates
+                WHERE {column} IS NOT NULL
+                GROUP BY data_year, currency, company, product_name''')
+        return '\n                UNION ALL'.join(parts)
+
+    def refresh(self) -> int:
+        """重建排行榜，返回记录数"""
+        conn = connect_writer(self.db_path)
+        self.create_table(conn)
+        with conn:
+            conn.execute('DELETE FROM product_rankings')
+            conn.execute(f'''
+                INSERT INTO product_rankings
+                WITH stats AS ({self._stats_sql()}
+                )
+                SELECT data_year, currency, metric, company, product_name,
+                       years_count, mean_rate, min_rate, share_at_least_100,
+                       RANK() OVER company_desc AS company_rank,
+                       PERCENT_RANK() OVER company_asc AS company_percentile,
+                       RANK() OVER market_desc AS market_rank,
+                       PERCENT_RANK() OVER market_asc AS market_percentile
+                FROM stats
+                WINDOW
+                    company_desc AS (PARTITION BY data_year, currency, metric, company ORDER BY mean_rate DESC),
+                    company_asc AS (PARTITION BY data_year, currency, metric, company ORDER BY mean_rate),
+                    market_desc AS (PARTITION BY data_year, currency, metric ORDER BY mean_rate DESC),
+                    market_asc AS (PARTITION BY data_year, currency, metric ORDER BY mean_rate)
+            ''')
+        count = conn.execute('SELECT COUNT(*) FROM product_rankings').fetchone()[0]
+        conn.close()
+        return count
+
+
+def latest_data_year(conn: sqlite3.Connection) -> Optional[int]:
+    """排行榜中最新的报告年度"""
+    return conn.execute('SELECT MAX(data_year) FROM product_rankings').fetchone()[0]
+
+
+def ranking_currencies(conn: sqlite3.Connection, data_year: Optional[int] = None) -> List[str]:
+    """排行榜中某报告年度（默认最新）有数据的货币"""
+    if data_year is None:
+        data_year = latest_data_year(conn)
+    return [row[0] for row in conn.execute(
+        'SELECT DISTINCT currency FROM product_rankings WHERE data_year = ? ORDER BY currency',
+        (data_year,)).fetchall()]
+
+
+def leaderboard(conn: sqlite3.Connection, metric: str = 'reversionary', currency: str = 'USD',
+                data_year: Optional[int] = None, company: Optional[str] = None,
+                limit: int = 20) -> List[Dict[str, Any]]:
+    """查询排行榜：指定公司时按公司内排名，否则按全市场排名"""
+    if metric not in RANKING_METRICS:
+        raise ValueError(f"未知指标: {metric}")
+    if data_year is None:
+        data_year = latest_data_year(conn)
+
+    columns = ('company, product_name, years_count, mean_rate, min_rate, share_at_least_100, '
+               'company_rank, company_percentile, market_rank, market_percentile')
+    if company:
+        sql = f'''
+            SELECT {columns} FROM product_rankings
+            WHERE data_year = ? AND currency = ? AND metric = ? AND company = ?
+            ORDER BY company_rank LIMIT ?
+        '''
+        params = (data_year, currency, metric, company, limit)
+    else:
+        sql = f'''
+            SELECT {columns} FROM product_rankings
+            WHERE data_year = ? AND currency = ? AND metric = ?
+            ORDER BY market_rank LIMIT ?
+        '''
+        params = (data_year, currency, metric, limit)
+
+    cursor = conn.execute(sql, params)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
@@ -0,0 +1,224 @@
+"""
+按产品打包的实现率曲线
+Array-packed Per-product Fulfillment Curves
+
+每个 (公司, 产品, 货币, 报告年度, 类别) 一行，整条 购买年份 -> 实现率 曲线打包为定长数组：
+- rates: little-endian int16 数组 BLOB，第 i 个元素对应购买年份 first_year + i，-1 表示无实现率
+- normal_bitmap: 位图 BLOB（np.packbits，低位在前），第 i 位表示该购买年份状态为 normal
+
+取一个产品或 50 个产品的对比曲线只需按主键点查几行，np.frombuffer 直接在 BLOB 上解码（不复制），
+不需要范围扫描宽表再用 pandas 重塑。每次重构后只重建涉及的报告年度。
+
+    python rate_curves.py --db insurance_data.db --products 50   # 与宽表范围扫描 + pandas 重塑对比耗时
+"""
+
+import argparse
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from data_parser import STATUS_CODES
+from db_connections import connect_reader, connect_writer
+from ratio_changes import METRIC_LABELS
+
+
+RATE_DTYPE = np.dtype('<i2')
+MISSING_RATE = -1
+
+_METRICS = list(METRIC_LABELS)
+
+
+def pack_curve(purchase_years: np.ndarray, rates: np.ndarray, normal: np.ndarray) -> Dict[str, Any]:
+    """把一条曲线（购买年份、实现率（NaN 为空）、是否 normal）打包为 BLOB"""
+    first_year = int(purchase_years.min())
+    length = int(purchase_years.max()) - first_year + 1
+    packed = np.full(length, MISSING_RATE, dtype=RATE_DTYPE)
+    present = ~np.isnan(rates)
+    packed[purchase_years[present] - first_year] = rates[present]
+    bitmap = np.zeros(length, dtype=bool)
+    bitmap[purchase_years - first_year] = normal
+    return {
+        'first_year': first_year,
+        'length': length,
+        'rates': packed.tobytes(),
+        'normal_bitmap': np.packbits(bitmap, bitorder='little').tobytes(),
+    }
+
+
+def decode_curve(first_year: int, rates: bytes, normal_bitmap: bytes) -> Dict[str, np.ndarray]:
+    """解码一条曲线：years / rates（int16，只读视图，-1 为空）/ normal（bool）"""
+    values = np.frombuffer(rates, dtype=RATE_DTYPE)
+    normal = np.unpackbits(np.frombuffer(normal_bitmap, dtype=np.uint8),
+                           count=len(values), bitorder='little').astype(bool)
+    return {
+        'years': np.arange(first_year, first_year + len(values)),
+        'rates': values,
+        'normal': normal,
+    }
+
+
+class CurveBuilder:
+    """打包曲线表构建器"""
+
+    def __init__(self, db_path: str = 'insurance_data.db'):
+        self.db_path = db_path
+
+    def create_table(self, conn: sqlite3.Connection):
+        """创建曲线表"""
+        conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS rate_curves (
+                product_id INTEGER NOT NULL,
+                currency_id INTEGER NOT NULL,
+                data_year INTEGER NOT NULL,
+                metric TEXT NOT NULL CHECK (metric IN ({', '.join(f"'{m}'" for m in _METRICS)})),
+                company_id INTEGER NOT NULL,
+                first_year INTEGER NOT NULL,
+                length INTEGER NOT NULL CHECK (length > 0),
+                rates BLOB NOT NULL CHECK (length(rates) = length * 2),
+                normal_bitmap BLOB NOT NULL,
+                PRIMARY KEY (product_id, currency_id, data_year, metric)
+            ) WITHOUT ROWID;
+
+            -- 各公司的最新报告年度
+            CREATE INDEX IF NOT EXISTS idx_curves_company_year
+                ON rate_curves(company_id, data_year);
+        ''')
+
+    def _curves(self, conn: sqlite3.Connection, data_years: Optional[Sequence[int]]) -> List[tuple]:
+        """从宽表构建曲线行：按 (产品, 货币, 报告年度) 排序后按分组边界切片"""
+        columns = ', '.join(f'{m}_rate, {m}_status_id' for m in _METRICS)
+        sql = f'SELECT product_id, currency_id, data_year, company_id, purchase_year, {columns} FROM fulfillment_rates'
+        params: List[int] = []
+        if data_years is not None:
+            sql += f" WHERE data_year IN ({', '.join('?' * len(data_years))})"
+            params = list(data_years)
+        rows = conn.execute(sql + ' ORDER BY product_id, currency_id, data_year, purchase_year', params).fetchall()
+        if not rows:
+            return []
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), 5 + 2 * len(_METRICS))
+        keys = table[:, :5].astype(np.int64)
+        rates = table[:, 5::2]
+        statuses = table[:, 6::2]
+
+        change = np.any(keys[1:, :3] != keys[:-1, :3], axis=1)
+        bounds = np.concatenate(([0], np.flatnonzero(change) + 1, [len(rows)]))
+        curves = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            product_id, currency_id, data_year, company_id = (int(v) for v in keys[start, :4])
+            purchase_years = keys[start:end, 4]
+            for m, metric in enumerate(_METRICS):
+                metric_rates, metric_status = rates[start:end, m], statuses[start:end, m]
+                if np.isnan(metric_rates).all() and np.isnan(metric_status).all():
+                    continue  # 该产品没有这个类别
+                packed = pack_curve(purchase_years, metric_rates, metric_status == STATUS_CODES['normal'])
+                curves.append((product_id, currency_id, data_year, metric, company_id, packed['first_year'],
+                               packed['length'], packed['rates'], packed['normal_bitmap']))
+        return curves
+
+    def refresh(self, data_years: Optional[Iterable[int]] = None) -> int:
+        """重建曲线表；data_years 为本次重建的报告年度（None 表示全部），返回写入行数"""
+        conn = connect_writer(self.db_path)
+        self.create_table(conn)
+        if data_years is not None and conn.execute('SELECT 1 FROM rate_curves LIMIT 1').fetchone() is None:
+            data_years = None  # 首次生成时全部构建
+        years = None if data_years is None else sorted(set(data_years))
+        if years == []:
+            conn.close()
+            return 0
+        curves = self._curves(conn, years)
+        with conn:
+            if years is None:
+                conn.execute('DELETE FROM rate_curves')
+            else:
+                conn.execute(f"DELETE FROM rate_curves WHERE data_year IN ({', '.join('?' * len(years))})", years)
+            conn.executemany('INSERT INTO rate_curves VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', curves)
+        conn.close()
+        return len(curves)
+
+
+def fetch_curves(conn, product_names: Sequence[str], currency: str, data_year: Optional[int] = None,
+                 company: Optional[str] = None, metrics: Optional[Sequence[str]] = None) -> Dict[tuple, Dict[str, Any]]:
+    """按产品名取曲线（主键点查），返回 {(公司, 产品名, 类别): 解码后的曲线}
+
+    未指定 data_year 时取各公司自己的最新报告年度：某家公司先发布新年度时，其他公司的曲线仍然保留。
+    """
+    if data_year is None:
+        year_expr = '(SELECT MAX(data_year) FROM rate_curves latest WHERE latest.company_id = c.id)'
+        year_params: List[Any] = []
+    else:
+        year_expr = '?'
+        year_params = [data_year]
+    metrics = list(metrics or _METRICS)
+    clauses = [f"p.name IN ({', '.join('?' * len(product_names))})",
+               f"rc.metric IN ({', '.join('?' * len(metrics))})"]
+    params: List[Any] = [currency, *year_params, *product_names, *metrics]
+    if company is not None:
+        clauses.append('c.name = ?')
+        params.append(company)
+    cursor = conn.execute(f'''
+        SELECT c.name, p.name, rc.metric, rc.first_year, rc.rates, rc.normal_bitmap
+        FROM dim_product p
+        JOIN dim_company c ON c.id = p.company_id
+        JOIN dim_currency cu ON cu.code = ?
+        JOIN rate_curves rc ON rc.product_id = p.id AND rc.currency_id = cu.id AND rc.data_year = {year_expr}
+        WHERE {' AND '.join(clauses)}
+    ''', params)
+    return {(company_name, product_name, metric): decode_curve(first_year, rates, bitmap)
+            for company_name, product_name, metric, first_year, rates, bitmap in cursor.fetchall()}
+
+
+def _scan_curves(conn, product_names: Sequence[str], currency: str, data_year: int) -> pd.DataFrame:
+    """对照：从宽表视图范围扫描，再用 pandas 重塑为 产品 × 购买年份 的曲线"""
+    df = pd.read_sql_query(f'''
+        SELECT company, product_name, purchase_year, {', '.join(f'{m}_rate' for m in _METRICS)}
+        FROM product_fulfillment_rates
+        WHERE currency = ? AND data_year = ? AND product_name IN ({', '.join('?' * len(product_names))})
+    ''', conn, params=[currency, data_year, *product_names])
+    return df.pivot_table(index=['company', 'product_name'], columns='purchase_year',
+                          values=[f'{m}_rate' for m in _METRICS])
+
+
+def main(argv=None) -> int:
+    """主函数：对比打包曲线点查与宽表扫描 + pandas 重塑的耗时"""
+    arg_parser = argparse.ArgumentParser(description='打包曲线读取耗时对比')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--currency', default='USD', help='货币')
+    arg_parser.add_argument('--products', type=int, default=50, help='对比的产品数')
+    arg_parser.add_argument('--repeat', type=int, default=20, help='重复次数')
+    args = arg_parser.parse_args(argv)
+
+    conn = connect_reader(args.db)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rate_curves'").fetchone() is None:
+            print("❌ rate_curves 尚未生成，请先运行 restructure_database.py")
+            return 1
+        data_year = conn.execute('SELECT MAX(data_year) FROM rate_curves').fetchone()[0]
+        products = [row[0] for row in conn.execute('''
+            SELECT DISTINCT p.name FROM rate_curves rc
+            JOIN dim_product p ON p.id = rc.product_id
+            JOIN dim_currency cu ON cu.id = rc.currency_id
+            WHERE cu.code = ? AND rc.data_year = ? LIMIT ?
+        ''', (args.currency, data_year, args.products))]
+        if not products:
+            print(f"❌ {data_year} 年没有 {args.currency} 曲线")
+            return 1
+
+        timings = {}
+        for name, fetch in (('rate_curves', fetch_curves), ('scan+pivot', _scan_curves)):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                result = fetch(conn, products, args.currency, data_year)
+            timings[name] = (time.perf_counter() - start) / args.repeat * 1000
+            print(f"  {name:<12} {timings[name]:8.2f} ms  ({len(result)} 条曲线/行)")
+        print(f"✓ {len(products)} 个产品 ({args.currency}, {data_year})："
+              f"打包曲线快 {timings['scan+pivot'] / timings['rate_curves']:.1f} 倍")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
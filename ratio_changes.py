@@ -0,0 +1,184 @@
+"""
+报告年度变动对比
+Report-year Diff Engine: What Changed Between Disclosures
+
+把每家公司的某个报告年度与该公司上一个报告年度按
+(产品, 货币, 购买年份, 类别) 对齐比较，结果写入 ratio_changes：
+- added: 本年度新出现的实现率
+- removed: 上一年度有、本年度没有
+- changed: 两个年度都有但数值不同（delta = 本年 - 上年）
+
+对齐在宽表的整数键上进行，上一年度一侧通过覆盖索引 idx_rates_product_curve 查找，
+不回表、不排序；每次导入后只重算涉及的报告年度及其下一个年度。
+"""
+
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional
+
+from db_connections import connect_writer
+
+
+# 宽表列前缀 -> 显示名称
+METRIC_LABELS = {
+    'reversionary_bonus': '归原红利',
+    'special_bonus': '特别红利',
+    'annual_bonus': '周年红利',
+    'terminal_bonus': '终期红利',
+    'total_cash_value': '总现金价值',
+}
+
+CHANGE_TYPES = ('added', 'removed', 'changed')
+
+
+class ChangeBuilder:
+    """报告年度变动表构建器"""
+
+    def __init__(self, db_path: str = 'insurance_data.db'):
+        self.db_path = db_path
+
+    def create_table(self, conn: sqlite3.Connection):
+        """创建变动表、索引和带名称的视图"""
+        conn.executescript(f'''
+            CREATE TABLE IF NOT EXISTS ratio_changes (
+                data_year INTEGER NOT NULL,
+                previous_year INTEGER NOT NULL,
+                company_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                currency_id INTEGER NOT NULL,
+                purchase_year INTEGER NOT NULL,
+                metric TEXT NOT NULL,
+                change_type TEXT NOT NULL CHECK (change_type IN ({', '.join(f"'{t}'" for t in CHANGE_TYPES)})),
+                old_rate INTEGER,
+                new_rate INTEGER,
+                delta INTEGER,
+                PRIMARY KEY (data_year, product_id, currency_id, purchase_year, metric)
+            ) WITHOUT ROWID;
+
+            -- 最新变动：按报告年度取变动幅度最大的行
+            CREATE INDEX IF NOT EXISTS idx_changes_magnitude
+                ON ratio_changes(data_year, ABS(delta) DESC);
+            -- 各公司的最新报告年度
+            CREATE INDEX IF NOT EXISTS idx_changes_company_year
+                ON ratio_changes(company_id, data_year);
+
+            DROP VIEW IF EXISTS ratio_changes_named;
+            CREATE VIEW ratio_changes_named AS
+            SELECT rc.data_year, rc.previous_year, c.name AS company, p.name AS product_name,
+                   cu.code AS currency, rc.purchase_year, rc.metric, rc.change_type,
+                   rc.old_rate, rc.new_rate, rc.delta
+            FROM ratio_changes rc
+            JOIN dim_product p ON p.id = rc.product_id
+            JOIN dim_company c ON c.id = rc.company_id
+            JOIN dim_currency cu ON cu.id = rc.currency_id;
+        ''')
+
+    @staticmethod
+    def _diff_sql() -> str:
+        """某公司 本年度(:year) 对 上一年度(:previous) 的变动行"""
+        new_cols = ', '.join(f'cur.{m}_rate AS new_{m}' for m in METRIC_LABELS)
+        old_cols = ', '.join(f'prev.{m}_rate AS old_{m}' for m in METRIC_LABELS)
+        old_only = ', '.join(f'NULL AS new_{m}' for m in METRIC_LABELS)
+        old_only_cols = ', '.join(f'prev.{m}_rate AS old_{m}' for m in METRIC_LABELS)
+        unpivot = '\n                UNION ALL '.join(
+            f"SELECT product_id, currency_id, purchase_year, '{m}' AS metric, "
+            f"old_{m} AS old_rate, new_{m} AS new_rate FROM pairs"
+            for m in METRIC_LABELS
+        )
+        return f'''
+            WITH pairs AS (
+                SELECT cur.product_id, cur.currency_id, cur.purchase_year, {new_cols}, {old_cols}
+                FROM fulfillment_rates cur
+                LEFT JOIN fulfillment_rates prev
+                  ON prev.product_id = cur.product_id AND prev.currency_id = cur.currency_id
+                 AND prev.purchase_year = cur.purchase_year AND prev.data_year = :previous
+                WHERE cur.data_year = :year AND cur.company_id = :company
+                UNION ALL
+                SELECT prev.product_id, prev.currency_id, prev.purchase_year, {old_only}, {old_only_cols}
+                FROM fulfillment_rates prev
+                WHERE prev.data_year = :previous AND prev.company_id = :company
+                  AND NOT EXISTS (
+                      SELECT 1 FROM fulfillment_rates cur
+                      WHERE cur.product_id = prev.product_id AND cur.currency_id = prev.currency_id
+                        AND cur.purchase_year = prev.purchase_year AND cur.data_year = :year)
+            ),
+            cells AS (
+                {unpivot}
+            )
+            SELECT :year, :previous, :company, product_id, currency_id, purchase_year, metric,
+                   CASE WHEN old_rate IS NULL THEN 'added'
+                        WHEN new_rate IS NULL THEN 'removed'
+                        ELSE 'changed' END,
+                   old_rate, new_rate, new_rate - old_rate
+            FROM cells
+            WHERE old_rate IS NOT new_rate
+        '''
+
+    def _pairs(self, conn: sqlite3.Connection, data_years: Optional[Iterable[int]]) -> List[Dict[str, int]]:
+        """需要重算的 (公司, 报告年度, 上一报告年度)：涉及年度本身及各公司的下一个年度"""
+        years_by_company: Dict[int, List[int]] = {}
+        for company_id, data_year in conn.execute(
+                'SELECT DISTINCT company_id, data_year FROM fulfillment_rates ORDER BY company_id, data_year'):
+            years_by_company.setdefault(company_id, []).append(data_year)
+        affected = None if data_years is None else set(data_years)
+        pairs = []
+        for company_id, years in years_by_company.items():
+            for previous, year in zip(years, years[1:]):
+                if affected is None or year in affected or previous in affected:
+                    pairs.append({'company': company_id, 'year': year, 'previous': previous})
+        return pairs
+
+    def refresh(self, data_years: Optional[Iterable[int]] = None) -> int:
+        """重算变动表；data_years 为本次导入涉及的报告年度（None 表示全部重算），返回写入行数"""
+        conn = connect_writer(self.db_path)
+        self.create_table(conn)
+        if data_years is not None and conn.execute('SELECT 1 FROM ratio_changes LIMIT 1').fetchone() is None:
+            data_years = None  # 首次生成时全部计算
+        diff_sql = self._diff_sql()
+        written = 0
+        with conn:
+            if data_years is None:
+                conn.execute('DELETE FROM ratio_changes')
+            else:
+                years = sorted(set(data_years))
+                conn.execute(f"DELETE FROM ratio_changes WHERE data_year IN ({', '.join('?' * len(years))})"
+                             f" OR previous_year IN ({', '.join('?' * len(years))})", years + years)
+            for pair in self._pairs(conn, data_years):
+                conn.execute('DELETE FROM ratio_changes WHERE data_year = ? AND company_id = ?',
+                             (pair['year'], pair['company']))
+                written += conn.execute(f'INSERT INTO ratio_changes {diff_sql}', pair).rowcount
+        conn.close()
+        return written
+
+
+def latest_changes(conn, company: Optional[str] = None, currency: Optional[str] = None,
+                   change_type: Optional[str] = None, data_year: Optional[int] = None,
+                   limit: int = 200) -> List[Dict[str, Any]]:
+    """各公司最新报告年度的变动（指定 data_year 时取该年度），按变动幅度从大到小（新增/移除排在数值变动之后）
+
+    最新年度按公司分别确定：某家公司先发布新年度时，其他公司的最新变动仍然保留。
+    """
+    if data_year is None:
+        year_expr = '(SELECT MAX(data_year) FROM ratio_changes latest WHERE latest.company_id = c.id)'
+        params: List[Any] = []
+    else:
+        year_expr = '?'
+        params = [data_year]
+    clauses = []
+    for column, value in (('c.name', company), ('cu.code', currency), ('rc.change_type', change_type)):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    cursor = conn.execute(f'''
+        SELECT c.name AS company, p.name AS product_name, cu.code AS currency, rc.purchase_year,
+               rc.metric, rc.change_type, rc.old_rate, rc.new_rate, rc.delta, rc.previous_year, rc.data_year
+        FROM dim_company c
+        JOIN ratio_changes rc ON rc.data_year = {year_expr} AND rc.company_id = c.id
+        JOIN dim_product p ON p.id = rc.product_id
+        JOIN dim_currency cu ON cu.id = rc.currency_id
+        {where}
+        ORDER BY ABS(rc.delta) DESC
+        LIMIT ?
+    ''', params + [limit])
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
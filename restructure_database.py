@@ -2,11 +2,31 @@
 """
 数据库结构重构脚本
 将长格式（category作为行）转换为宽格式（category作为列）
+公司、产品、货币、类别、状态和数据来源规范化为维度表，事实表只存整数键
 """
 
+import argparse
 import sqlite3
 import re
 from datetime import datetime
+from anomaly_detector import AnomalyDetector, pending_anomalies, pending_years, releasable_years
+from data_parser import STATUS_CODES, STATUS_LABELS
+from db_connections import connect_writer, write_lock
+from product_search import ProductSearchIndex
+from rankings import RankingBuilder
+from rate_curves import CurveBuilder
+from ratio_changes import ChangeBuilder
+from rollups import RollupBuilder
+
+
+# 宽表列前缀 -> 长表中对应的类别名称
+WIDE_CATEGORIES = {
+    'reversionary_bonus': ('歸原紅利',),
+    'special_bonus': ('特別紅利',),
+    'annual_bonus': ('週年紅利',),
+    'terminal_bonus': ('終期紅利',),
+    'total_cash_value': ('總現金價值', 'Total Value'),
+}
 
 class DatabaseRestructurer:
     """数据库重构器"""
@@ -14,10 +34,14 @@ class DatabaseRestructurer:
     def __init__(self, db_path='insurance_data.db'):
         self.db_path = db_path
         self.conn = None
+        self.changed_years = []  # 本次重建的报告年度（供变动表增量刷新）
+        self.pending_anomalies = {}  # 重构后未确认的异常（按检查类型计数）
+        self.held_years = []  # 因未确认的异常保留上一次数据的报告年度
+        self._initial_build = False  # 宽表重构前为空（首次构建没有可保留的数据）
         
     def connect(self):
         """连接数据库"""
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = connect_writer(self.db_path)
         self.conn.row_factory = sqlite3.Row
         
     def close(self):
@@ -42,152 +66,423 @@ class DatabaseRestructurer:
         return None
     
     def create_new_table(self):
-        """创建新表结构"""
-        print("创建新表 product_fulfillment_rates...")
+        """创建规范化表结构（维度表 + 整数键事实表 + 兼容视图）
+        
+        公司、产品、货币、状态、类别和数据来源只在维度表中存一份，
+        事实表只保存整数代理键；视图 product_fulfillment_rates 和
+        fulfillment_ratios_backup 保持原有列名，app.load_data 等读取方无需修改。
+        """
+        print("创建规范化表结构...")
         
         cursor = self.conn.cursor()
         
-        # 删除旧表（如果存在）
-        cursor.execute("DROP TABLE IF EXISTS product_fulfillment_rates")
+        # 旧版数据库：宽表和备份表是实体表，先迁移
+        self.migrate_legacy_tables()
         
-        # 创建新表
-        cursor.execute("""
-        CREATE TABLE product_fulfillment_rates (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            
-            -- 产品标识
-            company TEXT NOT NULL,
-            product_name TEXT NOT NULL,
+        cursor.executescript("""
+        -- 维度表
+        CREATE TABLE IF NOT EXISTS dim_company (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        
+        CREATE TABLE IF NOT EXISTS dim_product (
+            id INTEGER PRIMARY KEY,
+            company_id INTEGER NOT NULL REFERENCES dim_company(id),
+            name TEXT NOT NULL,
             product_type TEXT,
-            currency TEXT NOT NULL,
-            
-            -- 时间维度
+            UNIQUE(company_id, name)
+        );
+        
+        CREATE TABLE IF NOT EXISTS dim_currency (
+            id INTEGER PRIMARY KEY,
+            code TEXT NOT NULL UNIQUE
+        );
+        
+        CREATE TABLE IF NOT EXISTS dim_category (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        
+        CREATE TABLE IF NOT EXISTS dim_status (
+            id INTEGER PRIMARY KEY,  -- 固定枚举值，见 data_parser.STATUS_CODES
+            code TEXT NOT NULL UNIQUE,
+            label TEXT
+        );
+        
+        CREATE TABLE IF NOT EXISTS dim_source (
+            id INTEGER PRIMARY KEY,
+            url TEXT NOT NULL UNIQUE
+        );
+        """)
+        
+        # 状态使用固定整数枚举 + CHECK 约束（旧版数据库先迁移）
+        self.migrate_status_enum()
+        
+        cursor.executescript(f"""
+        -- 长格式历史（每个类别一行）
+        {self._fact_table_sql('fulfillment_history')};
+        
+        -- NULL 的 policy_year/purchase_year 视为同一值，保证可以 upsert
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_history_key ON fulfillment_history(
+            product_id, category_id, currency_id, data_year,
+            IFNULL(purchase_year, -1), IFNULL(policy_year, -1)
+        );
+        
+        -- 宽格式（每个类别一列）
+        {self._fact_table_sql('fulfillment_rates')};
+        
+        -- 覆盖索引，按实际查询路径设计（见 query_plans.py）
+        -- 旧版索引（idx_product_lookup 等）不匹配任何查询，已由以下索引取代
+        DROP INDEX IF EXISTS idx_product_lookup;
+        DROP INDEX IF EXISTS idx_purchase_year;
+        DROP INDEX IF EXISTS idx_policy_year;
+        DROP INDEX IF EXISTS idx_company_product;
+        
+        -- 单产品曲线：公司 + 产品 + 货币，按购买年份排序
+        CREATE INDEX IF NOT EXISTS idx_rates_product_curve ON fulfillment_rates(
+            product_id, currency_id, purchase_year, data_year, company_id, policy_year,
+            reversionary_bonus_rate, special_bonus_rate, annual_bonus_rate,
+            terminal_bonus_rate, total_cash_value_rate
+        );
+        
+        -- 同一购买年份的跨产品对比：报告年度 + 购买年份 + 货币
+        CREATE INDEX IF NOT EXISTS idx_rates_cohort ON fulfillment_rates(
+            data_year, purchase_year, currency_id, company_id, product_id,
+            reversionary_bonus_rate, special_bonus_rate, annual_bonus_rate,
+            terminal_bonus_rate, total_cash_value_rate
+        );
+        """)
+        
+        self._create_views()
+        self.conn.commit()
+        print("✓ 规范化表结构就绪")
+    
+    @staticmethod
+    def _fact_table_sql(table, name=None):
+        """事实表建表语句（name 为实际表名，迁移时用临时表名）
+        
+        状态列只存 STATUS_CODES 中的整数枚举，由 CHECK 约束保证。
+        """
+        name = name or table
+        allowed = ', '.join(str(v) for v in sorted(STATUS_CODES.values()))
+        if table == 'fulfillment_history':
+            return f"""CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            company_id INTEGER NOT NULL REFERENCES dim_company(id),
+            product_id INTEGER NOT NULL REFERENCES dim_product(id),
+            category_id INTEGER NOT NULL REFERENCES dim_category(id),
+            currency_id INTEGER NOT NULL REFERENCES dim_currency(id),
+            policy_year INTEGER,
+            purchase_year INTEGER,
+            fulfillment_rate INTEGER,
+            status_id INTEGER NOT NULL REFERENCES dim_status(id) CHECK (status_id IN ({allowed})),
             data_year INTEGER NOT NULL,
-            purchase_year INTEGER NOT NULL,
-            policy_year INTEGER,  -- 允许NULL，因为周大福数据没有policy_year
-            
-            -- 分红实现率（宽格式）
-            reversionary_bonus_rate INTEGER,
-            reversionary_bonus_status TEXT,
-            
-            special_bonus_rate INTEGER,
-            special_bonus_status TEXT,
-            
-            annual_bonus_rate INTEGER,
-            annual_bonus_status TEXT,
-            
-            terminal_bonus_rate INTEGER,
-            terminal_bonus_status TEXT,
-            
-            total_cash_value_rate INTEGER,
-            total_cash_value_status TEXT,
-            
-            -- 元数据
             last_updated TEXT NOT NULL,
-            data_source TEXT,
-            
-            -- 唯一约束
-            UNIQUE(company, product_name, currency, data_year, purchase_year)
+            source_id INTEGER REFERENCES dim_source(id)
+        )"""
+        category_columns = ''.join(
+            f"""
+            {prefix}_rate INTEGER,
+            {prefix}_status_id INTEGER REFERENCES dim_status(id) CHECK ({prefix}_status_id IN ({allowed})),"""
+            for prefix in WIDE_CATEGORIES
         )
-        """)
+        return f"""CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            company_id INTEGER NOT NULL REFERENCES dim_company(id),
+            product_id INTEGER NOT NULL REFERENCES dim_product(id),
+            currency_id INTEGER NOT NULL REFERENCES dim_currency(id),
+            data_year INTEGER NOT NULL,
+            purchase_year INTEGER NOT NULL,
+            policy_year INTEGER,  -- 允许NULL，因为周大福数据没有policy_year{category_columns}
+            last_updated TEXT NOT NULL,
+            source_id INTEGER REFERENCES dim_source(id),
+            UNIQUE(product_id, currency_id, data_year, purchase_year)
+        )"""
+    
+    def migrate_status_enum(self):
+        """把 dim_status 迁移为固定整数枚举，事实表加上 CHECK 约束
         
-        # 创建索引
-        cursor.execute("""
-        CREATE INDEX idx_product_lookup ON product_fulfillment_rates(
-            company, product_name, currency, data_year
-        )
-        """)
+        旧版 dim_status 按插入顺序编号、事实表没有 CHECK 约束：按状态码重新编号，
+        事实表按新表结构重建（SQLite 不能给已有表添加 CHECK 约束）。已迁移的数据库只更新显示名称。
+        """
+        cursor = self.conn.cursor()
+        if 'label' not in [row[1] for row in cursor.execute("PRAGMA table_info(dim_status)")]:
+            cursor.execute("ALTER TABLE dim_status ADD COLUMN label TEXT")
         
-        cursor.execute("""
-        CREATE INDEX idx_purchase_year ON product_fulfillment_rates(purchase_year)
+        old_ids = {row['code']: row['id'] for row in cursor.execute("SELECT id, code FROM dim_status")}
+        unknown = set(old_ids) - set(STATUS_CODES)
+        if unknown:
+            raise ValueError(f"dim_status 中有未知状态码: {', '.join(sorted(unknown))}")
+        remap = {old_id: STATUS_CODES[code] for code, old_id in old_ids.items() if STATUS_CODES[code] != old_id}
+        rebuild = [
+            table for table in ('fulfillment_history', 'fulfillment_rates')
+            if self._object_type(table) == 'table' and (remap or 'CHECK' not in self._table_sql(table))
+        ]
+        
+        cursor.execute("BEGIN")
+        if rebuild:
+            print(f"  - 状态迁移为整数枚举，重建 {', '.join(rebuild)}...")
+            # 兼容视图引用事实表，重建后由 _create_views 重新创建
+            cursor.execute("DROP VIEW IF EXISTS product_fulfillment_rates")
+            cursor.execute("DROP VIEW IF EXISTS fulfillment_ratios_backup")
+            for table in rebuild:
+                self._rebuild_fact_table(table, remap)
+        if remap:
+            cursor.execute("DELETE FROM dim_status")
+        cursor.executemany("""
+            INSERT INTO dim_status (id, code, label) VALUES (?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET code = excluded.code, label = excluded.label
+        """, [(status_id, code, STATUS_LABELS[code]) for code, status_id in STATUS_CODES.items()])
+        self.conn.commit()
+    
+    def _table_sql(self, name):
+        """sqlite_master 中的建表语句"""
+        return self.conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (name,)).fetchone()[0]
+    
+    def _rebuild_fact_table(self, table, remap):
+        """按新表结构（带 CHECK 约束）重建事实表，状态列按 remap 重新编号；索引随后由建表脚本重建"""
+        cursor = self.conn.cursor()
+        status_columns = (['status_id'] if table == 'fulfillment_history'
+                          else [f'{prefix}_status_id' for prefix in WIDE_CATEGORIES])
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        
+        def select_expr(column):
+            if column not in status_columns or not remap:
+                return column
+            cases = ' '.join(f'WHEN {old} THEN {new}' for old, new in remap.items())
+            return f'CASE {column} {cases} ELSE {column} END'
+        
+        cursor.execute(f"DROP TABLE IF EXISTS {table}_new")
+        cursor.execute(self._fact_table_sql(table, f'{table}_new'))
+        cursor.execute(f"""
+            INSERT INTO {table}_new ({', '.join(columns)})
+            SELECT {', '.join(select_expr(c) for c in columns)} FROM {table}
         """)
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    
+    def _create_views(self):
+        """创建与旧表同名、同列的兼容视图
         
-        cursor.execute("""
-        CREATE INDEX idx_policy_year ON product_fulfillment_rates(policy_year)
+        公司经由产品关联（c.id = p.company_id），按公司+产品名筛选时
+        规划器可以逐级走唯一索引，再按覆盖索引顺序读取事实表。
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("DROP VIEW IF EXISTS product_fulfillment_rates")
+        cursor.execute("DROP VIEW IF EXISTS fulfillment_ratios_backup")
+        
+        status_columns = []
+        status_joins = []
+        for i, prefix in enumerate(WIDE_CATEGORIES):
+            status_columns.append(f"f.{prefix}_rate, s{i}.code AS {prefix}_status")
+            status_joins.append(f"LEFT JOIN dim_status s{i} ON s{i}.id = f.{prefix}_status_id")
+        
+        cursor.execute(f"""
+        CREATE VIEW product_fulfillment_rates AS
+        SELECT
+            f.id,
+            c.name AS company,
+            p.name AS product_name,
+            p.product_type,
+            cu.code AS currency,
+            f.data_year,
+            f.purchase_year,
+            f.policy_year,
+            {', '.join(status_columns)},
+            f.last_updated,
+            src.url AS data_source
+        FROM fulfillment_rates f
+        JOIN dim_product p ON p.id = f.product_id
+        JOIN dim_company c ON c.id = p.company_id
+        JOIN dim_currency cu ON cu.id = f.currency_id
+        {' '.join(status_joins)}
+        LEFT JOIN dim_source src ON src.id = f.source_id
         """)
         
         cursor.execute("""
-        CREATE INDEX idx_company_product ON product_fulfillment_rates(company, product_name)
+        CREATE VIEW fulfillment_ratios_backup AS
+        SELECT
+            h.id,
+            c.name AS company,
+            p.name AS product_name,
+            p.product_type,
+            cat.name AS category,
+            cu.code AS currency,
+            h.policy_year,
+            h.purchase_year,
+            h.fulfillment_rate,
+            st.code AS status,
+            h.data_year,
+            h.last_updated,
+            src.url AS data_source
+        FROM fulfillment_history h
+        JOIN dim_product p ON p.id = h.product_id
+        JOIN dim_company c ON c.id = p.company_id
+        JOIN dim_category cat ON cat.id = h.category_id
+        JOIN dim_currency cu ON cu.id = h.currency_id
+        JOIN dim_status st ON st.id = h.status_id
+        LEFT JOIN dim_source src ON src.id = h.source_id
         """)
+    
+    def _object_type(self, name):
+        """sqlite_master 中对象的类型（table/view），不存在返回 None"""
+        row = self.conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+    
+    def migrate_legacy_tables(self):
+        """迁移旧版（未规范化）数据库
+        
+        旧版的 fulfillment_ratios_backup 是改名后的原始长表，作为待导入数据并入
+        fulfillment_ratios；旧版宽表 product_fulfillment_rates 可由历史数据重建，直接删除。
+        """
+        cursor = self.conn.cursor()
+        
+        if self._object_type('fulfillment_ratios_backup') == 'table':
+            print("  - 迁移旧版备份表 fulfillment_ratios_backup...")
+            if self._object_type('fulfillment_ratios') is None:
+                cursor.execute("ALTER TABLE fulfillment_ratios_backup RENAME TO fulfillment_ratios")
+            else:
+                cursor.execute("INSERT OR IGNORE INTO fulfillment_ratios SELECT * FROM fulfillment_ratios_backup")
+                cursor.execute("DROP TABLE fulfillment_ratios_backup")
+        
+        if self._object_type('product_fulfillment_rates') == 'table':
+            print("  - 删除旧版宽表 product_fulfillment_rates（将由历史数据重建）...")
+            cursor.execute("DROP TABLE product_fulfillment_rates")
         
         self.conn.commit()
-        print("✓ 新表创建成功")
+    
+    def _merge_staging(self, cursor):
+        """待导入长表 -> 维度表 + 历史事实表"""
+        # 状态是固定枚举，不在枚举中的状态码无法写入事实表
+        unknown = [row[0] for row in cursor.execute(
+            "SELECT DISTINCT status FROM fulfillment_ratios WHERE status NOT IN (SELECT code FROM dim_status)"
+        )]
+        if unknown:
+            raise ValueError(f"待导入数据中有未知状态码: {', '.join(map(str, unknown))}")
+        
+        # 1. 补充维度
+        print("  - 更新维度表...")
+        cursor.executescript("""
+        INSERT OR IGNORE INTO dim_company (name)
+            SELECT DISTINCT company FROM fulfillment_ratios ORDER BY company;
+        INSERT OR IGNORE INTO dim_product (company_id, name)
+            SELECT DISTINCT c.id, s.product_name
+            FROM fulfillment_ratios s JOIN dim_company c ON c.name = s.company
+            ORDER BY c.id, s.product_name;
+        UPDATE dim_product SET product_type = (
+            SELECT MAX(s.product_type) FROM fulfillment_ratios s
+            JOIN dim_company c ON c.name = s.company
+            WHERE c.id = dim_product.company_id AND s.product_name = dim_product.name
+        ) WHERE product_type IS NULL;
+        INSERT OR IGNORE INTO dim_currency (code)
+            SELECT DISTINCT currency FROM fulfillment_ratios ORDER BY currency;
+        INSERT OR IGNORE INTO dim_category (name)
+            SELECT DISTINCT category FROM fulfillment_ratios ORDER BY category;
+        INSERT OR IGNORE INTO dim_source (url)
+            SELECT DISTINCT data_source FROM fulfillment_ratios
+            WHERE data_source IS NOT NULL ORDER BY data_source;
+        """)
         
+        # 2. 合并到历史事实表
+        print("  - 合并到历史表...")
+        cursor.execute("""
+        INSERT INTO fulfillment_history (
+            company_id, product_id, category_id, currency_id,
+            policy_year, purchase_year, fulfillment_rate, status_id,
+            data_year, last_updated, source_id
+        )
+        SELECT c.id, p.id, cat.id, cu.id,
+               s.policy_year, s.purchase_year, MAX(s.fulfillment_rate), st.id,
+               s.data_year, s.last_updated, src.id
+        FROM fulfillment_ratios s
+        JOIN dim_company c ON c.name = s.company
+        JOIN dim_product p ON p.company_id = c.id AND p.name = s.product_name
+        JOIN dim_category cat ON cat.name = s.category
+        JOIN dim_currency cu ON cu.code = s.currency
+        JOIN dim_status st ON st.code = s.status
+        LEFT JOIN dim_source src ON src.url = s.data_source
+        -- 同一键的重复行（policy_year 为 NULL 时 UNIQUE 约束不生效）取最大值，与旧版PIVOT一致
+        GROUP BY p.id, cat.id, cu.id, s.data_year, s.purchase_year, s.policy_year
+        ON CONFLICT (product_id, category_id, currency_id, data_year,
+                     IFNULL(purchase_year, -1), IFNULL(policy_year, -1))
+        DO UPDATE SET fulfillment_rate = excluded.fulfillment_rate,
+                      status_id = excluded.status_id,
+                      last_updated = excluded.last_updated,
+                      source_id = excluded.source_id
+        """)
+    
     def transform_data(self):
-        """转换数据"""
+        """转换数据：待导入长表 -> 维度表 + 历史事实表 -> 宽表
+        
+        只重建本次导入涉及的报告年度，以及异常已确认、可以上线的暂缓年度，其余年度的宽表数据保持不变。
+        """
         print("\n开始数据转换...")
         
         cursor = self.conn.cursor()
         
-        # 1. 先创建临时表，添加purchase_year字段
-        print("  - 创建临时表...")
-        cursor.execute("""
-        CREATE TEMPORARY TABLE temp_with_purchase_year AS
-        SELECT 
-            *,
-            CAST(
-                CASE 
-                    WHEN policy_year LIKE '%(%' THEN 
-                        SUBSTR(policy_year, INSTR(policy_year, '(') + 1, 4)
-                    ELSE NULL
-                END AS INTEGER
-            ) as purchase_year
-        FROM fulfillment_ratios
-        """)
+        staged = self._object_type('fulfillment_ratios') is not None
+        released = releasable_years(self.conn)
+        if not staged and not released:
+            print("  - 没有待导入数据 (fulfillment_ratios)")
+            return cursor.execute("SELECT COUNT(*) FROM fulfillment_rates").fetchone()[0]
         
-        # 2. 使用PIVOT转换数据
-        print("  - 执行PIVOT转换...")
-        cursor.execute("""
-        INSERT INTO product_fulfillment_rates (
-            company, product_name, product_type, currency, 
+        staged_years = []
+        if staged:
+            self._merge_staging(cursor)
+            staged_years = [row[0] for row in cursor.execute("SELECT DISTINCT data_year FROM fulfillment_ratios")]
+        if released:
+            print(f"  - 异常已确认，上线暂缓的报告年度: {', '.join(map(str, released))}")
+        
+        # 3. 重建本次涉及年度的宽表（PIVOT）
+        data_years = sorted(set(staged_years) | set(released))
+        self.changed_years = data_years
+        print(f"  - 执行PIVOT转换 (报告年度: {', '.join(map(str, sorted(data_years)))})...")
+        placeholders = ', '.join('?' * len(data_years))
+        # 保留重构前的宽表数据：出现未确认的异常时恢复（见 hold_back_pending_years）
+        self._initial_build = cursor.execute("SELECT 1 FROM fulfillment_rates LIMIT 1").fetchone() is None
+        cursor.execute("DROP TABLE IF EXISTS temp.previous_rates")
+        cursor.execute(f"CREATE TEMP TABLE previous_rates AS "
+                       f"SELECT * FROM fulfillment_rates WHERE data_year IN ({placeholders})", data_years)
+        cursor.execute(f"DELETE FROM fulfillment_rates WHERE data_year IN ({placeholders})", data_years)
+        
+        pivot_columns = []
+        for prefix, categories in WIDE_CATEGORIES.items():
+            names = ', '.join(f"'{name}'" for name in categories)
+            pivot_columns.append(
+                f"MAX(CASE WHEN cat.name IN ({names}) THEN h.fulfillment_rate END) AS {prefix}_rate,\n"
+                f"            MAX(CASE WHEN cat.name IN ({names}) THEN h.status_id END) AS {prefix}_status_id"
+            )
+        cursor.execute(f"""
+        INSERT INTO fulfillment_rates (
+            company_id, product_id, currency_id,
             data_year, purchase_year, policy_year,
-            reversionary_bonus_rate, reversionary_bonus_status,
-            special_bonus_rate, special_bonus_status,
-            annual_bonus_rate, annual_bonus_status,
-            terminal_bonus_rate, terminal_bonus_status,
-            total_cash_value_rate, total_cash_value_status,
-            last_updated, data_source
+            {', '.join(f'{p}_rate, {p}_status_id' for p in WIDE_CATEGORIES)},
+            last_updated, source_id
         )
         SELECT 
-            company,
-            product_name,
-            MAX(product_type) as product_type,
-            currency,
-            data_year,
-            purchase_year,
-            MIN(policy_year) as policy_year,  -- 使用最小的policy_year作为代表
-            
-            -- 歸原紅利
-            MAX(CASE WHEN category = '歸原紅利' THEN fulfillment_rate END) as reversionary_bonus_rate,
-            MAX(CASE WHEN category = '歸原紅利' THEN status END) as reversionary_bonus_status,
-            
-            -- 特別紅利
-            MAX(CASE WHEN category = '特別紅利' THEN fulfillment_rate END) as special_bonus_rate,
-            MAX(CASE WHEN category = '特別紅利' THEN status END) as special_bonus_status,
-            
-            -- 週年紅利
-            MAX(CASE WHEN category = '週年紅利' THEN fulfillment_rate END) as annual_bonus_rate,
-            MAX(CASE WHEN category = '週年紅利' THEN status END) as annual_bonus_status,
-            
-            -- 終期紅利
-            MAX(CASE WHEN category = '終期紅利' THEN fulfillment_rate END) as terminal_bonus_rate,
-            MAX(CASE WHEN category = '終期紅利' THEN status END) as terminal_bonus_status,
-            
-            -- 總現金價值 / Total Value
-            MAX(CASE WHEN category IN ('總現金價值', 'Total Value') THEN fulfillment_rate END) as total_cash_value_rate,
-            MAX(CASE WHEN category IN ('總現金價值', 'Total Value') THEN status END) as total_cash_value_status,
-            
-            MAX(last_updated) as last_updated,
-            MAX(data_source) as data_source
-        FROM temp_with_purchase_year
-        WHERE purchase_year IS NOT NULL  -- 只处理有购买年份的记录
-        GROUP BY company, product_name, currency, data_year, purchase_year
-        """)
+            h.company_id,
+            h.product_id,
+            h.currency_id,
+            h.data_year,
+            h.purchase_year,
+            MIN(h.policy_year) as policy_year,  -- 使用最小的policy_year作为代表
+            {(',' + chr(10) + '            ').join(pivot_columns)},
+            MAX(h.last_updated) as last_updated,
+            MAX(h.source_id) as source_id
+        FROM fulfillment_history h
+        JOIN dim_category cat ON cat.id = h.category_id
+        WHERE h.purchase_year IS NOT NULL  -- 只处理有购买年份的记录
+          AND h.data_year IN ({placeholders})
+        GROUP BY h.product_id, h.currency_id, h.data_year, h.purchase_year
+        """, data_years)
         
         self.conn.commit()
         
         # 获取转换后的记录数
-        cursor.execute("SELECT COUNT(*) FROM product_fulfillment_rates")
+        cursor.execute("SELECT COUNT(*) FROM fulfillment_rates")
         new_count = cursor.fetchone()[0]
         
         print(f"✓ 数据转换完成，共 {new_count} 条记录")
@@ -254,19 +549,94 @@ class DatabaseRestructurer:
         
         print("\n✓ 数据验证完成")
     
+    def refresh_derived_tables(self):
+        """刷新依赖宽表的派生数据"""
+        print("\n刷新派生数据...")
+        
+        # 异常检测最先进行：有未确认异常的年度先恢复为重构前的数据，其余派生数据按恢复后的宽表计算
+        anomaly_count = AnomalyDetector(self.db_path).refresh(self.changed_years)
+        self.pending_anomalies = pending_anomalies(self.conn)
+        if anomaly_count:
+            print(f"⚠️  发现 {anomaly_count} 条可疑数据，请运行 anomaly_detector.py 核对")
+        else:
+            print("✓ 异常检测通过")
+        self.hold_back_pending_years()
+        
+        # 产品搜索索引
+        search_index = ProductSearchIndex(self.db_path)
+        product_count = search_index.rebuild()
+        search_index.close()
+        print(f"✓ 产品搜索索引已重建 ({product_count} 个产品)")
+        
+        # 排行榜
+        ranking_count = RankingBuilder(self.db_path).refresh()
+        print(f"✓ 排行榜已刷新 ({ranking_count} 条)")
+        
+        # 首页指标预聚合
+        rollup_count = RollupBuilder(self.db_path).refresh()
+        print(f"✓ 指标预聚合已刷新 ({rollup_count} 行)")
+        
+        # 报告年度变动（只重算本次涉及的年度）
+        change_count = ChangeBuilder(self.db_path).refresh(self.changed_years)
+        print(f"✓ 报告年度变动已刷新 ({change_count} 行)")
+        
+        # 按产品打包的曲线（只重建本次涉及的报告年度）
+        curve_count = CurveBuilder(self.db_path).refresh(self.changed_years)
+        print(f"✓ 实现率曲线已打包 ({curve_count} 条)")
+        
+        # 更新查询规划器统计信息（覆盖索引的选择依赖它）
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+        print("✓ 查询规划统计已更新")
+    
+    def hold_back_pending_years(self):
+        """本次重建的年度中有未确认异常的：宽表恢复为重构前的数据并记入 held_report_years
+
+        新数据已合并到 fulfillment_history，异常确认后下一次重构（transform_data）重新展开上线。
+        宽表重构前为空（首次构建）时没有可保留的数据，不暂缓。
+        """
+        if not self.changed_years:
+            return
+        cursor = self.conn.cursor()
+        placeholders = ', '.join('?' * len(self.changed_years))
+        cursor.execute(f"DELETE FROM held_report_years WHERE data_year IN ({placeholders})", self.changed_years)
+        pending = pending_years(self.conn, self.changed_years)
+        self.held_years = [] if self._initial_build else pending
+        if self.held_years:
+            held = ', '.join('?' * len(self.held_years))
+            cursor.execute(f"DELETE FROM fulfillment_rates WHERE data_year IN ({held})", self.held_years)
+            cursor.execute(f"INSERT INTO fulfillment_rates SELECT * FROM temp.previous_rates "
+                           f"WHERE data_year IN ({held})", self.held_years)
+            held_at = datetime.now().isoformat(timespec='seconds')
+            cursor.executemany("INSERT INTO held_report_years (data_year, held_at) VALUES (?, ?)",
+                               [(year, held_at) for year in self.held_years])
+            print(f"⚠️  报告年度 {', '.join(map(str, self.held_years))} 有未确认的异常，"
+                  f"宽表保留重构前的数据，确认后下一次重构上线")
+        cursor.execute("DROP TABLE IF EXISTS temp.previous_rates")
+        self.conn.commit()
+    
     def backup_old_table(self):
-        """备份旧表"""
-        print("\n备份旧表...")
+        """归档待导入数据：已合并到 fulfillment_history 的原始长表直接删除
+        
+        历史数据可通过视图 fulfillment_ratios_backup 按原有列名查询。
+        """
+        print("\n归档待导入数据...")
         cursor = self.conn.cursor()
         
-        # 重命名旧表
-        cursor.execute("ALTER TABLE fulfillment_ratios RENAME TO fulfillment_ratios_backup")
+        cursor.execute("DROP TABLE IF EXISTS fulfillment_ratios")
         
         self.conn.commit()
-        print("✓ 旧表已重命名为 fulfillment_ratios_backup")
+        print("✓ 原始数据已归档到 fulfillment_history（视图 fulfillment_ratios_backup）")
+    
+    def vacuum(self):
+        """回收删除旧表后的空间"""
+        self.conn.execute("VACUUM")
     
-    def run(self, backup_old=True):
-        """执行完整的重构流程"""
+    def run(self, backup_old=True, vacuum=True) -> bool:
+        """执行完整的重构流程，成功返回 True
+        
+        增量刷新（如调度器每轮只导入少量变化数据）时可传 vacuum=False 跳过 VACUUM。
+        """
         try:
             self.connect()
             
@@ -283,16 +653,22 @@ class DatabaseRestructurer:
             # 3. 验证数据
             self.validate_data()
             
-            # 4. 备份旧表（可选）
+            # 4. 刷新派生数据
+            self.refresh_derived_tables()
+            
+            # 5. 归档待导入数据（可选）
             if backup_old:
                 self.backup_old_table()
+                if vacuum:
+                    self.vacuum()
             
             print("\n" + "="*80)
             print("✓ 数据库重构完成！")
             print("="*80)
-            print(f"\n新表: product_fulfillment_rates ({new_count} 条记录)")
+            print(f"\n宽表: product_fulfillment_rates ({new_count} 条记录)")
             if backup_old:
-                print("旧表: fulfillment_ratios_backup (已备份)")
+                print("历史: fulfillment_ratios_backup (已归档)")
+            return True
             
         except Exception as e:
             print(f"\n❌ 错误: {e}")
@@ -300,15 +676,41 @@ class DatabaseRestructurer:
             traceback.print_exc()
             if self.conn:
                 self.conn.rollback()
+            return False
         finally:
             self.close()
 
 
-def main():
+# 重构成功但存在未确认的异常时的退出码（cron 等可据此暂停后续发布）
+EXIT_PENDING_ANOMALIES = 2
+
+
+def pivot(db_path: str = 'insurance_data.db', keep_staging: bool = False) -> int:
+    """重构并返回退出码：0 成功，1 失败，EXIT_PENDING_ANOMALIES 重构完成但有未确认的异常"""
+    restructurer = DatabaseRestructurer(db_path)
+    # 与导入和调度器互斥：重构会删除待导入表
+    with write_lock(db_path):
+        if not restructurer.run(backup_old=not keep_staging):
+            return 1
+    if restructurer.pending_anomalies:
+        counts = ', '.join(f'{name} {count}' for name, count in restructurer.pending_anomalies.items())
+        held = (f"，之后再次重构即上线暂缓的报告年度 {', '.join(map(str, restructurer.held_years))}"
+                if restructurer.held_years else '')
+        print(f"\n⚠️  存在未确认的异常（{counts}），核对后运行 anomaly_detector.py --accept{held}"
+              f"（退出码 {EXIT_PENDING_ANOMALIES}）")
+        return EXIT_PENDING_ANOMALIES
+    return 0
+
+
+def main(argv=None) -> int:
     """主函数"""
-    restructurer = DatabaseRestructurer('insurance_data.db')
-    restructurer.run(backup_old=True)
+    arg_parser = argparse.ArgumentParser(description='把待导入表规范化为维度表 + 宽表')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径')
+    arg_parser.add_argument('--keep-staging', action='store_true', help='保留待导入表（不归档、不VACUUM）')
+    args = arg_parser.parse_args(argv)
+
+    return pivot(args.db, keep_staging=args.keep_staging)
 
 
 if __name__ == '__main__':
-    main()
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+"""
+首页指标预聚合模块
+Precomputed Rollups for the Dashboard's Headline Metrics
+
+按 公司 × 产品 × 货币 × 购买年份 粒度维护求和/计数，
+首页四个指标卡（产品数、平均归原红利、平均特别红利、记录数）
+通过再聚合这些行得到，而不是每次rerun扫描整张宽表。
+"""
+
+import sqlite3
+from typing import Any, Dict, Optional, Sequence
+
+from db_connections import connect_writer
+
+
+class RollupBuilder:
+    """指标预聚合表构建器"""
+
+    def __init__(self, db_path: str = 'insurance_data.db'):
+        self.db_path = db_path
+
+    def create_table(self, conn: sqlite3.Connection):
+        """创建预聚合表"""
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS metric_rollups (
+                company TEXT NOT NULL,
+                product_name TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                purchase_year INTEGER NOT NULL,
+                row_count INTEGER NOT NULL,
+                reversionary_sum INTEGER NOT NULL,
+                reversionary_count INTEGER NOT NULL,
+                special_sum INTEGER NOT NULL,
+                special_count INTEGER NOT NULL,
+                PRIMARY KEY (company, product_name, currency, purchase_year)
+            ) WITHOUT ROWID;
+
+            -- 未选公司、只选货币/购买年份时使用（覆盖索引）
+            CREATE INDEX IF NOT EXISTS idx_rollups_currency ON metric_rollups(
+                currency, purchase_year, row_count,
+                reversionary_sum, reversionary_count, special_sum, special_count
+            );
+        ''')
+
+    def refresh(self) -> int:
+        """重建预聚合表，返回行数"""
+        conn = connect_writer(self.db_path)
+        self.create_table(conn)
+        with conn:
+            conn.execute('DELETE FROM metric_rollups')
+            conn.execute('''
+                INSERT INTO metric_rollups
+                SELECT company, product_name, currency, purchase_year,
+                       COUNT(*),
+                       COALESCE(SUM(reversionary_bonus_rate), 0),
+                       COUNT(reversionary_bonus_rate),
+                       COALESCE(SUM(special_bonus_rate), 0),
+                       COUNT(special_bonus_rate)
+                FROM product_fulfillment_rates
+                GROUP BY company, product_name, currency, purchase_year
+            ''')
+        count = conn.execute('SELECT COUNT(*) FROM metric_rollups').fetchone()[0]
+        conn.close()
+        return count
+
+
+def rollup_filter(company: Optional[str] = None, product_name: Optional[str] = None,
+                  currency: Optional[str] = None,
+                  purchase_years: Optional[Sequence[int]] = None):
+    """生成 WHERE 子句和参数（None 表示不筛选）"""
+    clauses, params = [], []
+    for column, value in (('company', company), ('product_name', product_name), ('currency', currency)):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    if purchase_years:
+        clauses.append(f"purchase_year IN ({', '.join('?' * len(purchase_years))})")
+        params.extend(int(y) for y in purchase_years)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    return where, params
+
+
+def headline_metrics(conn: sqlite3.Connection, **filters) -> Dict[str, Any]:
+    """由预聚合行计算首页指标"""
+    where, params = rollup_filter(**filters)
+    row = conn.execute(f'''
+        SELECT COUNT(DISTINCT product_name),
+               SUM(reversionary_sum) * 1.0 / NULLIF(SUM(reversionary_count), 0),
+               SUM(special_sum) * 1.0 / NULLIF(SUM(special_count), 0),
+               COALESCE(SUM(row_count), 0)
+        FROM metric_rollups
+        {where}
+    ''', params).fetchone()
+    return {
+        'product_count': row[0],
+        'avg_reversionary': row[1],
+        'avg_special': row[2],
+        'record_count': row[3],
+    }
@@ -0,0 +1,335 @@
+"""
+数据刷新调度器
+Refresh Scheduler Daemon with Incremental Scrape and ETL
+
+常驻进程，按保险公司各自的间隔检查数据源，只处理发生变化的部分：
+- 在线抓取的来源（周大福官网）：抓取后比较页面内容哈希（与网页缓存相同的 SHA-256），未变化则跳过
+- 原始抓取文件（<input-dir> 下的 *(aia).json 等）：只比较文件大小和修改时间，不读取内容
+- 有变化时只把变化的记录 upsert 到待导入表（指定 --reject-log / --quarantine 时无效记录写入
+  ValidationErrorSink，每轮一个 run_id），再增量重构（只重建涉及的报告年度），最后发布新快照
+- 重构时检测到未确认的可疑数据（见 anomaly_detector.py）则该报告年度的宽表保留上一次的数据，
+  也暂不发布快照，直接读工作库和读快照的应用都看不到可疑数据；人工确认后下一轮上线并发布
+
+每个来源的下次运行时间加随机抖动，避免多个来源同时触发；每轮运行持有写入锁（db_connections.write_lock），
+手动运行的导入、回填、重构（cli.py ingest / pivot 等）持有同一把锁，彼此不会重叠：
+调度器拿不到锁时跳过本轮稍后重试，手动命令则等待当前一轮结束。
+
+    python scheduler.py --input-dir data/raw --snapshot-dir data/snapshots
+    python scheduler.py --once --force        # 立即检查全部来源一次后退出（可用于 cron）
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import signal
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from data_loader import DatabaseLoader
+from anomaly_detector import pending_anomalies, releasable_years
+from data_parser import DataParser, DataValidator, discover_extracts
+from db_connections import connect_reader, lock_path_for, write_lock
+from snapshots import current_snapshot, publish_snapshot
+from validation_sink import ValidationErrorSink, add_sink_arguments
+
+
+# 各来源默认配置：检查间隔（秒），scrape=True 表示在线抓取官网
+DEFAULT_SOURCES = {
+    'ctf': {'interval': 600, 'scrape': True},
+    'aia': {'interval': 300},
+    'prudential': {'interval': 300},
+}
+
+
+def file_signature(path: str) -> str:
+    """文件签名：大小 + 修改时间（只 stat，不读内容）"""
+    stat = os.stat(path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+
+class RefreshScheduler:
+    """按来源间隔增量刷新数据库并发布快照"""
+
+    def __init__(self, db_path: str = 'insurance_data.db', input_dir: str = os.path.join('data', 'raw'),
+                 snapshot_dir: Optional[str] = None, sources: Optional[Dict[str, Dict[str, Any]]] = None,
+                 data_year: int = 2024, jitter: float = 0.1, batch_size: int = 5000,
+                 state_path: str = os.path.join('data', 'cache', 'scheduler_state.json'),
+                 lock_path: Optional[str] = None, keep_snapshots: int = 3,
+                 reject_log: Optional[str] = None, quarantine: bool = False,
+                 retry_seconds: float = 5.0, max_backoff: float = 300.0):
+        self.db_path = db_path
+        self.input_dir = input_dir
+        self.snapshot_dir = snapshot_dir
+        self.sources = sources or DEFAULT_SOURCES
+        self.data_year = data_year
+        self.jitter = jitter
+        self.batch_size = batch_size
+        self.state_path = state_path
+        self.lock_path = lock_path or lock_path_for(db_path)
+        self.keep_snapshots = keep_snapshots
+        # 无效记录输出（见 validation_sink.py）：JSONL 路径 / 是否写入工作库的隔离表
+        self.reject_log = reject_log
+        self.quarantine = quarantine
+        # 被锁时的重试间隔；整轮失败时按 retry_seconds × 2^(连续失败次数-1) 退避，最长 max_backoff
+        self.retry_seconds = retry_seconds
+        self.max_backoff = max_backoff
+        self._failures = 0
+        self.state = self._load_state()
+        self._stopping = False
+
+    def _load_state(self) -> Dict[str, Any]:
+        """读取各来源的下次运行时间和指纹"""
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def _source_state(self, name: str) -> Dict[str, Any]:
+        return self.state.setdefault(name, {'next_run': 0, 'fingerprint': None, 'files': {}})
+
+    def _schedule_next(self, name: str, now: float):
+        """下次运行时间 = 间隔 ×（1 ± 抖动）"""
+        interval = self.sources[name]['interval']
+        self._source_state(name)['next_run'] = now + interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def due_sources(self, now: float, force: bool = False) -> List[str]:
+        """到期的来源"""
+        return [name for name in self.sources if force or self._source_state(name)['next_run'] <= now]
+
+    def _scrape_changes(self, name: str) -> Dict[str, Any]:
+        """在线抓取：页面哈希与上次相同时不解析"""
+        from ctf_scraper import CTFScraper
+        from pipeline import RecordNormalizer
+
+        scraper = CTFScraper()
+        html = scraper.fetch_page()
+        sha256 = hashlib.sha256(html.encode('utf-8')).hexdigest()
+        if sha256 == self._source_state(name)['fingerprint']:
+            return {'batches': [], 'commit': {}}
+        normalizer = RecordNormalizer(data_source=scraper.url, parser=DataParser(data_year=scraper.data_year))
+        records = [normalizer.normalize(r) for r in scraper.iter_records(html)]
+        return {'batches': [(scraper.url, records)], 'commit': {'fingerprint': sha256}}
+
+    def _extract_changes(self, name: str) -> Dict[str, Any]:
+        """原始抓取文件：只解析签名变化的文件，按文件返回 (路径, 记录)"""
+        known = self._source_state(name)['files']
+        batches, files = [], {}
+        for insurer, year, path in discover_extracts(self.input_dir, default_year=self.data_year):
+            if insurer != name:
+                continue
+            # 同一文件无论以相对路径还是绝对路径（或经符号链接）传入 --input-dir，都使用同一个键
+            key = os.path.realpath(path)
+            signature = file_signature(path)
+            if known.get(key) == signature:
+                continue
+            batches.append((path, DataParser(data_year=year).parse_file(insurer, path)))
+            files[key] = signature
+        return {'batches': batches, 'commit': {'files': files}}
+
+    def run_cycle(self, force: bool = False) -> Dict[str, Any]:
+        """运行一轮：检查到期来源 -> 增量导入 -> 增量重构 -> 发布快照"""
+        now = time.time()
+        due = self.due_sources(now, force)
+        summary = {'started_at': datetime.now().isoformat(timespec='seconds'), 'due': due,
+                   'changed': [], 'errors': {}, 'rows': 0, 'rejected': 0, 'snapshot': None, 'quarantined': {},
+                   'held': [], 'locked': False}
+        if not due:
+            return summary
+
+        with write_lock(self.db_path, blocking=False, lock_path=self.lock_path) as acquired:
+            if not acquired:
+                # 其他导入正在进行，稍后重试（不推迟到下一个完整间隔）
+                summary['locked'] = True
+                return summary
+
+            try:
+                self._refresh(due, now, summary)
+                self._failures = 0
+            except Exception as e:
+                # 临时错误（数据库被锁、发布快照时的 I/O 错误等）不终止调度器：
+                # 记录错误并保存状态，到期来源按指数退避重试（指纹未记录，变化的数据会重新处理）
+                self._failures += 1
+                retry = min(self.retry_seconds * 2 ** (self._failures - 1), self.max_backoff)
+                summary['errors']['cycle'] = f'{type(e).__name__}: {e}'
+                print(f"❌ 本轮失败: {summary['errors']['cycle']}，{retry:.0f}s 后重试")
+                for name in due:
+                    self._source_state(name)['next_run'] = now + retry
+                try:
+                    self._save_state()
+                except OSError as save_error:
+                    print(f"❌ 无法保存调度状态: {save_error}")
+        return summary
+
+    def _refresh(self, due: List[str], now: float, summary: Dict[str, Any]):
+        """持有运行锁时执行：检查变化 -> 验证 -> 导入 -> 重构 -> 发布，结果写入 summary"""
+        changes = {}
+        for name in due:
+            try:
+                check = self._scrape_changes if self.sources[name].get('scrape') else self._extract_changes
+                result = check(name)
+                if result['batches'] or any(result['commit'].values()):
+                    changes[name] = result
+            except Exception as e:
+                summary['errors'][name] = f'{type(e).__name__}: {e}'
+                print(f"❌ {name}: {summary['errors'][name]}")
+            self._schedule_next(name, now)
+
+        batches = [batch for result in changes.values() for batch in result['batches']]
+        valid, summary['rejected'] = self._validate(batches)
+        if valid:
+            self._ingest(valid)
+        # 有新数据，或暂缓的报告年度的异常已确认时重构
+        if valid or self._releasable_years():
+            from restructure_database import DatabaseRestructurer
+            restructurer = DatabaseRestructurer(self.db_path)
+            if not restructurer.run(backup_old=True, vacuum=False):
+                summary['errors']['pivot'] = '重构失败'
+                self._save_state()
+                return
+            # 有未确认异常的年度宽表保留上一次的数据，同样报告（--once 退出码为1）
+            summary['quarantined'] = restructurer.pending_anomalies
+            summary['held'] = restructurer.held_years
+
+        if self.snapshot_dir and (valid or self.state.get('publish_pending')
+                                  or current_snapshot(self.snapshot_dir) is None):
+            summary['quarantined'] = self._pending_anomalies()
+            if summary['quarantined']:
+                # 可疑数据暂不发布，确认后（anomaly_detector.py --accept）下一轮发布
+                self.state['publish_pending'] = True
+            else:
+                summary['snapshot'] = publish_snapshot(self.db_path, self.snapshot_dir, self.keep_snapshots)
+                self.state['publish_pending'] = False
+
+        # 导入成功后才记录指纹，失败的来源下一轮会重新处理（被隔离的数据已在工作库中，不重复导入）
+        for name, result in changes.items():
+            state = self._source_state(name)
+            if 'fingerprint' in result['commit']:
+                state['fingerprint'] = result['commit']['fingerprint']
+            state['files'].update(result['commit'].get('files', {}))
+            state['last_changed'] = summary['started_at']
+        summary['changed'] = list(changes)
+        summary['rows'] = len(valid)
+        self._save_state()
+
+    def _validate(self, batches: List[Tuple[str, List[Dict[str, Any]]]]) -> Tuple[List[Dict[str, Any]], int]:
+        """按来源验证变化的记录，返回 (有效记录, 无效记录数)；无效记录写入 ValidationErrorSink（若已配置）"""
+        sink = None
+        if batches and (self.reject_log or self.quarantine):
+            sink = ValidationErrorSink(jsonl_path=self.reject_log,
+                                       db_path=self.db_path if self.quarantine else None)
+        valid, rejected = [], 0
+        try:
+            for source, records in batches:
+                result = DataValidator.validate_batch(records, sink=sink, source=source)
+                valid.extend(result['valid_records'])
+                rejected += result['invalid']
+        finally:
+            if sink is not None:
+                sink.close()
+        return valid, rejected
+
+    def _releasable_years(self) -> List[int]:
+        """异常已确认、等待重构上线的暂缓年度"""
+        conn = connect_reader(self.db_path)
+        try:
+            return releasable_years(conn)
+        finally:
+            conn.close()
+
+    def _pending_anomalies(self) -> Dict[str, int]:
+        """工作库中未确认的异常（按检查类型计数）"""
+        conn = connect_reader(self.db_path)
+        try:
+            return pending_anomalies(conn)
+        finally:
+            conn.close()
+
+    def _ingest(self, records: List[Dict[str, Any]]):
+        """变化的记录批量 upsert 到待导入表"""
+        loader = DatabaseLoader(self.db_path)
+        loader.init_database()
+        for i in range(0, len(records), self.batch_size):
+            loader.bulk_upsert(records[i:i + self.batch_size])
+        loader.conn.commit()
+        loader.close()
+
+    def seconds_until_next(self) -> float:
+        """距最近一个来源到期的秒数"""
+        next_run = min(self._source_state(name)['next_run'] for name in self.sources)
+        return max(next_run - time.time(), 0.0)
+
+    def stop(self, *_):
+        self._stopping = True
+
+    def run_forever(self, poll_seconds: float = 30.0):
+        """常驻运行，收到 SIGTERM / SIGINT 后在当前一轮结束时退出"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        intervals = ', '.join(f"{name}={conf['interval']}s" for name, conf in self.sources.items())
+        print(f"⏰ 调度器启动: {intervals}")
+        while not self._stopping:
+            summary = self.run_cycle()
+            if summary['changed']:
+                print(f"✅ {summary['started_at']} 更新 {', '.join(summary['changed'])}: "
+                      f"{summary['rows']} 条, 快照 {summary['snapshot']}")
+            if summary['rejected']:
+                print(f"⚠️  {summary['started_at']} 无效记录 {summary['rejected']} 条")
+            if summary['quarantined']:
+                counts = ', '.join(f'{name} {count}' for name, count in summary['quarantined'].items())
+                held = f"，报告年度 {', '.join(map(str, summary['held']))} 保留上一次的数据" if summary['held'] else ''
+                print(f"⚠️  {summary['started_at']} 存在未确认的异常（{counts}）{held}，暂不发布快照")
+            wait = self.retry_seconds if summary['locked'] else min(self.seconds_until_next(), poll_seconds)
+            deadline = time.monotonic() + wait
+            while not self._stopping and time.monotonic() < deadline:
+                time.sleep(min(1.0, deadline - time.monotonic()))
+        print("⏹  调度器已停止")
+
+
+def load_sources(config_path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """读取来源配置（JSON: {"ctf": {"interval": 600, "scrape": true}, ...}），未指定时使用默认配置"""
+    if not config_path:
+        return DEFAULT_SOURCES
+    with open(config_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    """主函数"""
+    arg_parser = argparse.ArgumentParser(description='定时增量刷新数据并发布快照')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='SQLite数据库路径（写入端工作库）')
+    arg_parser.add_argument('--input-dir', default=os.path.join('data', 'raw'), help='原始抓取文件目录')
+    arg_parser.add_argument('--snapshot-dir', help='快照发布目录（应用设置 INSURANCE_SNAPSHOT_DIR 读取）')
+    arg_parser.add_argument('--config', help='来源配置JSON（各来源间隔、是否在线抓取）')
+    arg_parser.add_argument('--year', type=int, default=2024, help='不在年度子目录下的文件的报告年度')
+    arg_parser.add_argument('--jitter', type=float, default=0.1, help='间隔随机抖动比例')
+    arg_parser.add_argument('--state', default=os.path.join('data', 'cache', 'scheduler_state.json'),
+                            help='调度状态文件')
+    arg_parser.add_argument('--once', action='store_true', help='只运行一轮后退出')
+    arg_parser.add_argument('--force', action='store_true', help='忽略间隔，检查全部来源')
+    add_sink_arguments(arg_parser)
+    args = arg_parser.parse_args(argv)
+
+    scheduler = RefreshScheduler(args.db, args.input_dir, args.snapshot_dir, load_sources(args.config),
+                                 data_year=args.year, jitter=args.jitter, state_path=args.state,
+                                 reject_log=args.reject_log, quarantine=args.quarantine)
+    if args.once:
+        summary = scheduler.run_cycle(force=args.force)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return 1 if summary['errors'] or summary['locked'] or summary['quarantined'] else 0
+    scheduler.run_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+"""
+数据库快照发布
+Published Read-only Database Snapshots
+
+写入端（调度器）在每次重构完成后，用 SQLite 在线备份 API 把工作库复制为一个新的快照文件，
+再原子替换指针文件 CURRENT 指向它。应用通过指针读取最新快照：
+- 读者永远只看到完整、一致的数据库，不会读到导入进行到一半的状态
+- 发布只是一次 rename，应用无需重启，下一次请求即切换到新快照
+- 快照发布后不再修改，读者以 immutable=1 打开（见 db_connections.py）
+- 只保留最近 keep 个快照
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+from typing import Optional
+
+from db_connections import connect_reader
+
+
+POINTER_NAME = 'CURRENT'
+SNAPSHOT_PREFIX = 'insurance_data-'
+
+
+def current_snapshot(snapshot_dir: str) -> Optional[str]:
+    """指针文件指向的当前快照路径；尚未发布时返回 None"""
+    try:
+        with open(os.path.join(snapshot_dir, POINTER_NAME), encoding='utf-8') as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(snapshot_dir, name)
+    return path if name and os.path.exists(path) else None
+
+
+def publish_snapshot(db_path: str, snapshot_dir: str, keep: int = 3) -> str:
+    """把 db_path 复制为新快照并切换指针，返回快照路径"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.db"
+    path = os.path.join(snapshot_dir, name)
+    tmp_path = f'{path}.tmp'
+
+    source = connect_reader(db_path)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+        # 快照只读，统一使用回滚日志模式，读者无需 -wal/-shm 文件
+        target.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_path, path)
+
+    pointer_tmp = os.path.join(snapshot_dir, f'{POINTER_NAME}.tmp')
+    with open(pointer_tmp, 'w', encoding='utf-8') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(snapshot_dir, POINTER_NAME))
+
+    prune_snapshots(snapshot_dir, keep)
+    return path
+
+
+def prune_snapshots(snapshot_dir: str, keep: int = 3):
+    """删除较旧的快照（当前快照始终保留）"""
+    current = current_snapshot(snapshot_dir)
+    snapshots = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith('.db')
+    )
+    for name in snapshots[:-keep] if keep > 0 else snapshots:
+        path = os.path.join(snapshot_dir, name)
+        if path != current:
+            os.remove(path)
@@ -0,0 +1,37 @@
+"""
+测试公共夹具
+Shared pytest Fixtures
+
+模块都在仓库根目录（扁平布局），这里把根目录加入 sys.path；
+sample_db 在临时目录中由 data/raw 导入并重构出一个完整的数据库（整个测试会话共用，只读使用）。
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+RAW_DIR = os.path.join(ROOT, 'data', 'raw')
+
+
+@pytest.fixture(scope='session')
+def sample_db(tmp_path_factory):
+    """由 data/raw 导入 + 重构的数据库路径（紧凑格式缓存写在临时目录，不污染仓库）"""
+    from data_loader import ingest
+    from restructure_database import pivot
+
+    work_dir = tmp_path_factory.mktemp('sample_db')
+    db_path = str(work_dir / 'insurance_data.db')
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        ingest(db_path, input_dir=RAW_DIR, data_year=2024)
+        # 样例数据中有一条未确认的异常（首次构建只报告不暂缓），退出码为 2
+        assert pivot(db_path) != 1
+    finally:
+        os.chdir(cwd)
+    return db_path
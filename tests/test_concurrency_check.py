@@ -0,0 +1,57 @@
+from concurrency_check import check_report, run_concurrency_check
+
+
+def _report(baseline_p99=1.0, load_p99=1.2, solo_seconds=1.0, load_seconds=1.1, errors=()):
+    return {
+        'errors': list(errors),
+        'solo_load_seconds': solo_seconds,
+        'load_seconds': load_seconds,
+        'phases': {
+            'baseline': {'reads': 100, 'p50_ms': baseline_p99 / 2, 'p99_ms': baseline_p99},
+            'load': {'reads': 100, 'p50_ms': load_p99 / 2, 'p99_ms': load_p99},
+            'after': {'reads': 10, 'p50_ms': baseline_p99 / 2, 'p99_ms': baseline_p99},
+        },
+    }
+
+
+def test_run_concurrency_check_small_load(sample_db):
+    report = run_concurrency_check(sample_db, readers=2, rows=2000, batch_size=500,
+                                   baseline_seconds=0.3, think_ms=1.0)
+    assert report['journal_mode'] == 'wal'
+    assert report['rows'] == 2000
+    assert report['errors'] == []
+    assert report['solo_load_seconds'] > 0 and report['load_seconds'] > 0
+    for name in ('baseline', 'load', 'after'):
+        assert report['phases'][name]['reads'] > 0, name
+    # 阈值放宽：只验证流程和报告格式，不在测试机上做性能断言
+    assert check_report(report, max_ratio=50.0, slack_ms=100.0, max_writer_ratio=50.0) == []
+
+
+def test_check_report_passes_within_limits():
+    assert check_report(_report(), max_ratio=3.0, slack_ms=2.0, max_writer_ratio=3.0) == []
+
+
+def test_check_report_uses_slack_for_small_baselines():
+    # p99 0.1ms -> 1.5ms 超过 3 倍，但在 2ms 的绝对增量之内
+    report = _report(baseline_p99=0.1, load_p99=1.5)
+    assert check_report(report, max_ratio=3.0, slack_ms=2.0, max_writer_ratio=3.0) == []
+
+
+def test_check_report_flags_reader_latency():
+    problems = check_report(_report(baseline_p99=1.0, load_p99=10.0),
+                            max_ratio=3.0, slack_ms=2.0, max_writer_ratio=3.0)
+    assert len(problems) == 1 and 'p99' in problems[0]
+
+
+def test_check_report_flags_blocked_writer():
+    problems = check_report(_report(solo_seconds=1.0, load_seconds=5.0),
+                            max_ratio=3.0, slack_ms=2.0, max_writer_ratio=3.0)
+    assert len(problems) == 1 and '5.0 倍' in problems[0]
+
+
+def test_check_report_flags_read_errors_and_missing_samples():
+    report = _report(errors=['load: database is locked'])
+    report['phases']['load'] = {'reads': 0, 'p50_ms': None, 'p99_ms': None}
+    problems = check_report(report, max_ratio=3.0, slack_ms=2.0, max_writer_ratio=3.0)
+    assert problems[0] == '读取失败: load: database is locked'
+    assert problems[-1] == '没有采集到足够的读取样本'
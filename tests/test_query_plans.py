@@ -0,0 +1,50 @@
+import pytest
+
+from db_connections import connect_reader
+from query_plans import CANONICAL_QUERIES, check_query_plans, explain, plan_problems
+
+
+@pytest.fixture(scope='module')
+def plan_results(sample_db):
+    conn = connect_reader(sample_db)
+    try:
+        return {result['name']: result for result in check_query_plans(conn)}
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('query', CANONICAL_QUERIES, ids=[q['name'] for q in CANONICAL_QUERIES])
+def test_canonical_query_plan(plan_results, query):
+    result = plan_results[query['name']]
+    assert result['skipped'] is None, result['skipped']
+    assert result['plan'], '空的执行计划'
+    assert result['problems'] == [], '\n'.join(result['plan'])
+
+
+def test_canonical_queries_return_rows(sample_db):
+    """参数指向样例数据中真实存在的产品，执行计划检查的是实际会走的路径"""
+    conn = connect_reader(sample_db)
+    try:
+        for query in CANONICAL_QUERIES:
+            assert conn.execute(query['sql'], query['params']).fetchone() is not None, query['name']
+    finally:
+        conn.close()
+
+
+def test_full_scan_is_reported(sample_db):
+    conn = connect_reader(sample_db)
+    try:
+        plan = explain(conn, 'SELECT * FROM fulfillment_rates WHERE last_updated = ?', ('2024-01-01',))
+    finally:
+        conn.close()
+    assert any(problem.startswith('SCAN fulfillment_rates') for problem in plan_problems(plan))
+    assert plan_problems(plan, allow_scan=True) == []
+
+
+def test_temp_sort_is_reported(sample_db):
+    conn = connect_reader(sample_db)
+    try:
+        plan = explain(conn, 'SELECT * FROM product_rankings ORDER BY mean_rate')
+    finally:
+        conn.close()
+    assert any('TEMP B-TREE' in problem for problem in plan_problems(plan, allow_scan=True))
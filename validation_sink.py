@@ -0,0 +1,228 @@
+"""
+验证错误收集
+Streaming Validation Error Sink with Per-rule Aggregation
+
+DataValidator.validate_batch 只保留前10条错误详情。传入 ValidationErrorSink 后，
+每条被拒绝的记录连同未通过的规则逐条写出，内存占用与记录数无关：
+- JSONL（gzip 压缩，追加写入）：每行一条记录 {run_id, source_file, record_index, rules, errors, record}
+- SQLite 隔离表 validation_quarantine：按 batch_size 分批写入并提交
+- 运行中按规则、按来源文件累计计数，结束时写入 validation_rule_counts
+
+    python validation_sink.py --db insurance_data.db            # 最近一次运行按规则/文件的计数
+    python validation_sink.py --db insurance_data.db --rule range:fulfillment_rate --limit 20
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from db_connections import connect_reader, connect_writer
+
+
+class ValidationErrorSink:
+    """被拒绝记录的流式输出 + 按规则/文件计数"""
+
+    def __init__(self, jsonl_path: Optional[str] = None, db_path: Optional[str] = None,
+                 batch_size: int = 1000, run_id: Optional[str] = None):
+        self.run_id = run_id or datetime.now().strftime('%Y%m%dT%H%M%S-') + uuid.uuid4().hex[:6]
+        self.jsonl_path = jsonl_path
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.rejected = 0
+        self.by_rule: Dict[str, int] = {}
+        self.by_file: Dict[str, int] = {}
+        self.by_file_rule: Dict[str, Dict[str, int]] = {}
+        self._pending: List[Tuple] = []
+        self._jsonl = None
+        self._conn = None
+        if jsonl_path:
+            os.makedirs(os.path.dirname(jsonl_path) or '.', exist_ok=True)
+            self._jsonl = gzip.open(jsonl_path, 'at', encoding='utf-8')
+        if db_path:
+            self._conn = connect_writer(db_path)
+            self.create_tables(self._conn)
+
+    @staticmethod
+    def create_tables(conn: sqlite3.Connection):
+        """创建隔离表和规则计数表"""
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS validation_quarantine (
+                id INTEGER PRIMARY KEY,
+                run_id TEXT NOT NULL,
+                rejected_at TEXT NOT NULL,
+                source_file TEXT NOT NULL,
+                record_index INTEGER,
+                rules TEXT NOT NULL,        -- 逗号分隔的规则ID
+                errors TEXT NOT NULL,       -- JSON 数组
+                record TEXT NOT NULL        -- 原始记录 JSON
+            );
+            CREATE INDEX IF NOT EXISTS idx_quarantine_run ON validation_quarantine(run_id, source_file);
+
+            CREATE TABLE IF NOT EXISTS validation_rule_counts (
+                run_id TEXT NOT NULL,
+                source_file TEXT NOT NULL,
+                rule TEXT NOT NULL,
+                rejected INTEGER NOT NULL,
+                PRIMARY KEY (run_id, source_file, rule)
+            ) WITHOUT ROWID;
+        ''')
+
+    def add(self, record: Dict[str, Any], failures: List[Tuple[str, str]],
+            source: Optional[str] = None, record_index: Optional[int] = None):
+        """记录一条被拒绝的记录；failures 为 DataValidator.check_record 的结果"""
+        source = source or ''
+        rules = [rule for rule, _ in failures]
+        errors = [message for _, message in failures]
+        self.rejected += 1
+        self.by_file[source] = self.by_file.get(source, 0) + 1
+        file_counts = self.by_file_rule.setdefault(source, {})
+        for rule in rules:
+            self.by_rule[rule] = self.by_rule.get(rule, 0) + 1
+            file_counts[rule] = file_counts.get(rule, 0) + 1
+
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps({
+                'run_id': self.run_id, 'source_file': source, 'record_index': record_index,
+                'rules': rules, 'errors': errors, 'record': record,
+            }, ensure_ascii=False, default=str) + '\n')
+        if self._conn is not None:
+            self._pending.append((
+                self.run_id, datetime.now().isoformat(timespec='seconds'), source, record_index,
+                ','.join(rules), json.dumps(errors, ensure_ascii=False),
+                json.dumps(record, ensure_ascii=False, default=str),
+            ))
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """写出缓冲的隔离记录"""
+        if self._conn is not None and self._pending:
+            with self._conn:
+                self._conn.executemany('''
+                    INSERT INTO validation_quarantine
+                        (run_id, rejected_at, source_file, record_index, rules, errors, record)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', self._pending)
+            self._pending = []
+        if self._jsonl is not None:
+            self._jsonl.flush()
+
+    def close(self):
+        """写出剩余记录和本次运行的计数"""
+        self.flush()
+        if self._conn is not None:
+            with self._conn:
+                self._conn.executemany('''
+                    INSERT INTO validation_rule_counts (run_id, source_file, rule, rejected)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (run_id, source_file, rule) DO UPDATE SET rejected = excluded.rejected
+                ''', [(self.run_id, source, rule, count)
+                      for source, counts in self.by_file_rule.items() for rule, count in counts.items()])
+            self._conn.close()
+            self._conn = None
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self) -> Dict[str, Any]:
+        """本次运行的汇总：被拒绝记录数、按规则计数、按文件计数"""
+        return {
+            'run_id': self.run_id,
+            'rejected': self.rejected,
+            'by_rule': dict(sorted(self.by_rule.items(), key=lambda item: -item[1])),
+            'by_file': dict(self.by_file),
+        }
+
+
+def add_sink_arguments(arg_parser: argparse.ArgumentParser):
+    """导入命令共用的无效记录输出参数"""
+    arg_parser.add_argument('--reject-log', help='无效记录输出文件（gzip 压缩的 JSON Lines，追加写入）')
+    arg_parser.add_argument('--quarantine', action='store_true',
+                            help='无效记录写入数据库隔离表 validation_quarantine')
+
+
+def sink_from_args(args, db_path: str) -> Optional[ValidationErrorSink]:
+    """按 --reject-log / --quarantine 创建 sink，两者都未指定时返回 None"""
+    if not (args.reject_log or args.quarantine):
+        return None
+    return ValidationErrorSink(jsonl_path=args.reject_log, db_path=db_path if args.quarantine else None)
+
+
+def print_summary(summary: Dict[str, Any], top: int = 10):
+    """打印按规则、按文件的拒绝计数"""
+    print(f"  被拒绝记录: {summary['rejected']} 条 (run_id {summary['run_id']})")
+    if summary['by_rule']:
+        print("  按规则:")
+        for rule, count in list(summary['by_rule'].items())[:top]:
+            print(f"    - {rule}: {count}")
+    if summary['by_file']:
+        print("  按文件:")
+        for source, count in sorted(summary['by_file'].items(), key=lambda item: -item[1])[:top]:
+            print(f"    - {os.path.basename(source) or '(未知)'}: {count}")
+
+
+def load_run_counts(conn: sqlite3.Connection, run_id: Optional[str] = None) -> Dict[str, Any]:
+    """从 validation_rule_counts 读取某次运行（默认最近一次）的汇总"""
+    if run_id is None:
+        row = conn.execute('SELECT MAX(run_id) FROM validation_rule_counts').fetchone()
+        run_id = row[0]
+    by_rule = dict(conn.execute('''
+        SELECT rule, SUM(rejected) FROM validation_rule_counts WHERE run_id = ? GROUP BY rule
+    ''', (run_id,)).fetchall())
+    by_file = dict(conn.execute('''
+        SELECT source_file, COUNT(*) FROM validation_quarantine WHERE run_id = ? GROUP BY source_file
+    ''', (run_id,)).fetchall())
+    rejected = sum(by_file.values())
+    return {
+        'run_id': run_id,
+        'rejected': rejected,
+        'by_rule': dict(sorted(by_rule.items(), key=lambda item: -item[1])),
+        'by_file': by_file,
+    }
+
+
+def main(argv=None) -> int:
+    """主函数：查看隔离表"""
+    arg_parser = argparse.ArgumentParser(description='查看被拒绝记录的按规则/按文件统计')
+    arg_parser.add_argument('--db', default='insurance_data.db', help='包含 validation_quarantine 的数据库')
+    arg_parser.add_argument('--run-id', help='运行ID（默认最近一次）')
+    arg_parser.add_argument('--rule', help='列出未通过该规则的记录')
+    arg_parser.add_argument('--limit', type=int, default=20, help='--rule 时列出的记录数')
+    args = arg_parser.parse_args(argv)
+
+    conn = connect_reader(args.db)
+    try:
+        has_table = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'validation_rule_counts'").fetchone()
+        summary = load_run_counts(conn, args.run_id) if has_table else {'run_id': None}
+        if summary['run_id'] is None:
+            print("暂无验证错误记录")
+            return 0
+        print_summary(summary, top=50)
+        if args.rule:
+            print(f"\n  未通过 {args.rule} 的记录:")
+            for source, index, errors, record in conn.execute('''
+                SELECT source_file, record_index, errors, record FROM validation_quarantine
+                WHERE run_id = ? AND (',' || rules || ',') LIKE ?
+                ORDER BY id LIMIT ?
+            ''', (summary['run_id'], f'%,{args.rule},%', args.limit)):
+                print(f"    {os.path.basename(source)}#{index}: {', '.join(json.loads(errors))}")
+                print(f"      {record}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())